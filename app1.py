@@ -1,6 +1,7 @@
 import re
+import time
 import streamlit as st
-import requests
+import client1
 
 # Configurazione pagina
 st.set_page_config(
@@ -11,8 +12,66 @@ st.set_page_config(
 )
 
 
-# URL del backend
-BACKEND_URL = "http://127.0.0.1:8000"
+# Credenziali caricate per ogni pagina di ricerca
+PAGE_SIZE = 50
+
+@st.cache_resource
+def get_client() -> client1.BaseClient:
+    """Client condiviso da tutti i rerun: le connessioni al backend restano aperte"""
+    return client1.connect()
+
+api = get_client()
+
+# Cache delle letture: le chiavi contengono il token (quindi valgono solo per la sessione)
+# e la revisione del vault, che cambia a ogni scrittura. La revisione si chiede al backend
+# al più ogni REVISION_MAX_AGE secondi, o subito dopo un salvataggio, una modifica o
+# un'eliminazione fatti da qui: nel frattempo i rerun non fanno richieste.
+REVISION_MAX_AGE = 15
+# Secondi di permanenza in memoria di metadati e, più breve, delle password in chiaro
+CACHE_TTL = 300
+SECRET_TTL = 60
+
+def vault_revision(token: str) -> int:
+    """Revisione del vault, riletta con /changes/?limit=0 quando è troppo vecchia"""
+    if time.monotonic() - st.session_state.get('revision_checked_at', float("-inf")) > REVISION_MAX_AGE:
+        st.session_state.vault_revision = api.changes(token, limit=0).revision
+        st.session_state.revision_checked_at = time.monotonic()
+    return st.session_state.vault_revision
+
+def vault_changed():
+    """Dopo una scrittura: la prossima lettura chiede la nuova revisione (e le cache cambiano chiave)"""
+    st.session_state.revision_checked_at = float("-inf")
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=64, show_spinner=False)
+def cached_apps(token: str, revision: int) -> list[str]:
+    return api.list_apps(token).apps
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=64, show_spinner=False)
+def cached_page(token: str, revision: int, search_text: str, app_name: str = None,
+                cursor: str = None) -> client1.CredentialPage:
+    """Prima pagina (o quella dopo cursor) di una ricerca testuale o di un elenco per app"""
+    if search_text:
+        return api.search(token, search_text, PAGE_SIZE)
+    return api.list_credentials(token, app_name=app_name, limit=PAGE_SIZE, cursor=cursor)
+
+@st.cache_data(ttl=SECRET_TTL, max_entries=32, show_spinner=False)
+def cached_secret(token: str, revision: int, credential_id: int) -> str:
+    return api.get_secret(token, credential_id)
+
+def clear_cache():
+    """All'uscita dalla sessione: via subito le password in chiaro e la revisione"""
+    cached_secret.clear()
+    cached_page.clear()
+    st.session_state.pop('vault_revision', None)
+    vault_changed()
+
+def session_expired():
+    """Token scaduto per inattività: torniamo al login"""
+    st.error("❌ Sessione scaduta.")
+    st.session_state.authenticated = False
+    st.session_state.session_token = None
+    clear_cache()
+    st.rerun()
 
 def is_valid_password(password):
     """Valida la forza della password"""
@@ -27,16 +86,14 @@ def is_valid_password(password):
 # Inizializza sessione
 if 'authenticated' not in st.session_state:
     st.session_state.authenticated = False
-if 'master_password' not in st.session_state:
-    st.session_state.master_password = None
+if 'session_token' not in st.session_state:
+    st.session_state.session_token = None
 if 'is_initialized' not in st.session_state:
     try:
-        response = requests.get(f"{BACKEND_URL}/status/")
-        if response.status_code == 200:
-            st.session_state.is_initialized = response.json()["is_initialized"]
-        else:
-            st.session_state.is_initialized = False
-    except:
+        st.session_state.is_initialized = api.is_initialized()
+    except client1.ApiError:
+        st.session_state.is_initialized = False
+    except Exception:
         st.error("⚠️ Impossibile connettersi al backend. Assicurati che sia in esecuzione.")
         st.stop()
 
@@ -68,9 +125,9 @@ if not st.session_state.authenticated:
         with st.expander("🔍 Cercare Credenziali", expanded=False):
             st.markdown("""
             **Nella colonna destra:**
-            1. Seleziona "Tutte" o un'app specifica
+            1. Seleziona "Tutte" o un'app specifica, oppure scrivi parte di un nome
             2. Clicca su "🔎 Cerca"
-            3. Espandi i risultati per vedere le password
+            3. Espandi un risultato e clicca "👁️ Mostra password"
             """)
         
         with st.expander("🔄 Gestione Duplicati", expanded=False):
@@ -91,8 +148,8 @@ if not st.session_state.authenticated:
             - Almeno 1 carattere speciale
             
             **Crittografia:**
-            - Tutte le password sono crittografate con AES-128
-            - La Master Password è hashata con PBKDF2
+            - Tutte le password sono crittografate con AES-256-GCM (o ChaCha20-Poly1305)
+            - La Master Password è hashata con Argon2id (o scrypt)
             
             ⚠️ **Non perdere la Master Password!** Non è recuperabile.
             """)
@@ -129,18 +186,18 @@ if not st.session_state.authenticated:
                             st.error(f"❌ {messaggio}")
                         else:
                             try:
-                                response = requests.post(
-                                    f"{BACKEND_URL}/initialize/",
-                                    json={"master_password": new_master_pw}
-                                )
-                                if response.status_code == 200:
-                                    st.success("✅ Master Password creata con successo!")
-                                    st.session_state.is_initialized = True
-                                    st.session_state.master_password = new_master_pw
+                                api.initialize(new_master_pw)
+                                st.success("✅ Master Password creata con successo!")
+                                st.session_state.is_initialized = True
+                                # Apriamo subito una sessione con la nuova master password
+                                try:
+                                    st.session_state.session_token = api.login(new_master_pw)
                                     st.session_state.authenticated = True
-                                    st.rerun()
-                                else:
-                                    st.error(f"❌ {response.json().get('detail', 'Errore sconosciuto')}")
+                                except client1.ApiError:
+                                    pass
+                                st.rerun()
+                            except client1.ApiError as e:
+                                st.error(f"❌ {e.detail}")
                             except Exception as e:
                                 st.error(f"⚠️ Errore: {str(e)}")
         else:
@@ -156,15 +213,13 @@ if not st.session_state.authenticated:
                 
                 if submit:
                     try:
-                        response = requests.post(
-                            f"{BACKEND_URL}/verify/",
-                            json={"master_password": master_pw}
-                        )
-                        if response.status_code == 200:
-                            st.success("✅ Accesso effettuato!")
-                            st.session_state.authenticated = True
-                            st.session_state.master_password = master_pw
-                            st.rerun()
+                        st.session_state.session_token = api.login(master_pw)
+                        st.session_state.authenticated = True
+                        st.success("✅ Accesso effettuato!")
+                        st.rerun()
+                    except client1.ApiError as e:
+                        if e.status_code == 429:
+                            st.error(f"⏳ {e.detail}")
                         else:
                             st.error("❌ Master Password errata!")
                     except Exception as e:
@@ -198,9 +253,9 @@ else:
         with st.expander("🔍 Cercare Credenziali", expanded=False):
             st.markdown("""
             **Nella colonna destra:**
-            1. Seleziona "Tutte" o un'app specifica
+            1. Seleziona "Tutte" o un'app specifica, oppure scrivi parte di un nome
             2. Clicca su "🔎 Cerca"
-            3. Espandi i risultati per vedere le password
+            3. Espandi un risultato e clicca "👁️ Mostra password"
             """)
         
         with st.expander("🔄 Gestione Duplicati", expanded=False):
@@ -221,8 +276,8 @@ else:
             - Almeno 1 carattere speciale
             
             **Crittografia:**
-            - Tutte le password sono crittografate con AES-128
-            - La Master Password è hashata con PBKDF2
+            - Tutte le password sono crittografate con AES-256-GCM (o ChaCha20-Poly1305)
+            - La Master Password è hashata con Argon2id (o scrypt)
             
             ⚠️ **Non perdere la Master Password!** Non è recuperabile.
             """)
@@ -233,8 +288,13 @@ else:
     col1, col2, col3 = st.columns([2, 3, 1])
     with col3:
         if st.button("🚪 Logout", use_container_width=True):
+            try:
+                api.logout(st.session_state.session_token)
+            except Exception:
+                pass
             st.session_state.authenticated = False
-            st.session_state.master_password = None
+            st.session_state.session_token = None
+            clear_cache()
             st.rerun()
     
     st.markdown("<br>", unsafe_allow_html=True)
@@ -277,97 +337,39 @@ else:
                 if not app_name or not username or not created_by:
                     st.error("❌ Compila tutti i campi obbligatori!")
                 else:
-                    # VALIDAZIONE PASSWORD SE FORNITA
-                    if custom_password:
-                        valida, messaggio = is_valid_password(custom_password)
-                        if not valida:
-                            st.error(f"❌ {messaggio}")
-                        else:
-                            # Password valida, procedi
-                            try:
-                                headers = {"master-password": st.session_state.master_password}
-                                payload = {
-                                    "app_name": app_name,
-                                    "username": username,
-                                    "created_by": created_by,
-                                    "password": custom_password
-                                }
-                                
-                                response = requests.post(
-                                    f"{BACKEND_URL}/credentials/",
-                                    headers=headers,
-                                    json=payload
-                                )
-                                
-                                if response.status_code == 200:
-                                    result = response.json()
-                                    
-                                    if result.get("message") == "exists":
-                                        # SALVA INFO DUPLICATO NEL SESSION_STATE
-                                        st.session_state.duplicate_detected = {
-                                            "existing_id": result['existing_id'],
-                                            "app_name": result['app_name'],
-                                            "username": result['username'],
-                                            "password": custom_password
-                                        }
-                                        st.rerun()
-                                    
-                                    else:
-                                        st.success("✅ Credenziale salvata con successo!")
-                                        st.session_state.duplicate_detected = None
-                                        st.rerun()
-                                
-                                elif response.status_code == 401:
-                                    st.error("❌ Sessione scaduta.")
-                                    st.session_state.authenticated = False
-                                    st.rerun()
-                                else:
-                                    st.error(f"❌ Errore: {response.json().get('detail', 'Errore sconosciuto')}")
-                            except Exception as e:
-                                st.error(f"⚠️ Errore: {str(e)}")
+                    # VALIDAZIONE PASSWORD SE FORNITA (se vuota la genera il backend)
+                    valida, messaggio = is_valid_password(custom_password) if custom_password else (True, "")
+                    if not valida:
+                        st.error(f"❌ {messaggio}")
                     else:
-                        # Nessuna password fornita, genera automaticamente
                         try:
-                            headers = {"master-password": st.session_state.master_password}
-                            payload = {
-                                "app_name": app_name,
-                                "username": username,
-                                "created_by": created_by
-                            }
-                            
-                            response = requests.post(
-                                f"{BACKEND_URL}/credentials/",
-                                headers=headers,
-                                json=payload
+                            result = api.create_credential(
+                                st.session_state.session_token, app_name, username, created_by,
+                                custom_password or None
                             )
+                            vault_changed()
                             
-                            if response.status_code == 200:
-                                result = response.json()
-                                
-                                if result.get("message") == "exists":
-                                    # SALVA INFO DUPLICATO NEL SESSION_STATE (password autogenerata)
-                                    st.session_state.duplicate_detected = {
-                                        "existing_id": result['existing_id'],
-                                        "app_name": result['app_name'],
-                                        "username": result['username'],
-                                        "password": None  # None = genera automaticamente
-                                    }
-                                    st.rerun()
-                                
-                                else:
-                                    st.success("✅ Credenziale salvata!")
-                                    if result.get("generated_password"):
-                                        st.code(result['generated_password'], language=None)
-                                        st.warning("⚠️ Copia questa password ora!")
-                                    st.session_state.duplicate_detected = None
-                                    st.rerun()
-                            
-                            elif response.status_code == 401:
-                                st.error("❌ Sessione scaduta.")
-                                st.session_state.authenticated = False
+                            if result.get("message") == "exists":
+                                # SALVA INFO DUPLICATO NEL SESSION_STATE (None = genera automaticamente)
+                                st.session_state.duplicate_detected = {
+                                    "existing_id": result['existing_id'],
+                                    "app_name": result['app_name'],
+                                    "username": result['username'],
+                                    "password": custom_password or None
+                                }
                                 st.rerun()
+                            
                             else:
-                                st.error(f"❌ Errore: {response.json().get('detail', 'Errore')}")
+                                st.success("✅ Credenziale salvata con successo!")
+                                if result.get("generated_password"):
+                                    st.code(result['generated_password'], language=None)
+                                    st.warning("⚠️ Copia questa password ora!")
+                                st.session_state.duplicate_detected = None
+                                st.rerun()
+                        except client1.SessionExpired:
+                            session_expired()
+                        except client1.ApiError as e:
+                            st.error(f"❌ Errore: {e.detail}")
                         except Exception as e:
                             st.error(f"⚠️ Errore: {str(e)}")
         
@@ -381,25 +383,20 @@ else:
             with col_update:
                 if st.button("🔄 Aggiorna Password", use_container_width=True, type="primary"):
                     try:
-                        headers = {"master-password": st.session_state.master_password}
-                        update_payload = {"password": dup['password']} if dup['password'] else {}
-                        
-                        update_response = requests.put(
-                            f"{BACKEND_URL}/credentials/{dup['existing_id']}",
-                            headers=headers,
-                            json=update_payload
+                        update_result = api.update_credential(
+                            st.session_state.session_token, dup['existing_id'], dup['password']
                         )
-                        
-                        if update_response.status_code == 200:
-                            update_result = update_response.json()
-                            st.success("✅ Password aggiornata con successo!")
-                            if update_result.get("generated_password"):
-                                st.code(update_result['generated_password'], language=None)
-                                st.warning("⚠️ Copia questa password ora!")
-                            st.session_state.duplicate_detected = None
-                            st.rerun()
-                        else:
-                            st.error("❌ Errore nell'aggiornamento")
+                        vault_changed()
+                        st.success("✅ Password aggiornata con successo!")
+                        if update_result.get("generated_password"):
+                            st.code(update_result['generated_password'], language=None)
+                            st.warning("⚠️ Copia questa password ora!")
+                        st.session_state.duplicate_detected = None
+                        st.rerun()
+                    except client1.SessionExpired:
+                        session_expired()
+                    except client1.ApiError:
+                        st.error("❌ Errore nell'aggiornamento")
                     except Exception as e:
                         st.error(f"⚠️ Errore: {str(e)}")
             
@@ -417,86 +414,109 @@ else:
         # Inizializza lo stato per i risultati se non esiste
         if 'search_results' not in st.session_state:
             st.session_state.search_results = None
+        # Parametri e cursore della ricerca in corso (per "Carica altre")
+        if 'search_params' not in st.session_state:
+            st.session_state.search_params = {}
+        if 'search_cursor' not in st.session_state:
+            st.session_state.search_cursor = None
 
         try:
-            # Header per la richiesta iniziale delle app
-            headers = {"master-password": st.session_state.master_password}
-            apps_response = requests.get(f"{BACKEND_URL}/apps/", headers=headers)
+            token = st.session_state.session_token
+            revision = vault_revision(token)
+            app_list = cached_apps(token, revision)
             
-            if apps_response.status_code == 200:
-                apps_data = apps_response.json()
-                app_list = apps_data.get("apps", [])
-                
-                if app_list:
-                    # --- FORM DI RICERCA ---
-                    with st.form("search_form"):
-                        selected_app = st.selectbox(
-                            "📱 Seleziona Applicazione",
-                            options=["Tutte"] + app_list,
-                            help="Filtra per applicazione"
-                        )
-                        search_btn = st.form_submit_button("🔎 Cerca", use_container_width=True)
-                        st.markdown("<div class='footer'>🔒 Tutte le password sono crittografate end-to-end con AES-128</div>", unsafe_allow_html=True)
+            if app_list:
+                # --- FORM DI RICERCA ---
+                with st.form("search_form"):
+                    selected_app = st.selectbox(
+                        "📱 Seleziona Applicazione",
+                        options=["Tutte"] + app_list,
+                        help="Filtra per applicazione"
+                    )
+                    search_text = st.text_input(
+                        "🔤 Testo (opzionale)",
+                        placeholder="Parte del nome app, username o autore...",
+                        help="Trova anche risultati simili in caso di errori di battitura"
+                    )
+                    search_btn = st.form_submit_button("🔎 Cerca", use_container_width=True)
+                    st.markdown("<div class='footer'>🔒 Tutte le password sono crittografate end-to-end con AES-256-GCM o ChaCha20-Poly1305</div>", unsafe_allow_html=True)
 
-                    # --- GESTIONE CLICK "CERCA" ---
-                    if search_btn:
-                        search_params = {}
-                        if selected_app != "Tutte":
-                            search_params["app_name"] = selected_app
-                        
-                        search_response = requests.get(
-                            f"{BACKEND_URL}/credentials/",
-                            headers=headers,
-                            params=search_params
-                        )
-                        
-                        if search_response.status_code == 200:
-                            # Salviamo i risultati nel session_state
-                            st.session_state.search_results = search_response.json()
-                            if not st.session_state.search_results:
-                                if selected_app == "Tutte":
-                                    st.info("📭 Nessuna credenziale salvata.")
-                                else:
-                                    st.info(f"📭 Nessuna credenziale per {selected_app}.")
-                        elif search_response.status_code == 401:
-                            st.error("❌ Sessione scaduta.")
-                            st.session_state.authenticated = False
+                # --- GESTIONE CLICK "CERCA" ---
+                if search_btn:
+                    search_params = {}
+                    if selected_app != "Tutte":
+                        search_params["app_name"] = selected_app
+                    
+                    # Ricerca testuale (full-text + fuzzy) sui metadati, oppure solo la prima
+                    # pagina dell'elenco: le altre si caricano su richiesta
+                    page = cached_page(token, revision, search_text.strip(), **search_params)
+                    
+                    results = page.items
+                    if search_text.strip() and selected_app != "Tutte":
+                        results = [c for c in results if c['app_name'] == selected_app]
+                    # Salviamo i risultati nel session_state
+                    st.session_state.search_results = results
+                    st.session_state.search_params = search_params
+                    st.session_state.search_cursor = page.next_cursor
+                    if not st.session_state.search_results:
+                        if search_text.strip():
+                            st.info(f"📭 Nessun risultato per \"{search_text}\".")
+                        elif selected_app == "Tutte":
+                            st.info("📭 Nessuna credenziale salvata.")
+                        else:
+                            st.info(f"📭 Nessuna credenziale per {selected_app}.")
+
+                # --- VISUALIZZAZIONE ED ELIMINAZIONE ---
+                if st.session_state.search_results:
+                    altre = " (altre disponibili)" if st.session_state.search_cursor else ""
+                    st.success(f"✅ Trovate {len(st.session_state.search_results)} credenziali{altre}")
+                    
+                    # Iteriamo sui risultati
+                    for i, cred in enumerate(st.session_state.search_results):
+                        with st.expander(f"🔐 {cred['app_name']} - {cred['username']}", expanded=False):
+                            st.markdown(f"**👤 Username:** `{cred['username']}`")
+                            st.markdown(f"**🔑 Password:**")
+                            # La password viene decriptata solo su richiesta e resta in cache al più SECRET_TTL secondi
+                            if st.button("👁️ Mostra password", key=f"reveal_{cred['id']}"):
+                                try:
+                                    st.code(cached_secret(token, revision, cred['id']), language=None)
+                                except client1.SessionExpired:
+                                    raise
+                                except client1.ApiError as e:
+                                    st.error(f"❌ Errore: {e.detail}")
+                            st.markdown(f"**✍️ Creato da:** {cred['created_by']}")
+                            
+                            # --- NUOVO BLOCCO ELIMINAZIONE ---
+                            if st.button("🗑️ Elimina", key=f"delete_{cred['id']}"):
+                                try:
+                                    api.delete_credential(token, cred['id'])
+                                    vault_changed()
+                                    st.success("✅ Eliminata correttamente!")
+                                    # Rimuoviamo dalla cache locale filtrando via l'ID eliminato
+                                    st.session_state.search_results = [c for c in st.session_state.search_results if c['id'] != cred['id']]
+                                    st.rerun()
+                                except client1.SessionExpired:
+                                    raise
+                                except client1.ApiError as e:
+                                    # Mostriamo l'errore esatto che ci dà il server
+                                    st.error(f"❌ Errore: {e.detail}")
+
+                    # --- PAGINA SUCCESSIVA ---
+                    if st.session_state.search_cursor:
+                        if st.button("⬇️ Carica altre", use_container_width=True):
+                            page = cached_page(
+                                token, revision, "",
+                                cursor=st.session_state.search_cursor,
+                                **st.session_state.search_params
+                            )
+                            st.session_state.search_results += page.items
+                            st.session_state.search_cursor = page.next_cursor
                             st.rerun()
 
-                    # --- VISUALIZZAZIONE ED ELIMINAZIONE ---
-                    if st.session_state.search_results:
-                        st.success(f"✅ Trovate {len(st.session_state.search_results)} credenziali")
-                        
-                        # Iteriamo sui risultati
-                        for i, cred in enumerate(st.session_state.search_results):
-                            with st.expander(f"🔐 {cred['app_name']} - {cred['username']}", expanded=False):
-                                st.markdown(f"**👤 Username:** `{cred['username']}`")
-                                st.markdown(f"**🔑 Password:**")
-                                st.code(cred['encrypted_password'], language=None)
-                                st.markdown(f"**✍️ Creato da:** {cred['created_by']}")
-                                
-                                # --- NUOVO BLOCCO ELIMINAZIONE ---
-                                if st.button("🗑️ Elimina", key=f"delete_{cred['id']}"):
-                                    # Usiamo lo stesso nome header che si aspetta FastAPI: "master-password"
-                                    headers = {"master-password": st.session_state.master_password}
-                                    
-                                    delete_response = requests.delete(
-                                        f"{BACKEND_URL}/credentials/{cred['id']}",
-                                        headers=headers
-                                    )
-                                    
-                                    if delete_response.status_code == 200:
-                                        st.success("✅ Eliminata correttamente!")
-                                        # Rimuoviamo dalla cache locale filtrando via l'ID eliminato
-                                        st.session_state.search_results = [c for c in st.session_state.search_results if c['id'] != cred['id']]
-                                        st.rerun()
-                                    else:
-                                        # Mostriamo l'errore esatto che ci dà il server
-                                        errore_server = delete_response.json().get('detail', 'Errore sconosciuto')
-                                        st.error(f"❌ Errore: {errore_server}")
+            else:
+                st.info("📭 Nessuna applicazione salvata. Aggiungi la prima credenziale!")
 
-                else:
-                    st.info("📭 Nessuna applicazione salvata. Aggiungi la prima credenziale!")
-        
+        except client1.SessionExpired:
+            session_expired()
         except Exception as e:
-            st.error(f"⚠️ Errore: {str(e)}")
\ No newline at end of file
+            st.error(f"⚠️ Errore: {str(e)}")
@@ -0,0 +1,82 @@
+import bisect
+import hashlib
+import json
+import threading
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+import database1
+
+class AppIndex:
+    """Elenco ordinato delle app con il numero di credenziali per ciascuna.
+
+    Viene caricato dal database alla prima richiesta e poi aggiornato in place
+    dagli endpoint di scrittura (add/remove), senza rifare la query. Ogni snapshot()
+    legge VaultRevision, che i trigger incrementano a ogni scrittura: se non è quella
+    attesa (scritture di altri processi o di altri percorsi) l'elenco viene riletto.
+    L'ETag dipende dalla revisione, quindi cambia con qualsiasi scrittura.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._apps = None
+        self._counts = None
+        self._revision = None
+        self._etag = None
+
+    def snapshot(self, db: Session) -> tuple[list[str], dict, str]:
+        """Restituisce (app ordinate, conteggi, ETag), caricandoli se necessario"""
+        revision = db.query(database1.VaultRevision.revision).filter_by(id=1).scalar()
+        with self._lock:
+            if self._counts is None or revision != self._revision:
+                self._load(db, revision)
+            if self._etag is None:
+                payload = json.dumps([self._revision, self._apps, self._counts], sort_keys=True).encode()
+                self._etag = '"' + hashlib.sha256(payload).hexdigest()[:32] + '"'
+            return list(self._apps), dict(self._counts), self._etag
+
+    def add(self, app_name: str):
+        """Da chiamare dopo il commit di una nuova credenziale (il trigger ha
+        incrementato la revisione di uno)"""
+        with self._lock:
+            if self._counts is None:
+                return
+            self._revision += 1
+            if app_name not in self._counts:
+                bisect.insort(self._apps, app_name)
+                self._counts[app_name] = 0
+            self._counts[app_name] += 1
+            self._etag = None
+
+    def remove(self, app_name: str):
+        """Da chiamare dopo il commit dell'eliminazione di una credenziale"""
+        with self._lock:
+            if self._counts is None:
+                return
+            self._revision += 1
+            if app_name not in self._counts:
+                self._etag = None
+                return
+            self._counts[app_name] -= 1
+            if self._counts[app_name] <= 0:
+                del self._counts[app_name]
+                self._apps.pop(bisect.bisect_left(self._apps, app_name))
+            self._etag = None
+
+    def invalidate(self):
+        """Forza la rilettura dal database alla prossima richiesta"""
+        with self._lock:
+            self._apps = None
+            self._counts = None
+            self._revision = None
+            self._etag = None
+
+    def _load(self, db: Session, revision: int):
+        rows = (
+            db.query(database1.Credential.app_name, func.count(database1.Credential.id))
+            .group_by(database1.Credential.app_name)
+            .all()
+        )
+        self._counts = {app_name: count for app_name, count in rows if app_name is not None}
+        self._apps = sorted(self._counts)
+        self._revision = revision
+        self._etag = None
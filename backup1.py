@@ -0,0 +1,200 @@
+"""Backup cifrato del vault in streaming (memoria costante anche con centinaia di migliaia di righe)
+
+Formato del file:
+    intestazione: MAGIC | versione (1 byte) | salt (16 byte) | prefisso nonce (7 byte)
+    blocchi:      lunghezza (4 byte) | AES-256-GCM(righe NDJSON)
+
+Ogni blocco ha come nonce prefisso + contatore (4 byte) + flag "ultimo blocco"
+e autentica l'intestazione come dati associati: blocchi riordinati, rimossi o
+un file troncato vengono riconosciuti. La chiave deriva da una passphrase di
+backup scelta all'export, indipendente dalla master password, così il file si
+può reimportare in un vault con master password diversa (importer1 --format pmbackup).
+
+Uso da terminale:
+    python backup1.py vault.pmbackup
+"""
+import argparse
+import base64
+import getpass
+import json
+import os
+import struct
+import sys
+from typing import BinaryIO, Iterator, Optional
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from sqlalchemy import select
+import database1
+import security1
+
+MAGIC = b"PMBAK\x00"
+VERSION = 1
+HEADER_SIZE = len(MAGIC) + 1 + 16 + 7
+# Righe per blocco cifrato (un blocco alla volta in memoria)
+FRAME_ROWS = 500
+# Limite di sicurezza in lettura per la dimensione di un blocco
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+
+def _archive_key(passphrase: str, salt: bytes) -> bytes:
+    """Chiave AES-256 (32 byte grezzi) derivata dalla passphrase di backup"""
+    return base64.urlsafe_b64decode(security1.derive_key(passphrase, salt))
+
+def _nonce(prefix: bytes, counter: int, last: bool) -> bytes:
+    return prefix + struct.pack(">IB", counter, 1 if last else 0)
+
+class ArchiveWriter:
+    """Scrive i blocchi cifrati uno alla volta"""
+
+    def __init__(self, passphrase: str):
+        salt = os.urandom(16)
+        self._prefix = os.urandom(7)
+        self.header = MAGIC + bytes([VERSION]) + salt + self._prefix
+        self._aead = AESGCM(_archive_key(passphrase, salt))
+        self._counter = 0
+
+    def frame(self, rows: list, last: bool = False) -> bytes:
+        plaintext = "".join(json.dumps(row) + "\n" for row in rows).encode()
+        ciphertext = self._aead.encrypt(_nonce(self._prefix, self._counter, last), plaintext, self.header)
+        self._counter += 1
+        return struct.pack(">I", len(ciphertext)) + ciphertext
+
+def iter_export(key: bytes, passphrase: str, frame_rows: int = FRAME_ROWS) -> Iterator[bytes]:
+    """Genera il file di backup a pezzi: intestazione e poi un blocco cifrato per volta.
+
+    Tutte le righe sono lette da un'unica SELECT scorsa a blocchi (yield_per):
+    SQLite la esegue su un'istantanea coerente e, con il journal WAL, senza
+    bloccare chi scrive nel frattempo.
+    """
+    writer = ArchiveWriter(passphrase)
+    yield writer.header
+    db = database1.SessionLocal()
+    try:
+        query = select(database1.Credential).order_by(database1.Credential.id)
+        result = db.execute(query.execution_options(yield_per=frame_rows)).scalars()
+        pending = None
+        for batch in result.partitions():
+            passwords = security1.decrypt_passwords([item.encrypted_password for item in batch], key)
+            rows = [
+                {
+                    "app_name": item.app_name,
+                    "username": item.username,
+                    "created_by": item.created_by,
+                    "password": password
+                }
+                for item, password in zip(batch, passwords)
+            ]
+            # Il blocco precedente si scrive solo ora: serve sapere quale sarà l'ultimo
+            if pending is not None:
+                yield writer.frame(pending)
+            pending = rows
+        yield writer.frame(pending or [], last=True)
+    finally:
+        db.close()
+
+def export_vault(out: BinaryIO, key: bytes, passphrase: str) -> int:
+    """Scrive il backup su file e restituisce i byte scritti"""
+    written = 0
+    for chunk in iter_export(key, passphrase):
+        out.write(chunk)
+        written += len(chunk)
+    return written
+
+def _read_exact(stream: BinaryIO, size: int) -> bytes:
+    data = stream.read(size)
+    if len(data) != size:
+        raise ValueError("Backup troncato")
+    return data
+
+def _open_archive(stream: BinaryIO, passphrase: str) -> tuple:
+    header = stream.read(HEADER_SIZE)
+    if len(header) != HEADER_SIZE or not header.startswith(MAGIC):
+        raise ValueError("Non è un file di backup del Password Manager")
+    if header[len(MAGIC)] != VERSION:
+        raise ValueError(f"Versione di backup non supportata: {header[len(MAGIC)]}")
+    salt = header[len(MAGIC) + 1:len(MAGIC) + 17]
+    prefix = header[len(MAGIC) + 17:]
+    return header, prefix, AESGCM(_archive_key(passphrase, salt))
+
+def _decrypt_frames(stream: BinaryIO, header: bytes, prefix: bytes, aead: AESGCM) -> Iterator[bytes]:
+    counter = 0
+    while True:
+        (size,) = struct.unpack(">I", _read_exact(stream, 4))
+        if size > MAX_FRAME_SIZE:
+            raise ValueError("Backup corrotto")
+        ciphertext = _read_exact(stream, size)
+        # Proviamo prima come blocco intermedio, poi come ultimo blocco
+        for last in (False, True):
+            try:
+                plaintext = aead.decrypt(_nonce(prefix, counter, last), ciphertext, header)
+                break
+            except InvalidTag:
+                continue
+        else:
+            raise ValueError("Passphrase errata o backup corrotto")
+        yield plaintext
+        if last:
+            return
+        counter += 1
+
+def read_archive(stream: BinaryIO, passphrase: str, verify_first: bool = False) -> Iterator[dict]:
+    """Legge un backup un blocco alla volta e restituisce le righe in chiaro.
+
+    Con verify_first (serve uno stream con seek) tutti i blocchi vengono autenticati
+    prima di restituire la prima riga: di un file troncato o alterato non si legge nulla.
+    """
+    header, prefix, aead = _open_archive(stream, passphrase)
+    if verify_first:
+        start = stream.tell()
+        for _ in _decrypt_frames(stream, header, prefix, aead):
+            pass
+        stream.seek(start)
+    for plaintext in _decrypt_frames(stream, header, prefix, aead):
+        for line in plaintext.decode().splitlines():
+            yield json.loads(line)
+
+def main(argv: Optional[list] = None) -> int:
+    import vault1
+
+    parser = argparse.ArgumentParser(description="Esporta il vault in un backup cifrato")
+    parser.add_argument("file", help="File di destinazione (usa - per lo standard output)")
+    parser.add_argument("--master-password-env", help="Variabile d'ambiente con la master password")
+    parser.add_argument("--passphrase-env", help="Variabile d'ambiente con la passphrase del backup")
+    args = parser.parse_args(argv)
+
+    if args.master_password_env:
+        master_password = os.environ[args.master_password_env]
+    else:
+        master_password = getpass.getpass("🔑 Master Password: ")
+    if args.passphrase_env:
+        passphrase = os.environ[args.passphrase_env]
+    else:
+        passphrase = getpass.getpass("🔒 Passphrase del backup: ")
+        if passphrase != getpass.getpass("🔒 Conferma passphrase: "):
+            print("❌ Le passphrase non coincidono", file=sys.stderr)
+            return 1
+
+    database1.init_db()
+    db = database1.SessionLocal()
+    try:
+        key = vault1.unlock(db, master_password)
+    finally:
+        db.close()
+    if key is None:
+        print("❌ Master password errata", file=sys.stderr)
+        return 1
+
+    if args.file == "-":
+        written = export_vault(sys.stdout.buffer, key, passphrase)
+    else:
+        # Scrittura su file temporaneo e rinomina: un backup interrotto non sovrascrive il precedente
+        tmp_path = args.file + ".tmp"
+        with open(tmp_path, "wb") as out:
+            written = export_vault(out, key, passphrase)
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp_path, args.file)
+    print(f"✅ Backup completato ({written:,} byte)", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1 @@
+"""Benchmark del Password Manager (eseguibili con python -m benchmarks.<nome>)"""
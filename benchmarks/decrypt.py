@@ -0,0 +1,32 @@
+"""Throughput della decrittazione: record per record vs security1.decrypt_passwords
+
+Uso: python -m benchmarks.decrypt [numero_righe ...]
+"""
+import sys
+import time
+from cryptography.fernet import Fernet
+import security1
+
+ROW_COUNTS = [10, 100, 1000, 10000, 50000]
+
+def _measure(fn, *args) -> float:
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+def _one_by_one(tokens: list, key: bytes):
+    return [security1.decrypt_password(token, key) for token in tokens]
+
+def run(row_counts: list[int]):
+    key = Fernet.generate_key()
+    print(f"{'righe':>8} | {'serie (righe/s)':>16} | {'blocco (righe/s)':>16} | {'speedup':>7}")
+    print("-" * 57)
+    for n in row_counts:
+        tokens = [security1.encrypt_password(security1.generate_strong_password(), key) for _ in range(n)]
+        serial = _measure(_one_by_one, tokens, key)
+        batch = _measure(security1.decrypt_passwords, tokens, key)
+        print(f"{n:>8} | {n / serial:>16,.0f} | {n / batch:>16,.0f} | {serial / batch:>6.2f}x")
+
+if __name__ == "__main__":
+    counts = [int(arg) for arg in sys.argv[1:]] or ROW_COUNTS
+    run(counts)
@@ -0,0 +1,89 @@
+"""Vault sintetico per i benchmark: N credenziali distribuite su M app
+
+Le righe passano da importer1.import_credentials (cifratura in blocco, un
+commit ogni blocco), quindi il vault è identico a uno reale e si apre con la
+master password indicata. Con lo stesso --seed si ottengono sempre le stesse
+app, gli stessi username e le stesse password.
+
+Uso: python -m benchmarks.generate --db bench.db --rows 10000 --apps 200
+(senza --db scrive nel passwords.db dell'applicazione, o in PASSWORD_MANAGER_DB)
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import time
+from typing import TYPE_CHECKING, Iterator, Optional
+
+if TYPE_CHECKING:
+    import importer1
+
+ROWS = 10000
+APPS = 200
+SEED = 42
+MASTER_PASSWORD = "Benchmark!2024"
+_ALPHABET = string.ascii_letters + string.digits + string.punctuation
+
+def synthetic_rows(rows: int, apps: int, seed: int = SEED) -> Iterator["importer1.ImportRow"]:
+    """Righe deterministiche: l'app segue una distribuzione sbilanciata, come nei vault veri"""
+    import importer1
+    rng = random.Random(seed)
+    app_names = [f"App{i:04d}" for i in range(apps)]
+    # Poche app con molte credenziali e molte con poche
+    weights = [1 / (rank + 1) for rank in range(apps)]
+    for line in range(1, rows + 1):
+        yield importer1.ImportRow(
+            line=line,
+            app_name=rng.choices(app_names, weights)[0],
+            username=f"user{line:07d}@example.com",
+            password="".join(rng.choices(_ALPHABET, k=rng.randint(12, 24)))
+        )
+
+def populate(rows: int, apps: int, master_password: str = MASTER_PASSWORD, seed: int = SEED) -> dict:
+    """Inizializza il vault se serve e lo riempie. Il database è quello di database1"""
+    import database1
+    import importer1
+    import security1
+    import vault1
+
+    database1.init_db()
+    db = database1.SessionLocal()
+    try:
+        if db.query(database1.MasterPassword).first() is None:
+            db.add(database1.MasterPassword(
+                password_hash=security1.hash_master_password(master_password, vault1.kdf_policy(db)),
+                is_initialized=True
+            ))
+            vault1.create_data_key(db, master_password)
+            db.commit()
+        key = vault1.unlock(db, master_password)
+        if key is None:
+            raise RuntimeError("Il vault esiste già con un'altra master password")
+        started = time.perf_counter()
+        report = importer1.import_credentials(db, synthetic_rows(rows, apps, seed), key, created_by="Bench")
+        elapsed = time.perf_counter() - started
+    finally:
+        db.close()
+    return {"path": database1.db_path, "imported": report.imported, "skipped": report.skipped,
+            "seconds": elapsed}
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Riempie un vault con credenziali sintetiche")
+    parser.add_argument("--db", help="percorso del database (creato se non esiste)")
+    parser.add_argument("--rows", type=int, default=ROWS, help="credenziali da generare")
+    parser.add_argument("--apps", type=int, default=APPS, help="app su cui distribuirle")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--master-password", default=MASTER_PASSWORD)
+    args = parser.parse_args(argv)
+
+    if args.db:
+        # Va impostato prima di importare database1
+        os.environ["PASSWORD_MANAGER_DB"] = os.path.abspath(args.db)
+    result = populate(args.rows, args.apps, args.master_password, args.seed)
+    print(f"✅ {result['imported']} credenziali generate in {result['path']} "
+          f"({result['skipped']} già presenti, {result['seconds']:.1f} s)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+"""Carico concorrente sugli endpoint dell'API, in-process con il TestClient di FastAPI
+
+Genera un vault sintetico temporaneo (benchmarks.generate), apre l'app con il
+suo lifespan e per ogni endpoint invia le richieste da più thread insieme,
+misurando latenza (p50/p95/p99) e richieste al secondo. Nessun server né
+rete: si misura il costo del backend (dependency, SQLite, crittografia, JSON).
+
+Uso: python -m benchmarks.load [--requests 400] [--concurrency 8] [--rows 5000]
+     [--apps 100] [--api sync|async] [--json risultati.json]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+from benchmarks import generate, results
+
+REQUESTS = 400
+CONCURRENCY = 8
+ROWS = 5000
+APPS = 100
+# Login e verifica eseguono una derivazione della master password: ne basta una frazione
+LOGIN_SHARE = 0.05
+
+def _percentile(samples: list[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, round(q * len(ordered)) - 1))]
+
+def _scenarios(client, token: str, count: Callable[[float], int]) -> dict:
+    """Per ogni endpoint: (richiesta(i), stati attesi, quota delle richieste).
+
+    count(quota) è il numero di richieste di un endpoint: DELETE e logout consumano
+    una credenziale o un token a richiesta, quindi vengono preparati qui (più uno
+    per il riscaldamento).
+    """
+    headers = {"session-token": token}
+    credential_id = client.get("/credentials/", params={"limit": 1, "metadata_only": True},
+                               headers=headers).json()[0]["id"]
+    run_id = int(time.time())
+    doomed = iter([
+        client.post("/credentials/", headers=headers, json={
+            "app_name": "Delete", "username": f"delete{run_id}-{i}@example.com", "created_by": "Bench"
+        }).json()["id"]
+        for i in range(count(1) + 1)
+    ])
+    # In sequenza: login concorrenti potrebbero essere rifiutati (429) dal limite agli sblocchi
+    spare_tokens = iter([
+        client.post("/login/", json={"master_password": generate.MASTER_PASSWORD}).json()["session_token"]
+        for _ in range(count(LOGIN_SHARE) + 1)
+    ])
+    # Dopo le scritture di preparazione: l'ETag deve essere quello corrente
+    etag = client.get("/apps/", headers=headers).headers["ETag"]
+    return {
+        "GET /health/": (lambda i: client.get("/health/"), (200,), 1),
+        "GET /status/": (lambda i: client.get("/status/"), (200,), 1),
+        "GET /apps/": (lambda i: client.get("/apps/", headers=headers), (200,), 1),
+        "GET /apps/ (304)": (lambda i: client.get("/apps/", headers={**headers, "If-None-Match": etag}), (304,), 1),
+        "GET /credentials/ (50)": (
+            lambda i: client.get("/credentials/", params={"limit": 50}, headers=headers), (200,), 1),
+        "GET /credentials/ (50, metadati)": (
+            lambda i: client.get("/credentials/", params={"limit": 50, "metadata_only": True}, headers=headers),
+            (200,), 1),
+        "GET /credentials/ (stream)": (
+            lambda i: client.get("/credentials/", params={"stream": True}, headers=headers), (200,), 0.1),
+        "GET /changes/ (50)": (
+            lambda i: client.get("/changes/", params={"limit": 50}, headers=headers), (200,), 1),
+        "GET /search/": (
+            lambda i: client.get("/search/", params={"q": f"user{i % 1000:04d}"}, headers=headers), (200,), 1),
+        "GET /credentials/{id}/secret": (
+            lambda i: client.get(f"/credentials/{credential_id}/secret", headers=headers), (200,), 1),
+        "POST /credentials/": (
+            lambda i: client.post("/credentials/", headers=headers, json={
+                "app_name": f"Load{i % 20}", "username": f"load{run_id}-{i}@example.com", "created_by": "Bench"
+            }), (200,), 1),
+        "PUT /credentials/{id}": (
+            lambda i: client.put(f"/credentials/{credential_id}", headers=headers,
+                                 json={"password": f"Aggiornata!{i}"}), (200,), 1),
+        "DELETE /credentials/{id}": (
+            lambda i: client.delete(f"/credentials/{next(doomed)}", headers=headers), (200,), 1),
+        "POST /login/": (
+            lambda i: client.post("/login/", json={"master_password": generate.MASTER_PASSWORD}), (200,),
+            LOGIN_SHARE),
+        "POST /verify/": (
+            lambda i: client.post("/verify/", json={"master_password": generate.MASTER_PASSWORD}), (200,),
+            LOGIN_SHARE),
+        "POST /logout/": (
+            lambda i: client.post("/logout/", headers={"session-token": next(spare_tokens)}), (200,),
+            LOGIN_SHARE)
+    }
+
+def _drive(send, expected: tuple, requests: int, concurrency: int) -> dict:
+    def timed(i: int) -> tuple[float, int]:
+        started = time.perf_counter()
+        response = send(i)
+        return time.perf_counter() - started, response.status_code
+
+    send(0)  # riscaldamento
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(timed, range(requests)))
+    elapsed = time.perf_counter() - started
+    latencies = [latency for latency, _ in outcomes]
+    return {
+        "p50_ms": _percentile(latencies, 0.50) * 1000,
+        "p95_ms": _percentile(latencies, 0.95) * 1000,
+        "p99_ms": _percentile(latencies, 0.99) * 1000,
+        "requests_per_sec": requests / elapsed,
+        "requests": requests,
+        # 429: sblocco rifiutato dal limite di kdfpool1, non un errore del backend
+        "rejected": sum(1 for _, status in outcomes if status == 429),
+        "errors": sum(1 for _, status in outcomes if status not in expected and status != 429)
+    }
+
+def run(requests: int, concurrency: int, rows: int, apps: int, api: str = "sync") -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        # Vault temporaneo: va impostato prima di importare database1
+        os.environ["PASSWORD_MANAGER_DB"] = os.path.join(tmp, "load.db")
+        generate.populate(rows, apps)
+        from fastapi.testclient import TestClient
+        if api == "async":
+            import main_async1 as backend
+        else:
+            import main1 as backend
+
+        measured = {}
+        print(f"{'endpoint':<36} | {'p50 (ms)':>9} | {'p95 (ms)':>9} | {'p99 (ms)':>9} | {'richieste/s':>11} | errori | 429")
+        print("-" * 102)
+        # Indirizzo di loopback come il launcher (gli endpoint di diagnostica lo richiedono)
+        with TestClient(backend.app, client=("127.0.0.1", 50000)) as client:
+            token = client.post("/login/", json={"master_password": generate.MASTER_PASSWORD}).json()["session_token"]
+            count = lambda share: max(concurrency, int(requests * share))
+            for name, (send, expected, share) in _scenarios(client, token, count).items():
+                measured[name] = result = _drive(send, expected, count(share), concurrency)
+                print(f"{name:<36} | {result['p50_ms']:>9.2f} | {result['p95_ms']:>9.2f} | "
+                      f"{result['p99_ms']:>9.2f} | {result['requests_per_sec']:>11,.0f} | {result['errors']:>6} | {result['rejected']}")
+        backend.database1.engine.dispose()
+    return measured
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Carico concorrente sugli endpoint, in-process")
+    parser.add_argument("--requests", type=int, default=REQUESTS, help="richieste per endpoint")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="thread che inviano richieste")
+    parser.add_argument("--rows", type=int, default=ROWS, help="credenziali del vault sintetico")
+    parser.add_argument("--apps", type=int, default=APPS, help="app del vault sintetico")
+    parser.add_argument("--api", choices=("sync", "async"), default="sync", help="main1 o main_async1")
+    parser.add_argument("--json", help="salva i risultati in questo file")
+    args = parser.parse_args(argv)
+
+    measured = run(args.requests, args.concurrency, args.rows, args.apps, args.api)
+    if args.json:
+        params = {"requests": args.requests, "concurrency": args.concurrency, "rows": args.rows,
+                  "apps": args.apps, "api": args.api, "seed": generate.SEED}
+        results.save(args.json, "load", params, measured)
+        print(f"💾 Risultati salvati in {args.json}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+"""Micro-benchmark delle primitive di security1
+
+Ogni funzione viene ripetuta con timeit (numero di chiamate per campione scelto
+in automatico) e si riportano mediana e minimo per chiamata e chiamate al secondo.
+La KDF usata da derive_key e verify_master_password è quella predefinita di kdf1
+(vedi "kdf" nei parametri del JSON): confrontare baseline con KDF diverse non ha senso.
+
+Uso: python -m benchmarks.micro [--repeat 7] [--json risultati.json]
+poi: python -m benchmarks.results baseline.json risultati.json
+"""
+import argparse
+import os
+import statistics
+import sys
+import timeit
+from typing import Optional
+import kdf1
+import security1
+from benchmarks import results
+
+REPEAT = 7
+MASTER_PASSWORD = "Benchmark!2024"
+
+def _cases() -> dict:
+    salt = os.urandom(16)
+    key = security1.derive_key(MASTER_PASSWORD, salt)
+    stored_hash = security1.hash_master_password(MASTER_PASSWORD)
+    token = security1.encrypt_password("Segreta!2024-abcdef", key)
+    return {
+        f"derive_key ({kdf1.LEGACY.name})": lambda: security1.derive_key(MASTER_PASSWORD, salt),
+        f"derive_key ({kdf1.DEFAULT.name})": lambda: security1.derive_key(MASTER_PASSWORD, salt, kdf1.DEFAULT),
+        f"verify_master_password ({kdf1.DEFAULT.name})":
+            lambda: security1.verify_master_password(MASTER_PASSWORD, stored_hash),
+        "encrypt_password": lambda: security1.encrypt_password("Segreta!2024-abcdef", key),
+        "decrypt_password": lambda: security1.decrypt_password(token, key),
+        "generate_strong_password (16)": lambda: security1.generate_strong_password(16),
+        "generate_strong_password (64)": lambda: security1.generate_strong_password(64)
+    }
+
+def measure(fn, repeat: int = REPEAT) -> dict:
+    timer = timeit.Timer(fn)
+    # Almeno 0,2 s per campione: una sola chiamata per le KDF, migliaia per la cifratura
+    number, _ = timer.autorange()
+    per_call = [elapsed / number for elapsed in timer.repeat(repeat=repeat, number=number)]
+    median = statistics.median(per_call)
+    return {
+        "median_ms": median * 1000,
+        "min_ms": min(per_call) * 1000,
+        "ops_per_sec": 1 / median,
+        "calls": number * repeat
+    }
+
+def run(repeat: int = REPEAT) -> dict:
+    measured = {}
+    print(f"{'funzione':<44} | {'mediana (ms)':>12} | {'min (ms)':>10} | {'chiamate/s':>12}")
+    print("-" * 88)
+    for name, fn in _cases().items():
+        measured[name] = result = measure(fn, repeat)
+        print(f"{name:<44} | {result['median_ms']:>12.4f} | {result['min_ms']:>10.4f} | "
+              f"{result['ops_per_sec']:>12,.0f}")
+    return measured
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Micro-benchmark di security1")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="campioni per funzione (si usa la mediana)")
+    parser.add_argument("--json", help="salva i risultati in questo file")
+    args = parser.parse_args(argv)
+
+    measured = run(args.repeat)
+    if args.json:
+        params = {"repeat": args.repeat, "kdf": kdf1.DEFAULT.spec(), "legacy_kdf": kdf1.LEGACY.spec(),
+                  "record_format": security1.RECORD_FORMAT}
+        results.save(args.json, "micro", params, measured)
+        print(f"💾 Risultati salvati in {args.json}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,39 @@
+"""Formato dei record cifrati: Fernet (storico) vs AES-256-GCM vs ChaCha20-Poly1305
+
+Misura la dimensione media di un record e le righe/s in crittografia e decrittazione
+(in serie, con un cifrario costruito una sola volta come fanno le API in blocco).
+
+Uso: python -m benchmarks.records [numero_righe]
+"""
+import sys
+import time
+from cryptography.fernet import Fernet
+import security1
+
+ROWS = 50000
+
+def _rate(fn, items: list) -> float:
+    start = time.perf_counter()
+    for item in items:
+        fn(item)
+    return len(items) / (time.perf_counter() - start)
+
+def run(rows: int):
+    key = Fernet.generate_key()
+    passwords = [security1.generate_strong_password().encode() for _ in range(rows)]
+    ciphers = {
+        "fernet": Fernet(key),
+        "aes-256-gcm": security1.RecordCipher((key,), security1.RECORD_AES_GCM),
+        "chacha20-poly1305": security1.RecordCipher((key,), security1.RECORD_CHACHA20)
+    }
+    print(f"{'formato':<18} | {'byte/record':>11} | {'cripta (righe/s)':>16} | {'decripta (righe/s)':>18}")
+    print("-" * 73)
+    for name, cipher in ciphers.items():
+        encrypt_rate = _rate(cipher.encrypt, passwords)
+        tokens = [cipher.encrypt(password) for password in passwords]
+        decrypt_rate = _rate(cipher.decrypt, tokens)
+        size = sum(len(token) for token in tokens) / rows
+        print(f"{name:<18} | {size:>11.1f} | {encrypt_rate:>16,.0f} | {decrypt_rate:>18,.0f}")
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else ROWS)
@@ -0,0 +1,131 @@
+"""Risultati dei benchmark in JSON e confronto con una baseline
+
+Ogni suite (micro, load) scrive un file con i parametri dell'esecuzione e,
+per ogni benchmark, le metriche misurate. Il nome della metrica dice in che
+verso è un miglioramento: *_ms più basso è meglio, *_per_sec più alto è meglio;
+le altre (errors, rows, ...) sono solo informative.
+
+Uso: python -m benchmarks.results baseline.json risultati.json [--threshold 10]
+     [--threshold-for "derive_key (argon2id)=25"]
+
+Termina con codice 1 se almeno una metrica peggiora oltre la soglia.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from typing import Optional
+
+# Peggioramento tollerato, in percentuale, se non indicato diversamente
+DEFAULT_THRESHOLD = 10.0
+
+def environment() -> dict:
+    """Dati della macchina: due misure sono confrontabili solo se coincidono"""
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count()
+    }
+
+def save(path: str, suite: str, params: dict, results: dict):
+    document = {
+        "suite": suite,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": environment(),
+        "params": params,
+        "results": results
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=2, ensure_ascii=False)
+
+def load(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def _direction(metric: str) -> int:
+    # +1: più alto è peggio (tempi), -1: più basso è peggio (throughput), 0: non confrontata
+    if metric.endswith("_ms"):
+        return 1
+    if metric.endswith("_per_sec"):
+        return -1
+    return 0
+
+def compare(baseline: dict, current: dict, threshold: float = DEFAULT_THRESHOLD,
+            thresholds: Optional[dict] = None) -> list[dict]:
+    """Una voce per ogni metrica presente in entrambi i file, con lo scarto e l'esito.
+
+    thresholds assegna una soglia diversa a un benchmark ("derive_key (argon2id)")
+    o a una sola sua metrica ("GET /apps/.p95_ms").
+    """
+    thresholds = thresholds or {}
+    rows = []
+    for name, metrics in current["results"].items():
+        reference = baseline["results"].get(name)
+        if reference is None:
+            continue
+        for metric, value in metrics.items():
+            direction = _direction(metric)
+            before = reference.get(metric)
+            if not direction or not before:
+                continue
+            limit = thresholds.get(f"{name}.{metric}", thresholds.get(name, threshold))
+            change = (value - before) / before * 100
+            rows.append({
+                "benchmark": name,
+                "metric": metric,
+                "baseline": before,
+                "current": value,
+                "change": change,
+                "threshold": limit,
+                "regression": change * direction > limit
+            })
+    return rows
+
+def report(rows: list[dict]) -> str:
+    lines = [f"{'benchmark':<36} | {'metrica':<16} | {'baseline':>11} | {'attuale':>11} | {'scarto':>8} |",
+             "-" * 97]
+    for row in rows:
+        outcome = f"❌ oltre {row['threshold']:g}%" if row["regression"] else "✅"
+        lines.append(
+            f"{row['benchmark']:<36} | {row['metric']:<16} | {row['baseline']:>11.3f} | "
+            f"{row['current']:>11.3f} | {row['change']:>+7.1f}% | {outcome}"
+        )
+    return "\n".join(lines)
+
+def _parse_threshold(text: str) -> tuple[str, float]:
+    name, sep, value = text.rpartition("=")
+    if not sep or not name:
+        raise argparse.ArgumentTypeError("atteso NOME=PERCENTUALE")
+    return name, float(value)
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Confronta i risultati di un benchmark con una baseline")
+    parser.add_argument("baseline", help="file JSON di riferimento")
+    parser.add_argument("current", help="file JSON della misura da verificare")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="peggioramento tollerato in percentuale (default %(default)s)")
+    parser.add_argument("--threshold-for", type=_parse_threshold, action="append", default=[],
+                        metavar="NOME=PERCENTUALE", help="soglia per un benchmark o per benchmark.metrica")
+    args = parser.parse_args(argv)
+
+    baseline, current = load(args.baseline), load(args.current)
+    if baseline.get("suite") != current.get("suite"):
+        parser.error(f"suite diverse: {baseline.get('suite')} e {current.get('suite')}")
+    if baseline.get("environment") != current.get("environment"):
+        print("⚠️ Misure eseguite in ambienti diversi: il confronto è solo indicativo", file=sys.stderr)
+
+    rows = compare(baseline, current, args.threshold, dict(args.threshold_for))
+    print(report(rows))
+    regressions = sum(row["regression"] for row in rows)
+    if regressions:
+        print(f"❌ {regressions} metriche peggiorate oltre la soglia")
+        return 1
+    print("✅ Nessuna regressione oltre la soglia")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""Letture e scritture al secondo per ogni profilo di storage SQLite, con carico concorrente
+
+Uso: python -m benchmarks.storage [secondi] [lettori] [scrittori]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from sqlalchemy import select
+from sqlalchemy.orm import sessionmaker
+import database1
+
+SEED_ROWS = 5000
+APPS = [f"App{i}" for i in range(50)]
+
+def _seed(session_factory):
+    with session_factory() as db:
+        db.execute(database1.Credential.__table__.insert(), [
+            {
+                "app_name": APPS[i % len(APPS)],
+                "username": f"user{i}@example.com",
+                "created_by": "Bench",
+                "encrypted_password": os.urandom(100)
+            }
+            for i in range(SEED_ROWS)
+        ])
+        db.commit()
+
+def _reader(session_factory, stop: threading.Event, counts: list, index: int):
+    n = 0
+    with session_factory() as db:
+        while not stop.is_set():
+            app_name = APPS[n % len(APPS)]
+            db.execute(select(database1.Credential.id).where(database1.Credential.app_name == app_name)).all()
+            db.rollback()
+            n += 1
+    counts[index] = n
+
+def _writer(session_factory, stop: threading.Event, counts: list, index: int):
+    n = 0
+    with session_factory() as db:
+        while not stop.is_set():
+            db.add(database1.Credential(
+                app_name=APPS[n % len(APPS)],
+                username=f"writer{index}-{n}",
+                created_by="Bench",
+                encrypted_password=os.urandom(100)
+            ))
+            db.commit()
+            n += 1
+    counts[index] = n
+
+def bench_profile(profile_name: str, seconds: float, readers: int, writers: int) -> tuple[float, float]:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = database1.create_db_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}", profile_name)
+        database1.Base.metadata.create_all(bind=engine)
+        session_factory = sessionmaker(bind=engine)
+        _seed(session_factory)
+
+        stop = threading.Event()
+        read_counts = [0] * readers
+        write_counts = [0] * writers
+        threads = [threading.Thread(target=_reader, args=(session_factory, stop, read_counts, i)) for i in range(readers)]
+        threads += [threading.Thread(target=_writer, args=(session_factory, stop, write_counts, i)) for i in range(writers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        engine.dispose()
+    return sum(read_counts) / seconds, sum(write_counts) / seconds
+
+def run(seconds: float, readers: int, writers: int):
+    print(f"{readers} lettori, {writers} scrittori, {seconds:g}s per profilo")
+    print(f"{'profilo':>12} | {'letture/s':>10} | {'scritture/s':>11}")
+    print("-" * 40)
+    for profile_name in database1.STORAGE_PROFILES:
+        reads, writes = bench_profile(profile_name, seconds, readers, writers)
+        print(f"{profile_name:>12} | {reads:>10,.0f} | {writes:>11,.0f}")
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    run(
+        float(args[0]) if len(args) > 0 else 3.0,
+        int(args[1]) if len(args) > 1 else 4,
+        int(args[2]) if len(args) > 2 else 1
+    )
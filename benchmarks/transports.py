@@ -0,0 +1,91 @@
+"""Latenza per endpoint con i tre trasporti di client1: TCP, socket Unix e in-process
+
+Avvia l'API in questo processo (uvicorn su una porta di loopback e su un socket
+Unix) sopra un vault temporaneo, quindi misura p50/p95 di ogni chiamata con
+client1.ApiClient (tcp, uds) e client1.InProcessClient.
+
+Uso: python -m benchmarks.transports [chiamate_per_endpoint]
+"""
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import uvicorn
+
+CALLS = 500
+SEED_ROWS = 200
+BENCH_PORT = 8765
+MASTER_PASSWORD = "Benchmark!2024"
+
+def _serve(app, **bind) -> "uvicorn.Server":
+    import uvicorn
+    server = uvicorn.Server(uvicorn.Config(app, log_level="error", **bind))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+def _percentiles(samples: list[float]) -> tuple[float, float]:
+    samples = sorted(samples)
+    return statistics.median(samples) * 1000, samples[int(len(samples) * 0.95) - 1] * 1000
+
+def run(calls: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        # Vault temporaneo: va impostato prima di importare database1
+        os.environ["PASSWORD_MANAGER_DB"] = os.path.join(tmp, "bench.db")
+        import client1
+        import main1
+
+        clients = {"inprocess": client1.InProcessClient()}
+        servers = [_serve(main1.app, host="127.0.0.1", port=BENCH_PORT)]
+        clients["tcp"] = client1.ApiClient(f"http://127.0.0.1:{BENCH_PORT}")
+        if hasattr(socket, "AF_UNIX"):
+            socket_path = os.path.join(tmp, "api.sock")
+            servers.append(_serve(main1.app, uds=socket_path))
+            clients["uds"] = client1.ApiClient(socket_path=socket_path)
+
+        seed = clients["inprocess"]
+        seed.initialize(MASTER_PASSWORD)
+        token = seed.login(MASTER_PASSWORD)
+        for i in range(SEED_ROWS):
+            seed.create_credential(token, f"App{i % 20}", f"user{i}@example.com", "Bench")
+        credential_id = seed.list_credentials(token, limit=1).items[0]["id"]
+
+        endpoints = {
+            "GET /status/": lambda c: c.is_initialized(),
+            "GET /apps/": lambda c: c.list_apps(token),
+            "GET /credentials/ (50)": lambda c: c.list_credentials(token, limit=50),
+            "GET /search/": lambda c: c.search(token, "user1"),
+            "GET /credentials/{id}/secret": lambda c: c.get_secret(token, credential_id)
+        }
+        names = list(clients)
+        print(f"{'endpoint':<30} | " + " | ".join(f"{name + ' p50/p95 (ms)':>24}" for name in names))
+        print("-" * (33 + 27 * len(names)))
+        for label, call in endpoints.items():
+            cells = []
+            for name in names:
+                client = clients[name]
+                call(client)  # riscaldamento: connessione keep-alive già aperta
+                samples = []
+                for _ in range(calls):
+                    start = time.perf_counter()
+                    call(client)
+                    samples.append(time.perf_counter() - start)
+                p50, p95 = _percentiles(samples)
+                cells.append(f"{p50:>11.3f} / {p95:>10.3f}")
+            print(f"{label:<30} | " + " | ".join(f"{cell:>24}" for cell in cells))
+
+        for client in clients.values():
+            client.close()
+        for server in servers:
+            server.should_exit = True
+        main1.database1.engine.dispose()
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else CALLS)
@@ -1,9 +1,10 @@
 import PyInstaller.__main__
+import argparse
 import os
 import sys
 from PyInstaller.utils.hooks import collect_all
 
-def build():
+def build(onedir: bool = False):
     # 1. Rileva il sistema operativo per il separatore dei percorsi
     # Windows usa ';', Linux/Mac usano ':'
     sep = ';' if sys.platform == "win32" else ':'
@@ -37,13 +38,22 @@ def build():
         'uvicorn.lifespan.on',
         'fastapi.applications',
         'sqlalchemy.sql.default_comparator',
-        'sqlite3'
+        'sqlalchemy.dialects.sqlite.aiosqlite',
+        'aiosqlite',
+        'sqlite3',
+        # Il launcher passa l'API a uvicorn come stringa di import ("main1:app")
+        'main1',
+        'main_async1',
+        # app1.py è incluso come dato: i moduli che importa vanno dichiarati
+        'client1'
     ]
 
     # 5. Costruisci i comandi per PyInstaller
     args = [
         'launcher.py',                  # Il file principale da avviare
-        '--onefile',                    # Crea un unico file .exe
+        # --onefile crea un unico file .exe, che però si scompatta in una cartella temporanea
+        # a ogni avvio; --onedir produce una cartella con l'eseguibile e parte molto prima
+        '--onedir' if onedir else '--onefile',
         '--name=PasswordManager',       # Nome del file finale
         '--clean',                      # Pulisci la cache prima di costruire
         '--icon=icona.ico',               # Icona dell'applicazione
@@ -66,4 +76,7 @@ def build():
     PyInstaller.__main__.run(args)
 
 if __name__ == "__main__":
-    build()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Crea l'eseguibile con PyInstaller")
+    parser.add_argument("--onedir", action="store_true",
+                        help="cartella con l'eseguibile invece del file unico (avvio più rapido)")
+    build(parser.parse_args().onedir)
\ No newline at end of file
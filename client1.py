@@ -0,0 +1,423 @@
+"""Client HTTP per le API del Password Manager, usato da app1.py e dagli script
+
+Una sola requests.Session con connessioni keep-alive riutilizzate (in app1.py è
+condivisa tra i rerun con st.cache_resource), timeout su ogni chiamata e retry
+con backoff sugli errori di connessione e sulle risposte 502/503/504/429 delle
+richieste idempotenti. Il token di sessione è un argomento di ogni metodo e non
+viene salvato nel client, così la stessa istanza può servire più utenti.
+I tempi di risposta per endpoint sono disponibili con stats().
+
+Trasporti (PASSWORD_MANAGER_TRANSPORT, scelto da connect()):
+
+* tcp: HTTP su 127.0.0.1:8000 (default);
+* uds: HTTP su un socket Unix in una cartella accessibile solo all'utente
+  (non disponibile su Windows, dove si ricade su tcp);
+* inprocess: nessun HTTP, InProcessClient chiama direttamente le funzioni di
+  main1 nello stesso processo (il launcher non avvia l'API).
+"""
+import os
+import socket
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Optional
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool
+from urllib3.util.retry import Retry
+
+# URL del backend avviato dal launcher
+BACKEND_URL = "http://127.0.0.1:8000"
+TRANSPORT = os.environ.get("PASSWORD_MANAGER_TRANSPORT", "tcp")
+if TRANSPORT == "uds" and not hasattr(socket, "AF_UNIX"):
+    TRANSPORT = "tcp"
+# Timeout (connessione, lettura) in secondi: lo sblocco della KDF può richiedere qualche secondo
+TIMEOUT = (3.05, 30)
+# Tentativi ripetuti e backoff esponenziale (0.3s, 0.6s, 1.2s...)
+RETRIES = 3
+BACKOFF = 0.3
+# Connessioni keep-alive tenute aperte verso il backend
+POOL_SIZE = 10
+
+class ApiError(Exception):
+    """Risposta di errore del backend (detail è il messaggio di FastAPI)"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(f"{status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
+
+class SessionExpired(ApiError):
+    """Token di sessione non valido o scaduto: serve un nuovo login"""
+
+@dataclass
+class AppList:
+    apps: list[str]
+    counts: dict[str, int]
+    etag: Optional[str]
+
+@dataclass
+class CredentialPage:
+    """Credenziali (dizionari con id, app_name, username, created_by) e cursore della pagina successiva"""
+    items: list[dict]
+    next_cursor: Optional[str]
+
+@dataclass
+class VaultChanges:
+    """Risposta di /changes/: revision va ripassata come since alla chiamata successiva"""
+    revision: int
+    full: bool
+    more: bool
+    upserted: list[dict]
+    deleted: list[int]
+
+@dataclass
+class EndpointTiming:
+    calls: int = 0
+    errors: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+
+def socket_dir() -> str:
+    """Cartella del socket Unix, una per utente"""
+    return os.path.join(tempfile.gettempdir(), f"password-manager-{os.getuid()}")
+
+SOCKET_PATH = os.environ.get("PASSWORD_MANAGER_SOCKET") or (
+    os.path.join(socket_dir(), "api.sock") if hasattr(os, "getuid") else None
+)
+
+def connect(transport: str = TRANSPORT, **kwargs) -> "BaseClient":
+    """Client per il trasporto richiesto (argomenti extra passati ad ApiClient)"""
+    if transport == "inprocess":
+        return InProcessClient()
+    if transport == "uds":
+        return ApiClient(socket_path=SOCKET_PATH, **kwargs)
+    return ApiClient(**kwargs)
+
+class _UnixConnection(HTTPConnection):
+    def __init__(self, *args, socket_path: str, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.socket_path = socket_path
+
+    def _new_conn(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+class _UnixConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _UnixConnection
+
+class _UnixAdapter(HTTPAdapter):
+    """Adapter di requests che invia ogni richiesta sul socket Unix, con lo stesso pool keep-alive"""
+
+    def __init__(self, socket_path: str, pool_size: int, max_retries: Retry):
+        super().__init__(pool_maxsize=pool_size, max_retries=max_retries)
+        self._unix_pool = _UnixConnectionPool("localhost", maxsize=pool_size, socket_path=socket_path)
+
+    def get_connection_with_tls_context(self, request, verify, proxies=None, cert=None):
+        return self._unix_pool
+
+    def get_connection(self, url, proxies=None):
+        return self._unix_pool
+
+    def close(self):
+        self._unix_pool.close()
+        super().close()
+
+class BaseClient:
+    """Tempi di risposta per endpoint, comuni a tutti i trasporti"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timings: dict[str, EndpointTiming] = {}
+
+    def _record(self, endpoint: str, elapsed: float, failed: bool):
+        elapsed_ms = elapsed * 1000
+        with self._lock:
+            timing = self._timings.setdefault(endpoint, EndpointTiming())
+            timing.calls += 1
+            timing.errors += 1 if failed else 0
+            timing.total_ms += elapsed_ms
+            timing.max_ms = max(timing.max_ms, elapsed_ms)
+
+    def stats(self) -> dict:
+        """Chiamate, errori e tempi di risposta (ms) per endpoint"""
+        with self._lock:
+            return {
+                endpoint: {
+                    "calls": timing.calls,
+                    "errors": timing.errors,
+                    "avg_ms": round(timing.total_ms / timing.calls, 2),
+                    "max_ms": round(timing.max_ms, 2)
+                }
+                for endpoint, timing in self._timings.items()
+            }
+
+    def close(self):
+        pass
+
+class ApiClient(BaseClient):
+    """Metodi tipizzati per gli endpoint, sopra una sessione HTTP con pool di connessioni"""
+
+    def __init__(
+        self,
+        base_url: str = BACKEND_URL,
+        timeout: tuple = TIMEOUT,
+        retries: int = RETRIES,
+        backoff: float = BACKOFF,
+        pool_size: int = POOL_SIZE,
+        socket_path: Optional[str] = None
+    ):
+        super().__init__()
+        # Con socket_path l'host dell'URL non conta: la connessione va sempre al socket
+        self.base_url = "http://localhost" if socket_path else base_url.rstrip("/")
+        self.timeout = timeout
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=(429, 502, 503, 504),
+            allowed_methods=frozenset({"GET", "HEAD", "PUT", "DELETE"}),
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        if socket_path:
+            adapter = _UnixAdapter(socket_path, pool_size, retry)
+        else:
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self._http = requests.Session()
+        self._http.mount("http://", adapter)
+        self._http.mount("https://", adapter)
+
+    def _request(self, method: str, endpoint: str, path: str = None, token: Optional[str] = None,
+                 headers: Optional[dict] = None, **kwargs) -> requests.Response:
+        """Esegue la richiesta, ne registra il tempo e trasforma le risposte di errore in eccezioni"""
+        headers = dict(headers or {})
+        if token is not None:
+            headers["session-token"] = token
+        started = time.perf_counter()
+        response = None
+        try:
+            response = self._http.request(
+                method, self.base_url + (path or endpoint), headers=headers, timeout=self.timeout, **kwargs
+            )
+        finally:
+            self._record(f"{method} {endpoint}", time.perf_counter() - started,
+                         response is None or response.status_code >= 400)
+        if response.status_code >= 400:
+            try:
+                detail = response.json().get("detail", response.reason)
+            except ValueError:
+                detail = response.reason
+            if response.status_code == 401 and token is not None:
+                raise SessionExpired(response.status_code, str(detail))
+            raise ApiError(response.status_code, str(detail))
+        return response
+
+    def close(self):
+        self._http.close()
+
+    # --- Sistema e sessione ---
+
+    def health(self) -> bool:
+        try:
+            self._request("GET", "/health/")
+            return True
+        except (ApiError, requests.RequestException):
+            return False
+
+    def is_initialized(self) -> bool:
+        return self._request("GET", "/status/").json()["is_initialized"]
+
+    def initialize(self, master_password: str):
+        self._request("POST", "/initialize/", json={"master_password": master_password})
+
+    def login(self, master_password: str) -> str:
+        """Restituisce il token di sessione (ApiError 401 se la password è errata)"""
+        return self._request("POST", "/login/", json={"master_password": master_password}).json()["session_token"]
+
+    def logout(self, token: str):
+        self._request("POST", "/logout/", token=token)
+
+    # --- Credenziali ---
+
+    def list_apps(self, token: str, etag: Optional[str] = None) -> Optional[AppList]:
+        """Elenco delle app; None se etag è ancora valido (304, nessun corpo)"""
+        response = self._request("GET", "/apps/", token=token, headers={"If-None-Match": etag} if etag else None)
+        if response.status_code == 304:
+            return None
+        data = response.json()
+        return AppList(data.get("apps", []), data.get("counts", {}), response.headers.get("ETag"))
+
+    def list_credentials(self, token: str, app_name: Optional[str] = None, limit: Optional[int] = None,
+                         cursor: Optional[str] = None, metadata_only: bool = True) -> CredentialPage:
+        params = {"metadata_only": metadata_only}
+        if app_name:
+            params["app_name"] = app_name
+        if limit:
+            params["limit"] = limit
+        if cursor:
+            params["cursor"] = cursor
+        response = self._request("GET", "/credentials/", token=token, params=params)
+        return CredentialPage(response.json(), response.headers.get("X-Next-Cursor"))
+
+    def changes(self, token: str, since: int = 0, limit: Optional[int] = None,
+                metadata_only: bool = True) -> VaultChanges:
+        """Modifiche successive alla revisione since (tutto il vault con since=0; con limit=0 solo la revisione)"""
+        params = {"since": since, "metadata_only": metadata_only}
+        if limit is not None:
+            params["limit"] = limit
+        return VaultChanges(**self._request("GET", "/changes/", token=token, params=params).json())
+
+    def search(self, token: str, q: str, limit: int = 20) -> CredentialPage:
+        response = self._request("GET", "/search/", token=token, params={"q": q, "limit": limit})
+        return CredentialPage(response.json(), response.headers.get("X-Next-Cursor"))
+
+    def get_secret(self, token: str, credential_id: int) -> str:
+        return self._request(
+            "GET", "/credentials/{id}/secret", f"/credentials/{credential_id}/secret", token=token
+        ).json()["password"]
+
+    def create_credential(self, token: str, app_name: str, username: str, created_by: str,
+                          password: Optional[str] = None) -> dict:
+        """Risposta di /credentials/: message "exists" con existing_id se app + username esistono già"""
+        payload = {"app_name": app_name, "username": username, "created_by": created_by}
+        if password:
+            payload["password"] = password
+        return self._request("POST", "/credentials/", token=token, json=payload).json()
+
+    def update_credential(self, token: str, credential_id: int, password: Optional[str] = None) -> dict:
+        """Aggiorna la password (generata dal backend se None, restituita in generated_password)"""
+        return self._request(
+            "PUT", "/credentials/{id}", f"/credentials/{credential_id}", token=token,
+            json={"password": password} if password else {}
+        ).json()
+
+    def delete_credential(self, token: str, credential_id: int):
+        self._request("DELETE", "/credentials/{id}", f"/credentials/{credential_id}", token=token)
+
+class InProcessClient(BaseClient):
+    """Stessi metodi di ApiClient, ma chiama le funzioni degli endpoint di main1 senza HTTP.
+
+    Le dipendenze di FastAPI (sessione del database, token, chiave) vengono risolte
+    qui; le HTTPException diventano ApiError come nel client HTTP.
+    """
+
+    def __init__(self):
+        super().__init__()
+        # Importato solo qui: il client HTTP non deve caricare il backend
+        import main1
+        main1.startup()
+        self._main = main1
+
+    @contextmanager
+    def _endpoint(self, endpoint: str, token: Optional[str] = None):
+        from fastapi import HTTPException
+        from pydantic import ValidationError
+        started = time.perf_counter()
+        failed = True
+        db = self._main.database1.SessionLocal()
+        try:
+            yield db
+            failed = False
+        except HTTPException as e:
+            if e.status_code == 401 and token is not None:
+                raise SessionExpired(e.status_code, str(e.detail))
+            raise ApiError(e.status_code, str(e.detail))
+        except ValidationError as e:
+            raise ApiError(422, str(e))
+        finally:
+            db.close()
+            self._record(endpoint, time.perf_counter() - started, failed)
+
+    def _key(self, token: str):
+        return self._main.require_key(self._main.require_session(token))
+
+    # --- Sistema e sessione ---
+
+    def health(self) -> bool:
+        try:
+            with self._endpoint("GET /health/") as db:
+                self._main.health(db)
+            return True
+        except ApiError:
+            return False
+
+    def is_initialized(self) -> bool:
+        with self._endpoint("GET /status/") as db:
+            return self._main.check_initialization(db)["is_initialized"]
+
+    def initialize(self, master_password: str):
+        with self._endpoint("POST /initialize/") as db:
+            self._main.initialize_master_password(self._main.MasterPasswordCreate(master_password=master_password), db)
+
+    def login(self, master_password: str) -> str:
+        with self._endpoint("POST /login/") as db:
+            return self._main.login(self._main.MasterPasswordLogin(master_password=master_password), db)["session_token"]
+
+    def logout(self, token: str):
+        with self._endpoint("POST /logout/", token):
+            self._main.logout(token)
+
+    # --- Credenziali ---
+
+    def list_apps(self, token: str, etag: Optional[str] = None) -> Optional[AppList]:
+        from fastapi import Response
+        with self._endpoint("GET /apps/", token) as db:
+            response = Response()
+            data = self._main.get_app_list(response, etag, self._main.require_session(token), db)
+            if isinstance(data, Response):
+                return None
+            return AppList(data["apps"], data["counts"], response.headers.get("ETag"))
+
+    def list_credentials(self, token: str, app_name: Optional[str] = None, limit: Optional[int] = None,
+                         cursor: Optional[str] = None, metadata_only: bool = True) -> CredentialPage:
+        from fastapi import Response
+        with self._endpoint("GET /credentials/", token) as db:
+            response = Response()
+            items = self._main.list_credentials(
+                response, self._key(token), app_name, limit, int(cursor) if cursor else None,
+                False, metadata_only, db
+            )
+            return CredentialPage(items, response.headers.get("X-Next-Cursor"))
+
+    def changes(self, token: str, since: int = 0, limit: Optional[int] = None,
+                metadata_only: bool = True) -> VaultChanges:
+        with self._endpoint("GET /changes/", token) as db:
+            return VaultChanges(**self._main.get_changes(
+                since, self._main.CHANGES_LIMIT if limit is None else limit, metadata_only, self._key(token), db
+            ))
+
+    def search(self, token: str, q: str, limit: int = 20) -> CredentialPage:
+        with self._endpoint("GET /search/", token) as db:
+            return CredentialPage(self._main.search_credentials(q, limit, self._main.require_session(token), db), None)
+
+    def get_secret(self, token: str, credential_id: int) -> str:
+        with self._endpoint("GET /credentials/{id}/secret", token) as db:
+            return self._main.get_credential_secret(credential_id, self._key(token), db)["password"]
+
+    def create_credential(self, token: str, app_name: str, username: str, created_by: str,
+                          password: Optional[str] = None) -> dict:
+        with self._endpoint("POST /credentials/", token) as db:
+            cred = self._main.CredentialBase(
+                app_name=app_name, username=username, created_by=created_by, password=password or None
+            )
+            return self._main.create_credential(cred, self._main.require_write_key(self._key(token), db), db)
+
+    def update_credential(self, token: str, credential_id: int, password: Optional[str] = None) -> dict:
+        with self._endpoint("PUT /credentials/{id}", token) as db:
+            user_key = self._main.require_write_key(self._key(token), db)
+            return self._main.update_credential(
+                credential_id, self._main.CredentialUpdate(password=password or None), user_key, db
+            )
+
+    def delete_credential(self, token: str, credential_id: int):
+        with self._endpoint("DELETE /credentials/{id}", token) as db:
+            self._main.delete_credential(credential_id, self._main.require_session(token), db)
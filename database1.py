@@ -1,7 +1,17 @@
+import argparse
+import logging
 import os
+import sqlite3
 import sys
-from sqlalchemy import create_engine, Column, Integer, String, LargeBinary, Boolean
+import threading
+from contextlib import contextmanager
+from typing import Optional
+from sqlalchemy import create_engine, event, text, Column, Float, Index, Integer, String, LargeBinary, Boolean
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import declarative_base, sessionmaker
+import metrics1
+
+logger = logging.getLogger(__name__)
 
 # Questa funzione serve a trovare la cartella dove si trova l'EXE
 def get_application_path():
@@ -12,19 +22,122 @@ def get_application_path():
     return os.path.dirname(os.path.abspath(__file__))
 
 # Costruiamo il percorso assoluto per il database
-# Così verrà creato sempre ACCANTO al file .exe
-db_path = os.path.join(get_application_path(), "passwords.db")
+# Così verrà creato sempre ACCANTO al file .exe (PASSWORD_MANAGER_DB per usarne un altro, es. nei benchmark)
+db_path = os.environ.get("PASSWORD_MANAGER_DB") or os.path.join(get_application_path(), "passwords.db")
 
 # Configurazione del Database usando il percorso calcolato
 DATABASE_URL = f"sqlite:///{db_path}"
+ASYNC_DATABASE_URL = f"sqlite+aiosqlite:///{db_path}"
+
+# 1. PROFILI DI TUNING DI SQLITE (applicati ad ogni nuova connessione)
+# Si sceglie con "python database1.py --storage-profile NOME", che lo salva in config
+# e vale dal prossimo avvio; PASSWORD_MANAGER_DB_PROFILE lo sostituisce per un solo processo
+STORAGE_PROFILES = {
+    # Comportamento originale di SQLite: journal a rollback, nessuna cache extra
+    "legacy": {
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+        "busy_timeout": 5000,
+    },
+    # WAL: i lettori non bloccano lo scrittore; fsync completo ad ogni commit
+    "safe": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "cache_size": -16000,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+    # Default: WAL con fsync solo ai checkpoint (nessuna corruzione, al massimo
+    # si perde l'ultimo commit in caso di crash del sistema operativo)
+    "balanced": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -16000,
+        "mmap_size": 64 * 1024 * 1024,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+    # Vault molto grandi: cache e mmap più ampi
+    "performance": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -64000,
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "MEMORY",
+        "busy_timeout": 10000,
+    },
+}
+DEFAULT_STORAGE_PROFILE = "balanced"
+STORAGE_PROFILE_KEY = "storage_profile"
+# None: si usa il profilo salvato nel database
+STORAGE_PROFILE = os.environ.get("PASSWORD_MANAGER_DB_PROFILE")
+
+def apply_storage_profile(dbapi_connection, profile: dict):
+    """Esegue i PRAGMA del profilo sulla connessione sqlite3"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma, value in profile.items():
+            cursor.execute(f"PRAGMA {pragma} = {value}")
+    finally:
+        cursor.close()
+
+def saved_storage_profile(dbapi_connection) -> Optional[str]:
+    """Profilo salvato in config (None se manca o se il database è ancora da creare)"""
+    cursor = dbapi_connection.cursor()
+    try:
+        # Attesa come nei profili, nel caso un altro processo stia scrivendo
+        cursor.execute("PRAGMA busy_timeout = 5000")
+        cursor.execute("SELECT value FROM config WHERE key = ?", (STORAGE_PROFILE_KEY,))
+        row = cursor.fetchone()
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        cursor.close()
+    return row[0].decode() if row else None
+
+def _listen_storage_profile(db_engine, profile_name: Optional[str]):
+    if profile_name is not None and profile_name not in STORAGE_PROFILES:
+        raise ValueError(f"Profilo di storage sconosciuto: {profile_name}")
+    # Senza profilo esplicito si legge quello salvato alla prima connessione e vale per tutto il processo
+    chosen = {}
+
+    @event.listens_for(db_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        if "profile" not in chosen:
+            name = profile_name or saved_storage_profile(dbapi_connection)
+            chosen["profile"] = STORAGE_PROFILES.get(name, STORAGE_PROFILES[DEFAULT_STORAGE_PROFILE])
+        apply_storage_profile(dbapi_connection, chosen["profile"])
+
+def create_db_engine(url: str, profile_name: Optional[str] = STORAGE_PROFILE):
+    """Crea l'engine SQLAlchemy applicando il profilo di storage scelto"""
+    db_engine = create_engine(url, connect_args={"check_same_thread": False})
+    _listen_storage_profile(db_engine, profile_name)
+    metrics1.instrument_engine(db_engine)
+    return db_engine
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+def create_async_db_engine(url: str = ASYNC_DATABASE_URL, profile_name: Optional[str] = STORAGE_PROFILE):
+    """Engine asincrono (aiosqlite) sullo stesso file e con lo stesso profilo, per main_async1"""
+    # Import qui: aiosqlite serve solo alla variante asincrona dell'API
+    from sqlalchemy.ext.asyncio import create_async_engine
+    db_engine = create_async_engine(url)
+    _listen_storage_profile(db_engine.sync_engine, profile_name)
+    metrics1.instrument_engine(db_engine.sync_engine)
+    return db_engine
+
+engine = create_db_engine(DATABASE_URL)
 # 2. Creiamo la sessione (il canale di comunicazione)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 # 3. La base per i nostri modelli
 Base = declarative_base()
 
+def make_app_key(app_name: str) -> str:
+    """Chiave normalizzata del nome app usata per riconoscere i duplicati"""
+    return app_name.strip().casefold()
+
+def _default_app_key(context) -> str:
+    return make_app_key(context.get_current_parameters()["app_name"])
+
 # 4. DEFINIZIONE DELLA TABELLA CREDENTIALS
 class Credential(Base):
     __tablename__ = "credentials"
@@ -34,7 +147,19 @@ class Credential(Base):
     app_name = Column(String, index=True)
     username = Column(String, index=True)
     created_by = Column(String, index=True)
-    encrypted_password = Column(String)
+    # Record cifrato binario (security1.RecordCipher). SQLite non impone il tipo dichiarato:
+    # le colonne VARCHAR dei database esistenti contengono già byte e non vanno migrate
+    encrypted_password = Column(LargeBinary)
+    # app_name normalizzato (minuscolo, senza spazi ai lati), calcolato in automatico
+    app_key = Column(String, default=_default_app_key)
+    # Revisione del vault all'ultima modifica della riga: la imposta il trigger (vedi REVISION_DDL)
+    revision = Column(Integer, index=True, nullable=False, default=0)
+
+    # Una sola credenziale per coppia app + username: il controllo dei duplicati
+    # e l'inserimento avvengono nello stesso statement (INSERT ... ON CONFLICT)
+    __table_args__ = (
+        Index("ux_credentials_app_key_username", "app_key", "username", unique=True),
+    )
 
 # 5. TABELLA CONFIG (per salt e altre configurazioni)
 class Config(Base):
@@ -49,4 +174,223 @@ class MasterPassword(Base):
     password_hash = Column(LargeBinary)  # Hash della master password
     is_initialized = Column(Boolean, default=True)
 
-Base.metadata.create_all(bind=engine)
\ No newline at end of file
+# 6b. SESSIONI CONDIVISE TRA I WORKER (launcher con PASSWORD_MANAGER_WORKERS > 1)
+# La chiave dei dati è salvata cifrata con un segreto che esiste solo in memoria
+class ApiSession(Base):
+    __tablename__ = "api_sessions"
+    session_id = Column(String, primary_key=True)
+    token_digest = Column(LargeBinary, unique=True, index=True)
+    secret_id = Column(String)  # Impronta del segreto: le sessioni di avvii precedenti non valgono
+    created_at = Column(Float)
+    last_seen = Column(Float)
+    wrapped_key = Column(LargeBinary)
+
+# 6c. REVISIONE DEL VAULT E CREDENZIALI ELIMINATE (per /changes/)
+# Una sola riga con un contatore che cresce a ogni inserimento, modifica o eliminazione
+class VaultRevision(Base):
+    __tablename__ = "vault_revision"
+    id = Column(Integer, primary_key=True)
+    revision = Column(Integer, nullable=False, default=0)
+
+class Tombstone(Base):
+    __tablename__ = "credential_tombstones"
+    credential_id = Column(Integer, primary_key=True)
+    app_name = Column(String)
+    revision = Column(Integer, index=True, nullable=False)
+
+# Il contatore lo aggiornano i trigger, nella stessa transazione della scrittura: valgono
+# anche per importazione, rotazione e comandi da terminale. SQLite ammette un solo
+# scrittore alla volta, quindi l'ordine delle revisioni è quello dei commit.
+# Le ricifrature (rotazione, aggiornamento del formato) non sono modifiche: la password
+# resta la stessa. Le esegue reencryption(), che durante la transazione lascia in config
+# il marcatore REENCRYPTION_MARKER letto dal trigger di UPDATE.
+REENCRYPTION_MARKER = "reencryption_in_progress"
+REVISION_DDL = [
+    """CREATE TRIGGER IF NOT EXISTS credentials_revision_ai AFTER INSERT ON credentials BEGIN
+        UPDATE vault_revision SET revision = revision + 1 WHERE id = 1;
+        UPDATE credentials SET revision = (SELECT revision FROM vault_revision WHERE id = 1) WHERE id = new.id;
+        DELETE FROM credential_tombstones WHERE credential_id = new.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS credentials_revision_au
+    AFTER UPDATE OF app_name, username, created_by, encrypted_password ON credentials
+    WHEN new.app_name IS NOT old.app_name OR new.username IS NOT old.username
+        OR new.created_by IS NOT old.created_by
+        OR NOT EXISTS (SELECT 1 FROM config WHERE key = '{REENCRYPTION_MARKER}')
+    BEGIN
+        UPDATE vault_revision SET revision = revision + 1 WHERE id = 1;
+        UPDATE credentials SET revision = (SELECT revision FROM vault_revision WHERE id = 1) WHERE id = new.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS credentials_revision_ad AFTER DELETE ON credentials BEGIN
+        UPDATE vault_revision SET revision = revision + 1 WHERE id = 1;
+        INSERT OR REPLACE INTO credential_tombstones (credential_id, app_name, revision)
+        VALUES (old.id, old.app_name, (SELECT revision FROM vault_revision WHERE id = 1));
+    END""",
+]
+
+def create_revision_tracking():
+    """Crea la riga del contatore (partendo dalle revisioni già presenti) e i trigger"""
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT OR IGNORE INTO vault_revision (id, revision) "
+            "SELECT 1, COALESCE(MAX(revision), 0) FROM credentials"
+        ))
+        # Trigger di UPDATE di una versione precedente, che contava anche le ricifrature
+        existing = conn.execute(text(
+            "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'credentials_revision_au'"
+        )).scalar()
+        if existing and REENCRYPTION_MARKER not in existing:
+            conn.execute(text("DROP TRIGGER credentials_revision_au"))
+        for ddl in REVISION_DDL:
+            conn.execute(text(ddl))
+
+@contextmanager
+def reencryption(db):
+    """Le UPDATE di encrypted_password eseguite nel blocco non cambiano la revisione.
+
+    Solo per ricifrare la stessa password; il commit è a carico del chiamante, dopo il blocco.
+    """
+    db.execute(text("INSERT OR IGNORE INTO config (key, value) VALUES (:key, x'')"), {"key": REENCRYPTION_MARKER})
+    try:
+        yield
+    finally:
+        db.execute(text("DELETE FROM config WHERE key = :key"), {"key": REENCRYPTION_MARKER})
+
+# 7. INDICE DI RICERCA FULL-TEXT (FTS5 con tokenizer trigram)
+# La tabella virtuale indicizza solo i metadati in chiaro ed è mantenuta dai trigger
+# ad ogni INSERT/UPDATE/DELETE su credentials: nessun lavoro extra negli endpoint
+SEARCH_INDEX_DDL = [
+    """CREATE VIRTUAL TABLE credentials_fts USING fts5(
+        app_name, username, created_by,
+        content='credentials', content_rowid='id', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS credentials_fts_ai AFTER INSERT ON credentials BEGIN
+        INSERT INTO credentials_fts(rowid, app_name, username, created_by)
+        VALUES (new.id, new.app_name, new.username, new.created_by);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS credentials_fts_ad AFTER DELETE ON credentials BEGIN
+        INSERT INTO credentials_fts(credentials_fts, rowid, app_name, username, created_by)
+        VALUES ('delete', old.id, old.app_name, old.username, old.created_by);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS credentials_fts_au AFTER UPDATE OF app_name, username, created_by ON credentials BEGIN
+        INSERT INTO credentials_fts(credentials_fts, rowid, app_name, username, created_by)
+        VALUES ('delete', old.id, old.app_name, old.username, old.created_by);
+        INSERT INTO credentials_fts(rowid, app_name, username, created_by)
+        VALUES (new.id, new.app_name, new.username, new.created_by);
+    END""",
+]
+
+def create_search_index() -> bool:
+    """Crea l'indice FTS5 se manca. Restituisce False se SQLite non supporta FTS5/trigram"""
+    try:
+        with engine.begin() as conn:
+            exists = conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'credentials_fts'"
+            )).first()
+            if not exists:
+                conn.execute(text(SEARCH_INDEX_DDL[0]))
+                # Indicizza le credenziali già presenti
+                conn.execute(text("INSERT INTO credentials_fts(credentials_fts) VALUES ('rebuild')"))
+            for ddl in SEARCH_INDEX_DDL[1:]:
+                conn.execute(text(ddl))
+        return True
+    except OperationalError:
+        return False
+
+# 8. MIGRAZIONE DEI DATABASE CREATI DA VERSIONI PRECEDENTI
+def migrate_schema():
+    """Aggiunge e popola le colonne app_key e revision e crea gli indici se mancano"""
+    with engine.begin() as conn:
+        columns = {row[1] for row in conn.execute(text("PRAGMA table_info(credentials)"))}
+        if "app_key" not in columns:
+            conn.execute(text("ALTER TABLE credentials ADD COLUMN app_key VARCHAR"))
+        if "revision" not in columns:
+            # Le credenziali esistenti diventano la revisione 1, così "since=0" le restituisce tutte
+            conn.execute(text("ALTER TABLE credentials ADD COLUMN revision INTEGER NOT NULL DEFAULT 0"))
+            conn.execute(text("UPDATE credentials SET revision = 1"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_credentials_revision ON credentials (revision)"))
+        rows = conn.execute(text("SELECT id, app_name FROM credentials WHERE app_key IS NULL")).all()
+        if rows:
+            conn.execute(
+                text("UPDATE credentials SET app_key = :app_key WHERE id = :id"),
+                [{"id": row.id, "app_key": make_app_key(row.app_name or "")} for row in rows]
+            )
+    with engine.begin() as conn:
+        exists = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'ux_credentials_app_key_username'"
+        )).first()
+        if exists:
+            return
+        # Duplicati (app + username) inseriti da versioni precedenti: senza l'indice
+        # gli INSERT ... ON CONFLICT fallirebbero. Si tiene la credenziale più vecchia,
+        # alle altre si aggiunge l'id allo username: restano leggibili e si possono eliminare
+        duplicates = conn.execute(text(
+            "SELECT id, username FROM credentials AS c WHERE EXISTS ("
+            "SELECT 1 FROM credentials AS o "
+            "WHERE o.app_key = c.app_key AND o.username = c.username AND o.id < c.id)"
+        )).all()
+        if duplicates:
+            conn.execute(
+                text("UPDATE credentials SET username = :username WHERE id = :id"),
+                [{"id": row.id, "username": f"{row.username} (duplicato {row.id})"} for row in duplicates]
+            )
+            logger.warning(
+                "Credenziali duplicate (app + username) nel database %s: rinominate le credenziali con id %s",
+                db_path, ", ".join(str(row.id) for row in duplicates)
+            )
+        conn.execute(text(
+            "CREATE UNIQUE INDEX ux_credentials_app_key_username ON credentials (app_key, username)"
+        ))
+
+# 9. INIZIALIZZAZIONE: eseguita all'avvio (lifespan dell'API, comandi da terminale),
+# non all'import, così importare il modulo non tocca il disco
+FTS_AVAILABLE = False
+_init_lock = threading.Lock()
+_initialized = False
+
+def init_db():
+    """Crea le tabelle, migra lo schema, i trigger delle revisioni e l'indice di ricerca (una volta per processo)"""
+    global FTS_AVAILABLE, _initialized
+    with _init_lock:
+        if _initialized:
+            return
+        Base.metadata.create_all(bind=engine)
+        migrate_schema()
+        create_revision_tracking()
+        FTS_AVAILABLE = create_search_index()
+        _initialized = True
+
+def save_storage_profile(profile_name: str):
+    """Salva il profilo di storage in config: si applica dal prossimo avvio"""
+    if profile_name not in STORAGE_PROFILES:
+        raise ValueError(f"Profilo di storage sconosciuto: {profile_name}")
+    init_db()
+    db = SessionLocal()
+    try:
+        row = db.get(Config, STORAGE_PROFILE_KEY)
+        if row:
+            row.value = profile_name.encode()
+        else:
+            db.add(Config(key=STORAGE_PROFILE_KEY, value=profile_name.encode()))
+        db.commit()
+    finally:
+        db.close()
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Profilo di tuning di SQLite del vault")
+    parser.add_argument("--storage-profile", choices=sorted(STORAGE_PROFILES),
+                        help="Salva il profilo nel vault: verrà applicato al prossimo avvio")
+    args = parser.parse_args(argv)
+
+    if args.storage_profile:
+        save_storage_profile(args.storage_profile)
+        print(f"✅ Profilo salvato: {args.storage_profile}")
+        return 0
+    with engine.connect() as conn:
+        saved = saved_storage_profile(conn.connection.dbapi_connection)
+    print(f"Profilo salvato: {saved or DEFAULT_STORAGE_PROFILE + ' (predefinito)'}")
+    if STORAGE_PROFILE:
+        print(f"PASSWORD_MANAGER_DB_PROFILE per questo processo: {STORAGE_PROFILE}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""Esecutori dedicati al lavoro crittografico pesante (KDF e crittografia in blocco)
+
+Tengono la CPU fuori dall'event loop di main_async1 e dal thread pool di Starlette:
+ogni esecutore ha un numero fisso di thread, quindi anche con molti sblocchi
+contemporanei gli altri endpoint restano reattivi e il lavoro in eccesso resta
+in coda. I contatori (in coda, in esecuzione, attesa media) finiscono in /stats/.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+class CryptoExecutor:
+    """Thread pool limitato con metriche sulla profondità della coda"""
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.peak_queued = 0
+        self.completed = 0
+        self.failed = 0
+        self._wait_time = 0.0
+        self._run_time = 0.0
+
+    def _call(self, submitted_at: float, fn, args: tuple):
+        started = time.perf_counter()
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            self._wait_time += started - submitted_at
+        ok = False
+        try:
+            result = fn(*args)
+            ok = True
+            return result
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+                self.failed += 0 if ok else 1
+                self._run_time += time.perf_counter() - started
+
+    async def run(self, fn, *args):
+        """Esegue fn(*args) su un thread dell'esecutore e ne attende il risultato"""
+        with self._lock:
+            self.queued += 1
+            self.peak_queued = max(self.peak_queued, self.queued)
+        future = self._executor.submit(self._call, time.perf_counter(), fn, args)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # Client disconnesso prima che il lavoro partisse: non resta in coda
+            if future.cancel():
+                with self._lock:
+                    self.queued -= 1
+            raise
+
+    def stats(self) -> dict:
+        with self._lock:
+            done = max(self.completed, 1)
+            return {
+                "workers": self.max_workers,
+                "queued": self.queued,
+                "running": self.running,
+                "peak_queued": self.peak_queued,
+                "completed": self.completed,
+                "failed": self.failed,
+                "avg_wait_ms": round(self._wait_time / done * 1000, 2),
+                "avg_run_ms": round(self._run_time / done * 1000, 2)
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
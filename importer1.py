@@ -0,0 +1,306 @@
+"""Importazione in blocco di credenziali da export CSV/JSON di altri password manager
+
+Uso da terminale:
+    python importer1.py export.csv [--format csv|json|jsonl|pmbackup] [--policy skip|overwrite|error]
+"""
+import argparse
+import csv
+import getpass
+import io
+import json
+import shutil
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import BinaryIO, Callable, Iterable, Iterator, Optional, TextIO
+from urllib.parse import urlparse
+from sqlalchemy import bindparam, tuple_, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+import backup1
+import database1
+import security1
+
+# Righe inserite per ogni transazione
+CHUNK_SIZE = 1000
+FORMATS = ("csv", "json", "jsonl", "pmbackup")
+# Cosa fare se app + username esistono già: saltare, sovrascrivere la password o segnalare errore
+POLICIES = ("skip", "overwrite", "error")
+
+# Nomi di colonna usati da Bitwarden, LastPass, Chrome/Edge/Firefox, KeePass, 1Password
+APP_FIELDS = ("app_name", "name", "title", "account", "login_uri", "url", "uri", "origin")
+USERNAME_FIELDS = ("username", "login_username", "user", "login", "email", "user name")
+PASSWORD_FIELDS = ("password", "login_password", "pass")
+URL_FIELDS = ("login_uri", "url", "uri", "origin")
+
+@dataclass
+class ImportRow:
+    line: int
+    app_name: Optional[str] = None
+    username: Optional[str] = None
+    password: Optional[str] = None
+    created_by: Optional[str] = None
+    error: Optional[str] = None
+
+@dataclass
+class ImportReport:
+    total: int = 0
+    imported: int = 0
+    updated: int = 0
+    skipped: int = 0
+    errors: list = field(default_factory=list)
+
+    def as_dict(self) -> dict:
+        return {
+            "total": self.total,
+            "imported": self.imported,
+            "updated": self.updated,
+            "skipped": self.skipped,
+            "errors": [{"line": line, "error": error} for line, error in self.errors]
+        }
+
+def _first(record: dict, names: tuple) -> Optional[str]:
+    for name in names:
+        value = record.get(name)
+        if isinstance(value, str) and value.strip():
+            return value.strip()
+    return None
+
+def _app_from_url(url: str) -> str:
+    host = urlparse(url if "://" in url else f"https://{url}").hostname or url
+    host = host.removeprefix("www.")
+    # "accounts.google.com" -> "google"
+    parts = host.split(".")
+    return parts[-2] if len(parts) >= 2 else host
+
+def _normalize(record: dict, line: int) -> ImportRow:
+    """Trasforma un record di un export qualsiasi in una riga da importare"""
+    # Formato JSON di Bitwarden: {"name": ..., "login": {"username", "password", "uris": [{"uri"}]}}
+    login = record.get("login")
+    if isinstance(login, dict):
+        uris = login.get("uris") or []
+        record = {
+            "name": record.get("name"),
+            "username": login.get("username"),
+            "password": login.get("password"),
+            "url": uris[0].get("uri") if uris and isinstance(uris[0], dict) else None
+        }
+    record = {str(key).strip().lower(): value for key, value in record.items() if key is not None}
+
+    app_name = _first(record, APP_FIELDS)
+    if app_name and app_name == _first(record, URL_FIELDS):
+        app_name = _app_from_url(app_name)
+    row = ImportRow(
+        line=line,
+        app_name=app_name,
+        username=_first(record, USERNAME_FIELDS),
+        password=_first(record, PASSWORD_FIELDS)
+    )
+    if not row.app_name:
+        row.error = "Nome applicazione mancante"
+    elif not row.username:
+        row.error = "Username mancante"
+    return row
+
+def parse_export(stream: TextIO, fmt: str) -> Iterator[ImportRow]:
+    """Legge l'export riga per riga (CSV e JSON Lines senza caricarlo tutto in memoria)"""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield _normalize(record, reader.line_num)
+    elif fmt == "jsonl":
+        for line, text_line in enumerate(stream, start=1):
+            if not text_line.strip():
+                continue
+            try:
+                record = json.loads(text_line)
+            except json.JSONDecodeError as e:
+                yield ImportRow(line=line, error=f"JSON non valido: {e.msg}")
+                continue
+            yield _normalize(record, line)
+    elif fmt == "json":
+        # Un documento JSON unico va letto per intero (export Bitwarden o lista di oggetti)
+        document = json.load(stream)
+        items = document.get("items", []) if isinstance(document, dict) else document
+        for index, record in enumerate(items, start=1):
+            if isinstance(record, dict) and record.get("type", 1) == 1:
+                yield _normalize(record, index)
+    else:
+        raise ValueError(f"Formato non supportato: {fmt}")
+
+def parse_backup(stream: BinaryIO, passphrase: str) -> Iterator[ImportRow]:
+    """Legge un backup creato da backup1 (anche di un vault con un'altra master password).
+
+    L'intero file viene autenticato prima della prima riga: un backup troncato o
+    alterato non importa nulla, invece delle righe dei blocchi precedenti al danno.
+    """
+    if not stream.seekable():
+        # Es. standard input: copia su file temporaneo (in memoria fino a 8 MB) per la doppia lettura
+        spooled = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+        shutil.copyfileobj(stream, spooled)
+        spooled.seek(0)
+        stream = spooled
+    for line, record in enumerate(backup1.read_archive(stream, passphrase, verify_first=True), start=1):
+        row = _normalize(record, line)
+        row.created_by = record.get("created_by")
+        yield row
+
+def _chunks(rows: Iterable[ImportRow], size: int) -> Iterator[list]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _import_chunk(db: Session, chunk: list, key: bytes, created_by: str, policy: str, report: ImportReport):
+    valid = {}
+    for row in chunk:
+        report.total += 1
+        if row.error:
+            report.errors.append((row.line, row.error))
+            continue
+        row.app_name = row.app_name.capitalize()
+        pair = (database1.make_app_key(row.app_name), row.username)
+        if pair in valid:
+            report.errors.append((row.line, f"Duplicato della riga {valid[pair].line}"))
+            continue
+        valid[pair] = row
+    if not valid:
+        return
+
+    # Un solo SELECT per blocco per trovare le coppie già presenti
+    existing = dict(
+        ((app_key, username), credential_id)
+        for credential_id, app_key, username in db.query(
+            database1.Credential.id, database1.Credential.app_key, database1.Credential.username
+        ).filter(tuple_(database1.Credential.app_key, database1.Credential.username).in_(list(valid)))
+    )
+    if policy == "skip":
+        report.skipped += len(existing)
+    elif policy == "error":
+        for pair in existing:
+            report.errors.append((valid[pair].line, "Credenziale già esistente"))
+    to_write = {pair: row for pair, row in valid.items() if pair not in existing or policy == "overwrite"}
+    if not to_write:
+        return
+
+    # Password mancanti generate come fa POST /credentials/, poi crittografia in blocco
+    rows = list(to_write.items())
+    passwords = [row.password or security1.generate_strong_password() for _, row in rows]
+    encrypted = security1.encrypt_passwords(passwords, key)
+
+    inserts = []
+    updates = []
+    for (pair, row), token in zip(rows, encrypted):
+        if pair in existing:
+            updates.append({"credential_id": existing[pair], "encrypted_password": token})
+        else:
+            inserts.append({
+                "app_name": row.app_name,
+                "app_key": pair[0],
+                "username": row.username,
+                "created_by": (row.created_by or created_by).capitalize(),
+                "encrypted_password": token
+            })
+    table = database1.Credential.__table__
+    if inserts:
+        # executemany; ON CONFLICT protegge da inserimenti concorrenti dopo il SELECT
+        result = db.execute(
+            sqlite_insert(table).on_conflict_do_nothing(index_elements=["app_key", "username"]),
+            inserts
+        )
+        inserted = result.rowcount if result.rowcount >= 0 else len(inserts)
+        report.imported += inserted
+        report.skipped += len(inserts) - inserted
+    if updates:
+        db.execute(
+            update(table)
+            .where(table.c.id == bindparam("credential_id"))
+            .values(encrypted_password=bindparam("encrypted_password")),
+            updates
+        )
+        report.updated += len(updates)
+
+def import_credentials(
+    db: Session,
+    rows: Iterable[ImportRow],
+    key: bytes,
+    created_by: str = "Import",
+    policy: str = "skip",
+    chunk_size: int = CHUNK_SIZE,
+    progress: Optional[Callable[[ImportReport], None]] = None
+) -> ImportReport:
+    """Importa le righe a blocchi, una transazione per blocco"""
+    if policy not in POLICIES:
+        raise ValueError(f"Politica duplicati non valida: {policy}")
+    created_by = created_by.capitalize()
+    report = ImportReport()
+    for chunk in _chunks(rows, chunk_size):
+        try:
+            _import_chunk(db, chunk, key, created_by, policy, report)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        if progress:
+            progress(report)
+    return report
+
+def main(argv: Optional[list] = None) -> int:
+    import vault1
+
+    parser = argparse.ArgumentParser(description="Importa credenziali da un export CSV/JSON")
+    parser.add_argument("file", help="File di export (usa - per lo standard input)")
+    parser.add_argument("--format", choices=FORMATS, help="Formato (dedotto dall'estensione se omesso)")
+    parser.add_argument("--policy", choices=POLICIES, default="skip", help="Gestione dei duplicati")
+    parser.add_argument("--created-by", default="Import", help="Autore da assegnare alle credenziali")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    fmt = args.format or args.file.rsplit(".", 1)[-1].lower()
+    if fmt not in FORMATS:
+        parser.error("impossibile dedurre il formato, usa --format")
+
+    database1.init_db()
+    db = database1.SessionLocal()
+    try:
+        key = vault1.unlock(db, getpass.getpass("🔑 Master Password: "))
+        if key is None:
+            print("❌ Master password errata", file=sys.stderr)
+            return 1
+
+        started = time.perf_counter()
+
+        def progress(report: ImportReport):
+            rate = report.total / max(time.perf_counter() - started, 1e-9)
+            print(f"\r⏳ {report.total} righe lette, {report.imported} importate ({rate:,.0f} righe/s)", end="", flush=True)
+
+        binary = sys.stdin.buffer if args.file == "-" else open(args.file, "rb")
+        if fmt == "pmbackup":
+            stream = binary
+            rows = parse_backup(stream, getpass.getpass("🔒 Passphrase del backup: "))
+        else:
+            stream = io.TextIOWrapper(binary, encoding="utf-8-sig", newline="")
+            rows = parse_export(stream, fmt)
+        with stream:
+            report = import_credentials(
+                db, rows, key,
+                created_by=args.created_by, policy=args.policy,
+                chunk_size=args.chunk_size, progress=progress
+            )
+    finally:
+        db.close()
+
+    print()
+    print(f"✅ Importate: {report.imported}  Aggiornate: {report.updated}  "
+          f"Saltate: {report.skipped}  Errori: {len(report.errors)}")
+    for line, error in report.errors:
+        print(f"   riga {line}: {error}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+"""Funzioni di derivazione delle chiavi (KDF) intercambiabili: Argon2id, scrypt, PBKDF2
+
+I parametri viaggiano insieme al risultato, in una stringa in stile PHC:
+    $argon2id$m=65536,t=3,p=4$<salt>$<hash>
+così ogni vault sa con quale costo è stato creato e può passare a un altro
+algoritmo (o a parametri più pesanti) al primo login riuscito.
+
+Uso da terminale (misura i tempi su questa macchina e propone i parametri):
+    python kdf1.py --target 0.25 [--kdf argon2id] [--save]
+"""
+import argparse
+import base64
+import os
+import statistics
+import sys
+import time
+from dataclasses import dataclass
+from typing import Optional
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt as _Scrypt
+import metrics1
+
+try:
+    from cryptography.hazmat.primitives.kdf.argon2 import Argon2id as _Argon2id
+except ImportError:  # cryptography < 44
+    _Argon2id = None
+
+# Chiave di Config con i parametri scelti per il vault (vedi --save)
+POLICY_KEY = "kdf_policy"
+# Memoria massima proposta dalla calibrazione per Argon2id (KiB): oltre si aumentano i passaggi
+MAX_MEMORY_KIB = 256 * 1024
+
+def _b64encode(data: bytes) -> str:
+    return base64.b64encode(data).decode().rstrip("=")
+
+def _b64decode(text: str) -> bytes:
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+class Kdf:
+    """Base comune: name e parametri (i campi del dataclass) identificano la KDF"""
+    name = ""
+    # Nome del parametro nella stringa PHC -> campo del dataclass
+    phc_params: dict = {}
+
+    def derive(self, password: bytes, salt: bytes, length: int = 32) -> bytes:
+        raise NotImplementedError
+
+    def spec(self) -> str:
+        """Algoritmo e parametri senza salt né hash, es. "$scrypt$ln=17,r=8,p=1" """
+        params = ",".join(f"{phc}={getattr(self, attr)}" for phc, attr in self.phc_params.items())
+        return f"${self.name}${params}"
+
+    def encode(self, salt: bytes, digest: bytes) -> str:
+        return f"{self.spec()}${_b64encode(salt)}${_b64encode(digest)}"
+
+@dataclass(frozen=True)
+class Pbkdf2(Kdf):
+    iterations: int = 600_000
+
+    name = "pbkdf2-sha256"
+    phc_params = {"i": "iterations"}
+
+    def derive(self, password: bytes, salt: bytes, length: int = 32) -> bytes:
+        return PBKDF2HMAC(hashes.SHA256(), length, salt, self.iterations).derive(password)
+
+@dataclass(frozen=True)
+class Scrypt(Kdf):
+    log_n: int = 17
+    block_size: int = 8
+    parallelism: int = 1
+
+    name = "scrypt"
+    phc_params = {"ln": "log_n", "r": "block_size", "p": "parallelism"}
+
+    def derive(self, password: bytes, salt: bytes, length: int = 32) -> bytes:
+        return _Scrypt(salt, length, 2 ** self.log_n, self.block_size, self.parallelism).derive(password)
+
+@dataclass(frozen=True)
+class Argon2id(Kdf):
+    memory_cost: int = 65536
+    iterations: int = 3
+    lanes: int = 4
+
+    name = "argon2id"
+    phc_params = {"m": "memory_cost", "t": "iterations", "p": "lanes"}
+
+    def derive(self, password: bytes, salt: bytes, length: int = 32) -> bytes:
+        return _Argon2id(
+            salt=salt, length=length, iterations=self.iterations,
+            lanes=self.lanes, memory_cost=self.memory_cost
+        ).derive(password)
+
+KDFS = {cls.name: cls for cls in (Argon2id, Scrypt, Pbkdf2)}
+if _Argon2id is None:
+    del KDFS[Argon2id.name]
+
+# Parametri usati prima che esistessero le KDF intercambiabili (hash e chiavi senza spec)
+LEGACY = Pbkdf2(480_000)
+DEFAULT = Argon2id() if Argon2id.name in KDFS else Scrypt()
+
+# Servizio che esegue le derivazioni dell'API (kdfpool1.KdfPool); None = nel thread chiamante
+_service = None
+
+def install_service(service):
+    global _service
+    _service = service
+
+def derive(kdf: Kdf, password: bytes, salt: bytes, length: int = 32) -> bytes:
+    """Derivazione passando dal servizio installato, se c'è (la durata misurata comprende l'attesa nel pool)"""
+    with metrics1.KDF_SECONDS.time(algorithm=kdf.name):
+        if _service is not None:
+            return _service.derive(kdf, password, salt, length)
+        return kdf.derive(password, salt, length)
+
+def parse(spec: str) -> Kdf:
+    """Ricostruisce la KDF da una spec o da un hash PHC completo"""
+    parts = spec.split("$")
+    if len(parts) < 3 or parts[0] != "" or parts[1] not in KDFS:
+        raise ValueError(f"KDF non supportata: {spec[:32]!r}")
+    cls = KDFS[parts[1]]
+    values = dict(item.split("=", 1) for item in parts[2].split(",") if item)
+    return cls(**{attr: int(values[phc]) for phc, attr in cls.phc_params.items()})
+
+def decode(encoded: str) -> tuple:
+    """Divide un hash PHC in (kdf, salt, hash)"""
+    parts = encoded.split("$")
+    if len(parts) != 5:
+        raise ValueError("Hash non valido")
+    return parse(encoded), _b64decode(parts[3]), _b64decode(parts[4])
+
+def benchmark(kdf: Kdf, rounds: int = 3) -> float:
+    """Tempo mediano (secondi) di una derivazione"""
+    salt = os.urandom(16)
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        kdf.derive(b"calibration", salt)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+def calibrate(name: str, target: float) -> Kdf:
+    """Sceglie i parametri più pesanti che restano entro target secondi per derivazione.
+
+    Non scende mai sotto i parametri predefiniti: su hardware lento si sfora il target.
+    """
+    if name == Pbkdf2.name:
+        # Il costo di PBKDF2 è lineare nelle iterazioni: basta una misura
+        sample = Pbkdf2(100_000)
+        iterations = int(sample.iterations * target / benchmark(sample)) // 10_000 * 10_000
+        return Pbkdf2(max(iterations, Pbkdf2.iterations))
+    if name == Scrypt.name:
+        kdf = Scrypt()
+        while kdf.log_n < 22 and benchmark(Scrypt(kdf.log_n + 1)) <= target:
+            kdf = Scrypt(kdf.log_n + 1)
+        return kdf
+    if name == Argon2id.name and name in KDFS:
+        lanes = min(4, os.cpu_count() or 1)
+        kdf = Argon2id(lanes=lanes)
+        # Prima più memoria (è ciò che rallenta gli attacchi con GPU), poi più passaggi
+        while kdf.memory_cost * 2 <= MAX_MEMORY_KIB:
+            heavier = Argon2id(kdf.memory_cost * 2, kdf.iterations, lanes)
+            if benchmark(heavier) > target:
+                return kdf
+            kdf = heavier
+        while benchmark(Argon2id(kdf.memory_cost, kdf.iterations + 1, lanes)) <= target:
+            kdf = Argon2id(kdf.memory_cost, kdf.iterations + 1, lanes)
+        return kdf
+    raise ValueError(f"KDF non supportata: {name}")
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Calibra la KDF della master password su questa macchina")
+    parser.add_argument("--target", type=float, default=0.25,
+                        help="Secondi per derivazione (lo sblocco ne esegue una)")
+    parser.add_argument("--kdf", choices=sorted(KDFS), help="Calibra solo questo algoritmo")
+    parser.add_argument("--save", action="store_true",
+                        help="Salva i parametri nel vault: verranno applicati al prossimo login")
+    args = parser.parse_args(argv)
+
+    chosen = None
+    for name in [args.kdf] if args.kdf else list(KDFS):
+        kdf = calibrate(name, args.target)
+        print(f"{kdf.spec():<40} {benchmark(kdf) * 1000:8.1f} ms")
+        chosen = chosen or kdf
+
+    if args.save:
+        import database1
+        database1.init_db()
+        db = database1.SessionLocal()
+        try:
+            row = db.get(database1.Config, POLICY_KEY)
+            if row:
+                row.value = chosen.spec().encode()
+            else:
+                db.add(database1.Config(key=POLICY_KEY, value=chosen.spec().encode()))
+            db.commit()
+        finally:
+            db.close()
+        print(f"✅ Parametri salvati: {chosen.spec()}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
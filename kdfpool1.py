@@ -0,0 +1,138 @@
+"""Servizio per le derivazioni delle chiavi: pool di processi, coalescenza e controllo di ammissione
+
+Tutte le derivazioni di security1 (verifica dell'hash, chiave che avvolge la chiave
+dei dati) passano da kdf1.derive e, se il servizio è installato, da KdfPool:
+
+* in modalità "thread" (predefinita) la derivazione gira nel thread della
+  richiesta, uno del thread pool di FastAPI: cryptography rilascia il GIL durante
+  Argon2id, scrypt e PBKDF2, quindi più sblocchi contemporanei usano già più core;
+* con PASSWORD_MANAGER_KDF_POOL=process le derivazioni girano su un pool di
+  processi grande quanto i core (password e salt viaggiano verso i processi figli
+  sulla pipe locale). È una scelta esplicita: un interprete in più per core da
+  avviare e tenere in memoria, utile solo se il GIL diventa il collo di bottiglia;
+* derivazioni identiche in corso nello stesso momento (stessa password, salt e
+  parametri, es. doppio clic su "Accedi") condividono un solo calcolo;
+* admit() limita gli sblocchi in corso: oltre il limite l'API risponde 429 con
+  Retry-After invece di accumulare latenza senza fine.
+"""
+import atexit
+import hashlib
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
+import kdf1
+
+# Finestra (secondi) su cui si calcolano le derivazioni al secondo
+THROUGHPUT_WINDOW = 60
+
+class KdfBusy(Exception):
+    """Troppi sblocchi in corso: riprovare dopo retry_after secondi"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Troppi sblocchi in corso, riprova tra {retry_after}s")
+        self.retry_after = retry_after
+
+def _derive(kdf: kdf1.Kdf, password: bytes, salt: bytes, length: int) -> bytes:
+    return kdf.derive(password, salt, length)
+
+class KdfPool:
+    """Esegue le derivazioni (in processi separati o nel thread chiamante) con metriche"""
+
+    def __init__(self, workers: int, max_unlocks: int, use_processes: bool = False):
+        self.workers = workers
+        self.max_unlocks = max_unlocks
+        self.use_processes = use_processes
+        self._pool = None
+        if use_processes:
+            self._pool = ProcessPoolExecutor(max_workers=workers)
+            atexit.register(self.shutdown)
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._completions = deque(maxlen=10000)
+        self.unlocks = 0
+        self.derivations = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self._derive_time = 0.0
+
+    @classmethod
+    def from_env(cls) -> "KdfPool":
+        use_processes = os.environ.get("PASSWORD_MANAGER_KDF_POOL", "thread") == "process"
+        workers = os.cpu_count() or 1
+        max_unlocks = int(os.environ.get("PASSWORD_MANAGER_MAX_UNLOCKS", workers * 4))
+        return cls(workers, max_unlocks, use_processes)
+
+    @contextmanager
+    def admit(self):
+        """Conta uno sblocco in corso; solleva KdfBusy se il limite è già raggiunto"""
+        with self._lock:
+            if self.unlocks >= self.max_unlocks:
+                self.rejected += 1
+                raise KdfBusy(self._retry_after())
+            self.unlocks += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.unlocks -= 1
+
+    def _retry_after(self) -> int:
+        # Tempo per smaltire gli sblocchi in coda (una derivazione ciascuno)
+        average = self._derive_time / self.derivations if self.derivations else 0.5
+        return max(1, math.ceil(self.unlocks * average / self.workers))
+
+    def derive(self, kdf: kdf1.Kdf, password: bytes, salt: bytes, length: int) -> bytes:
+        """Derivazione bloccante, condivisa con eventuali richieste identiche in corso"""
+        request_key = hashlib.sha256(b"\0".join([kdf.spec().encode(), salt, str(length).encode(), password])).digest()
+        with self._lock:
+            future = self._inflight.get(request_key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[request_key] = future
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+
+        started = time.perf_counter()
+        try:
+            if self._pool is not None:
+                result = self._pool.submit(_derive, kdf, password, salt, length).result()
+            else:
+                result = _derive(kdf, password, salt, length)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[request_key]
+                self.derivations += 1
+                self._derive_time += time.perf_counter() - started
+                self._completions.append(time.monotonic())
+
+    def stats(self) -> dict:
+        with self._lock:
+            horizon = time.monotonic() - THROUGHPUT_WINDOW
+            recent = sum(1 for completed_at in self._completions if completed_at >= horizon)
+            return {
+                "mode": "process" if self.use_processes else "thread",
+                "workers": self.workers,
+                "unlocks_in_progress": self.unlocks,
+                "max_unlocks": self.max_unlocks,
+                "derivations": self.derivations,
+                "derivations_per_second": round(recent / THROUGHPUT_WINDOW, 2),
+                "avg_derive_ms": round(self._derive_time / max(self.derivations, 1) * 1000, 1),
+                "coalesced": self.coalesced,
+                "rejected": self.rejected
+            }
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Union
+
+# Numero massimo di chiavi tenute in memoria contemporaneamente
+MAX_KEYS = 64
+# Dopo quanti secondi senza essere usata una chiave viene cancellata
+KEY_TTL = 15 * 60
+
+def wipe_buffer(buffer: bytearray):
+    """Sovrascrive con zeri il contenuto del buffer (in place)"""
+    buffer[:] = bytes(len(buffer))
+
+class KeyVault:
+    """Cache in memoria delle chiavi derivate, una per sessione autenticata.
+
+    Le chiavi sono tenute in bytearray così da poterle azzerare al logout,
+    alla scadenza o quando vengono espulse (LRU). La scadenza si rinnova a ogni
+    get(): una chiave non usata per ttl secondi viene azzerata, da get() o da
+    purge_expired() chiamata periodicamente. Le copie restituite da get()
+    sono bytes immutabili richiesti da Fernet e vivono solo per la richiesta.
+    """
+
+    def __init__(self, max_keys: int = MAX_KEYS, ttl: float = KEY_TTL):
+        self.max_keys = max_keys
+        self.ttl = ttl
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def put(self, session_id: str, key: Union[bytes, tuple]):
+        """Salva la chiave (o le chiavi, durante una rotazione) della sessione,
+        espellendo la meno usata se piena"""
+        with self._lock:
+            self._drop(session_id)
+            buffers = tuple(bytearray(k) for k in key) if isinstance(key, tuple) else bytearray(key)
+            self._keys[session_id] = (buffers, time.monotonic() + self.ttl)
+            while len(self._keys) > self.max_keys:
+                oldest = next(iter(self._keys))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def get(self, session_id: str) -> Optional[Union[bytes, tuple]]:
+        """Restituisce la chiave della sessione, o None se assente o scaduta"""
+        with self._lock:
+            entry = self._keys.get(session_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            buffer, expires_at = entry
+            now = time.monotonic()
+            if now > expires_at:
+                self._drop(session_id)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._keys[session_id] = (buffer, now + self.ttl)
+            self._keys.move_to_end(session_id)
+            self.hits += 1
+            if isinstance(buffer, tuple):
+                return tuple(bytes(b) for b in buffer)
+            return bytes(buffer)
+
+    def wipe(self, session_id: str):
+        """Azzera e rimuove la chiave di una sessione (logout)"""
+        with self._lock:
+            self._drop(session_id)
+
+    def wipe_all(self):
+        """Azzera e rimuove tutte le chiavi"""
+        with self._lock:
+            for session_id in list(self._keys):
+                self._drop(session_id)
+
+    def purge_expired(self) -> int:
+        """Azzera le chiavi non usate da più di ttl secondi e restituisce quante erano"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [session_id for session_id, (_, expires_at) in self._keys.items() if now > expires_at]
+            for session_id in expired:
+                self._drop(session_id)
+            self.expirations += len(expired)
+        return len(expired)
+
+    def stats(self) -> dict:
+        self.purge_expired()
+        with self._lock:
+            return {
+                "size": len(self._keys),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+
+    def _drop(self, session_id: str):
+        entry = self._keys.pop(session_id, None)
+        if entry is None:
+            return
+        buffers = entry[0] if isinstance(entry[0], tuple) else (entry[0],)
+        for buffer in buffers:
+            wipe_buffer(buffer)
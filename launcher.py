@@ -1,9 +1,30 @@
+import multiprocessing
+import secrets
+import subprocess
 import threading
-import uvicorn
+import time
 import sys
 import os
-from streamlit.web import cli as stcli
-import main1  # Importa il tuo file FastAPI
+import client1
+import startup1
+
+# Streamlit, uvicorn e il backend vengono importati solo dal processo (o thread) che li usa:
+# il processo dell'API non carica Streamlit e in modalità thread i due import procedono in parallelo
+
+# Numero di processi uvicorn per l'API: con 1 (default) l'API gira in un thread come prima,
+# con più worker le sessioni passano dal database (vedi sessions1.SharedSessionStore)
+WORKERS = int(os.environ.get("PASSWORD_MANAGER_WORKERS", "1"))
+# Trasporto tra interfaccia e API: tcp, uds (socket Unix) o inprocess (nessuna API separata)
+TRANSPORT = client1.TRANSPORT
+# Attesa massima perché l'API risponda prima di avviare l'interfaccia
+READY_TIMEOUT = 30
+# Sorveglianza: un controllo ogni HEALTH_INTERVAL secondi, riavvio dopo HEALTH_FAILURES errori di fila
+HEALTH_INTERVAL = 5
+HEALTH_FAILURES = 3
+# Secondi concessi alle richieste in corso alla chiusura
+SHUTDOWN_TIMEOUT = 10
+# Log di uvicorn (con "info" anche una riga per richiesta); le latenze sono in /metrics
+LOG_LEVEL = os.environ.get("PASSWORD_MANAGER_LOG_LEVEL", "error")
 
 def resolve_path(path):
     if getattr(sys, "frozen", False):
@@ -12,11 +33,119 @@ def resolve_path(path):
         basedir = os.path.dirname(__file__)
     return os.path.join(basedir, path)
 
+def _api_target() -> str:
+    # Variante asincrona con PASSWORD_MANAGER_API=async
+    return "main_async1:app" if os.environ.get("PASSWORD_MANAGER_API") == "async" else "main1:app"
+
+def _bind() -> dict:
+    # Indirizzo dell'API per uvicorn: porta di loopback o socket Unix
+    if TRANSPORT != "uds":
+        return {"host": "127.0.0.1", "port": 8000}
+    prepare_socket_dir(os.path.dirname(client1.SOCKET_PATH))
+    if os.path.exists(client1.SOCKET_PATH):
+        os.remove(client1.SOCKET_PATH)  # Socket rimasto da un avvio precedente
+    return {"uds": client1.SOCKET_PATH}
+
+def prepare_socket_dir(path: str):
+    # uvicorn crea il socket con permessi 0666: l'accesso lo limita la cartella (0700, dell'utente)
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.stat(path)
+    if info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise RuntimeError(f"La cartella del socket {path} deve appartenere all'utente e avere permessi 0700")
+
 def run_api():
     # Avvia FastAPI su una porta specifica
-    uvicorn.run(main1.app, host="127.0.0.1", port=8000, log_level="error")
+    with startup1.phase("import uvicorn"):
+        import uvicorn
+    uvicorn.run(_api_target(), log_level=LOG_LEVEL, **_bind())
+
+def run_api_workers():
+    # Processo supervisore di uvicorn: avvia i worker e alla chiusura attende le richieste in corso
+    import uvicorn
+    uvicorn.run(
+        _api_target(), log_level=LOG_LEVEL,
+        workers=WORKERS, timeout_graceful_shutdown=SHUTDOWN_TIMEOUT, **_bind()
+    )
+
+def is_healthy() -> bool:
+    client = client1.connect(TRANSPORT, timeout=2, retries=0)
+    try:
+        return client.health()
+    finally:
+        client.close()
+
+def wait_until_ready(is_alive) -> bool:
+    # Handshake di avvio: l'interfaccia parte solo quando l'API risponde
+    deadline = time.monotonic() + READY_TIMEOUT
+    while time.monotonic() < deadline and is_alive():
+        if is_healthy():
+            return True
+        time.sleep(0.2)
+    return False
+
+def _start_api_process(session_secret: str) -> subprocess.Popen:
+    # Il supervisore di uvicorn è un processo a sé (launcher --api): i suoi worker
+    # non possono nascere da un figlio di multiprocessing, che chiude lo stdin.
+    # Il segreto delle sessioni va solo nel suo ambiente, non in quello del launcher (e di Streamlit)
+    if getattr(sys, "frozen", False):
+        command = [sys.executable, "--api"]
+    else:
+        command = [sys.executable, os.path.abspath(__file__), "--api"]
+    process = subprocess.Popen(command, env={**os.environ, "PASSWORD_MANAGER_SESSION_SECRET": session_secret})
+    if not wait_until_ready(lambda: process.poll() is None):
+        _stop(process)
+        raise RuntimeError("L'API non risponde a /health/")
+    return process
+
+def _stop(process: subprocess.Popen):
+    # SIGTERM: uvicorn smette di accettare connessioni e completa quelle in corso
+    process.terminate()
+    try:
+        process.wait(SHUTDOWN_TIMEOUT + 5)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+def _watch_api(api: dict, stopping: threading.Event):
+    # Riavvia l'API se smette di rispondere (o termina) per HEALTH_FAILURES controlli di fila
+    failures = 0
+    while not stopping.wait(HEALTH_INTERVAL):
+        failures = 0 if api["process"].poll() is None and is_healthy() else failures + 1
+        if failures >= HEALTH_FAILURES and not stopping.is_set():
+            _stop(api["process"])
+            api["process"] = _start_api_process(api["session_secret"])
+            failures = 0
+
+def run_multiprocess():
+    # Schema e migrazioni una volta sola, prima che i worker li eseguano in parallelo nel lifespan
+    import database1
+    with startup1.phase("schema del database"):
+        database1.init_db()
+    # Segreto dell'avvio: cifra le chiavi delle sessioni condivise. Resta lo stesso se
+    # l'API viene riavviata, così le sessioni aperte sopravvivono al riavvio
+    session_secret = secrets.token_hex(32)
+    with startup1.phase("api pronta"):
+        api = {"process": _start_api_process(session_secret), "session_secret": session_secret}
+    stopping = threading.Event()
+    watcher = threading.Thread(target=_watch_api, args=(api, stopping), daemon=True)
+    watcher.start()
+    try:
+        run_streamlit()
+    finally:
+        stopping.set()
+        watcher.join()
+        _stop(api["process"])
+
+def _import_streamlit():
+    with startup1.phase("import streamlit"):
+        from streamlit.web import cli as stcli
+    return stcli
 
 def run_streamlit():
+    stcli = _import_streamlit()
+    if startup1.PROFILE:
+        print(startup1.report(startup1.phases()), file=sys.stderr)
+
     # Costruiamo il percorso assoluto per app1.py
     app_path = resolve_path("app1.py")
     
@@ -31,9 +160,26 @@ def run_streamlit():
     sys.exit(stcli.main())
 
 if __name__ == "__main__":
-    # 1. Avvia il backend in un thread separato (daemon=True così si chiude quando chiudi l'app)
-    api_thread = threading.Thread(target=run_api, daemon=True)
-    api_thread.start()
+    # Necessario per il pool di processi delle KDF nell'eseguibile (PASSWORD_MANAGER_KDF_POOL=process)
+    multiprocessing.freeze_support()
+
+    if "--api" in sys.argv:
+        # Processo dell'API avviato da run_multiprocess()
+        run_api_workers()
+    elif TRANSPORT == "inprocess":
+        # L'interfaccia chiama direttamente main1 (client1.InProcessClient): nessun server
+        run_streamlit()
+    elif WORKERS > 1:
+        # Più processi per l'API, sorvegliati dal launcher
+        run_multiprocess()
+    else:
+        # 1. Avvia il backend in un thread separato (daemon=True così si chiude quando chiudi l'app)
+        api_thread = threading.Thread(target=run_api, daemon=True)
+        api_thread.start()
+        # Streamlit si carica mentre l'API si avvia
+        _import_streamlit()
+        with startup1.phase("api pronta"):
+            wait_until_ready(api_thread.is_alive)
 
-    # 2. Avvia Streamlit nel thread principale (è bloccante)
-    run_streamlit()
\ No newline at end of file
+        # 2. Avvia Streamlit nel thread principale (è bloccante)
+        run_streamlit()
\ No newline at end of file
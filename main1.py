@@ -1,28 +1,136 @@
 import re
+import io
+import json
+import tempfile
+import threading
+from contextlib import asynccontextmanager, contextmanager
 from cryptography.fernet import InvalidToken
-from fastapi import FastAPI, Depends, HTTPException, Header
+from fastapi import FastAPI, Depends, HTTPException, Header, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from sqlalchemy import bindparam, select, text, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
 from pydantic import BaseModel, field_validator
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
+import appindex1
 import database1
+import kdf1
+import kdfpool1
+import keyvault1
+import metrics1
+import profiler1
+import rotation1
+import search1
 import security1
+import sessions1
+import startup1
+import vault1
 import os
 
-app = FastAPI()
-
-# Inizializzazione del salt al primo avvio
-db = database1.SessionLocal()
-try:
-    db_config = db.query(database1.Config).filter(database1.Config.key == "encryption_salt").first()
-    if not db_config:
-        SALT = os.urandom(16)
-        new_config = database1.Config(key="encryption_salt", value=SALT)
-        db.add(new_config)
-        db.commit()
-    else:
-        SALT = db_config.value
-finally:
-    db.close()
+if TYPE_CHECKING:
+    import importer1
+
+# Avvio: database e salt vengono preparati qui e non all'import del modulo.
+# importer1 e backup1 (solo /import/ e /export/) sono importati alla prima richiesta.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup()
+    yield
+    sweeper.stop()
+    profiler.stop()
+    kdf_pool.shutdown()
+
+class TimedJSONResponse(JSONResponse):
+    """JSONResponse che misura la codifica del corpo (pm_serialize_seconds)"""
+
+    def render(self, content) -> bytes:
+        with metrics1.serialize_timer():
+            return super().render(content)
+
+app = FastAPI(lifespan=lifespan, default_response_class=TimedJSONResponse)
+app.add_middleware(metrics1.MetricsMiddleware)
+
+# Righe lette dal database per ogni blocco nella risposta NDJSON
+STREAM_BATCH_SIZE = 500
+# Modifiche restituite al massimo da una chiamata a /changes/ (le altre con "more": true)
+CHANGES_LIMIT = 1000
+
+# Chiavi derivate, una per sessione: azzerate al logout, alla scadenza della
+# sessione o dopo lo stesso tempo di inattività
+keyvault = keyvault1.KeyVault(ttl=sessions1.SESSION_IDLE_TIMEOUT)
+# Sessioni attive (token emessi da /login/). Con più worker (launcher con
+# PASSWORD_MANAGER_WORKERS > 1) stanno nel database, cifrate con il segreto dell'avvio
+SESSION_SECRET = os.environ.get("PASSWORD_MANAGER_SESSION_SECRET")
+if SESSION_SECRET:
+    sessions = sessions1.SharedSessionStore(bytes.fromhex(SESSION_SECRET), on_close=keyvault.wipe)
+else:
+    sessions = sessions1.SessionStore(on_close=keyvault.wipe)
+# Chiude le sessioni scadute e azzera le chiavi inutilizzate anche senza richieste
+sweeper = sessions1.Sweeper(sessions.sweep, keyvault.purge_expired)
+# Elenco app mantenuto dagli endpoint di scrittura, riletto quando cambia la revisione del vault
+app_index = appindex1.AppIndex()
+# Derivazioni della master password: pool opzionale, coalescenza e limite agli sblocchi
+kdf_pool = kdfpool1.KdfPool.from_env()
+kdf1.install_service(kdf_pool)
+
+# Profiler a campionamento: spento, si accende da /profiler/ o con PASSWORD_MANAGER_PROFILER=1
+profiler = profiler1.SamplingProfiler()
+
+def _cache_metrics():
+    # Contatori delle cache letti al momento della richiesta a /metrics
+    vault = keyvault.stats()
+    pool = kdf_pool.stats()
+    return [
+        ("pm_keyvault_lookups_total", "counter", "Ricerche nel key vault, per esito",
+         {(("result", "hit"),): vault["hits"], (("result", "miss"),): vault["misses"]}),
+        ("pm_keyvault_evictions_total", "counter", "Chiavi rimosse dal key vault per fare spazio",
+         {(): vault["evictions"]}),
+        ("pm_keyvault_size", "gauge", "Chiavi presenti nel key vault", {(): vault["size"]}),
+        ("pm_kdf_derivations_total", "counter", "Derivazioni eseguite dal pool", {(): pool["derivations"]}),
+        ("pm_kdf_coalesced_total", "counter", "Derivazioni evitate unendo richieste identiche",
+         {(): pool["coalesced"]}),
+        ("pm_kdf_rejected_total", "counter", "Sblocchi rifiutati con 429", {(): pool["rejected"]}),
+        ("pm_sessions", "gauge", "Sessioni attive", {(): len(sessions)})
+    ]
+
+metrics1.register_collector(_cache_metrics)
+
+# Salt dei vault creati dalle versioni precedenti (impostato da startup())
+SALT = None
+
+def _load_salt() -> bytes:
+    # Inizializzazione del salt al primo avvio
+    db = database1.SessionLocal()
+    try:
+        db_config = db.query(database1.Config).filter(database1.Config.key == "encryption_salt").first()
+        if db_config:
+            return db_config.value
+        salt = os.urandom(16)
+        db.add(database1.Config(key="encryption_salt", value=salt))
+        try:
+            db.commit()
+        except IntegrityError:
+            # Un altro worker l'ha creato nello stesso momento
+            db.rollback()
+            salt = db.get(database1.Config, "encryption_salt").value
+        return salt
+    finally:
+        db.close()
+
+def startup():
+    """Prepara database e salt: chiamata dal lifespan (o da chi usa main1 senza server), una volta sola"""
+    global SALT
+    if SALT is not None:
+        return
+    with startup1.phase("schema del database"):
+        database1.init_db()
+    with startup1.phase("salt"):
+        SALT = _load_salt()
+    sweeper.start()
+    if profiler1.ENABLED:
+        profiler.start()
 
 # Dependency per il database
 def get_db():
@@ -32,6 +140,55 @@ def get_db():
     finally:
         db.close()
 
+# Dependency per la sessione: sostituisce la verifica PBKDF2 ad ogni richiesta
+def require_session(session_token: str = Header(...)) -> sessions1.SessionInfo:
+    session = sessions.get(session_token)
+    if session is None:
+        raise HTTPException(status_code=401, detail="Sessione non valida o scaduta")
+    return session
+
+# Dependency per la chiave di crittografia della sessione
+def require_key(session: sessions1.SessionInfo = Depends(require_session)) -> security1.VaultKey:
+    user_key = keyvault.get(session.session_id)
+    if user_key is None:
+        # Sessione aperta da un altro worker: la chiave arriva cifrata dal database
+        user_key = sessions.load_key(session.session_id)
+        if user_key is None:
+            raise HTTPException(status_code=401, detail="Sessione scaduta, effettua di nuovo l'accesso")
+        keyvault.put(session.session_id, user_key)
+    return user_key
+
+def open_session(user_key: security1.VaultKey) -> str:
+    """Apre una sessione legata alla chiave e ne restituisce il token"""
+    token, session = sessions.create()
+    keyvault.put(session.session_id, user_key)
+    sessions.store_key(session.session_id, user_key)
+    return token
+
+# Dependency per gli endpoint che scrivono: durante una rotazione della chiave
+# servono le chiavi (nuova, vecchia), altrimenti le righe verrebbero cifrate con quella vecchia
+def require_write_key(
+    user_key: security1.VaultKey = Depends(require_key),
+    db: Session = Depends(get_db)
+) -> security1.VaultKey:
+    if not isinstance(user_key, tuple) and db.get(database1.Config, rotation1.ROTATION_KEY):
+        raise HTTPException(status_code=401, detail="Rotazione della chiave in corso, effettua di nuovo l'accesso")
+    return user_key
+
+# Dependency per gli endpoint di diagnostica: solo da loopback (o dal socket Unix, senza indirizzo)
+def require_loopback(request: Request):
+    if request.client is not None and request.client.host not in ("127.0.0.1", "::1"):
+        raise HTTPException(status_code=403, detail="Disponibile solo in locale")
+
+# Limite agli sblocchi contemporanei: oltre risponde 429 invece di accodare all'infinito
+@contextmanager
+def unlock_admission():
+    try:
+        with kdf_pool.admit():
+            yield
+    except kdfpool1.KdfBusy as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
 # Modelli Pydantic
 class MasterPasswordCreate(BaseModel):
     master_password: str
@@ -47,6 +204,12 @@ class MasterPasswordCreate(BaseModel):
             raise ValueError('La Master Password deve contenere almeno un carattere speciale')
         return v
 
+class MasterPasswordLogin(BaseModel):
+    master_password: str
+
+class MasterPasswordChange(MasterPasswordCreate):
+    current_password: str
+
 class CredentialBase(BaseModel):
     app_name: str
     username: str
@@ -56,6 +219,16 @@ class CredentialBase(BaseModel):
 class CredentialUpdate(BaseModel):
     password: Optional[str] = None
 
+class BackupRequest(BaseModel):
+    passphrase: str
+    
+    @field_validator('passphrase')
+    @classmethod
+    def check_passphrase_length(cls, v: str):
+        if len(v) < 8:
+            raise ValueError('La passphrase del backup deve essere di almeno 8 caratteri')
+        return v
+
 # ENDPOINT: Verifica se il sistema è inizializzato
 @app.get("/status/")
 def check_initialization(db: Session = Depends(get_db)):
@@ -76,7 +249,7 @@ def initialize_master_password(data: MasterPasswordCreate, db: Session = Depends
         raise HTTPException(status_code=400, detail="Master password già configurata")
     
     # Crea l'hash della master password
-    password_hash = security1.hash_master_password(data.master_password)
+    password_hash = security1.hash_master_password(data.master_password, vault1.kdf_policy(db))
     
     # Salva nel database
     master_pw = database1.MasterPassword(
@@ -84,6 +257,8 @@ def initialize_master_password(data: MasterPasswordCreate, db: Session = Depends
         is_initialized=True
     )
     db.add(master_pw)
+    # Chiave dei dati casuale, salvata avvolta dalla master password
+    vault1.create_data_key(db, data.master_password)
     db.commit()
     
     return {
@@ -100,7 +275,8 @@ def verify_master_password(data: MasterPasswordCreate, db: Session = Depends(get
     if not master_pw:
         raise HTTPException(status_code=404, detail="Master password non configurata")
     
-    is_valid = security1.verify_master_password(data.master_password, master_pw.password_hash)
+    with unlock_admission():
+        is_valid = security1.verify_master_password(data.master_password, master_pw.password_hash)
     
     if not is_valid:
         raise HTTPException(status_code=401, detail="Master password errata")
@@ -110,50 +286,214 @@ def verify_master_password(data: MasterPasswordCreate, db: Session = Depends(get
         "success": True
     }
 
-# NUOVO ENDPOINT: Ottieni lista app
-@app.get("/apps/")
-def get_app_list(
-    master_password: str = Header(...),
-    db: Session = Depends(get_db)
-):
-    """Restituisce la lista di tutte le app per cui ci sono credenziali salvate"""
-    # Verifica la master password
+# ENDPOINT: Login, verifica la master password una sola volta e apre una sessione
+@app.post("/login/")
+def login(data: MasterPasswordLogin, db: Session = Depends(get_db)):
+    """Verifica la master password e restituisce un token di sessione"""
     master_pw = db.query(database1.MasterPassword).first()
     if not master_pw:
-        raise HTTPException(status_code=404, detail="Sistema non inizializzato")
+        raise HTTPException(status_code=404, detail="Master password non configurata")
     
-    if not security1.verify_master_password(master_password, master_pw.password_hash):
+    # La chiave viene derivata una volta sola e resta legata alla sessione
+    with unlock_admission():
+        user_key = vault1.unlock(db, data.master_password)
+    if user_key is None:
         raise HTTPException(status_code=401, detail="Master password errata")
     
-    # Query per ottenere le app uniche
-    apps = db.query(database1.Credential.app_name).distinct().all()
-    app_list = [app[0] for app in apps]
+    token = open_session(user_key)
+    
+    return {
+        "session_token": token,
+        "idle_timeout": sessions.idle_timeout,
+        "expires_in": sessions.ttl
+    }
+
+# ENDPOINT: Logout, revoca il token di sessione
+@app.post("/logout/")
+def logout(session_token: str = Header(...)):
+    """Invalida il token di sessione"""
+    if not sessions.revoke(session_token):
+        raise HTTPException(status_code=401, detail="Sessione non valida o scaduta")
+    return {"message": "Logout effettuato", "success": True}
+
+# ENDPOINT: Health check per il launcher (readiness e sorveglianza dei worker)
+@app.get("/health/")
+def health(db: Session = Depends(get_db)):
+    """Risponde 200 se il worker è attivo e il database raggiungibile"""
+    db.execute(text("SELECT 1"))
+    return {"status": "ok", "pid": os.getpid()}
+
+# ENDPOINT: Statistiche della cache delle chiavi
+@app.get("/stats/")
+def get_stats(session: sessions1.SessionInfo = Depends(require_session)):
+    """Restituisce i contatori del key vault e delle derivazioni e il numero di sessioni attive"""
+    return {
+        "sessions": len(sessions),
+        "key_vault": keyvault.stats(),
+        "kdf_pool": kdf_pool.stats()
+    }
+
+# ENDPOINT: Metriche in formato Prometheus (di questo processo: con più worker, di quello che risponde)
+@app.get("/metrics", dependencies=[Depends(require_loopback)])
+def get_metrics():
+    """Istogrammi delle fasi e contatori delle cache nel formato testuale di Prometheus"""
+    return PlainTextResponse(metrics1.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# ENDPOINT: Accende o spegne il profiler a campionamento
+@app.post("/profiler/", dependencies=[Depends(require_loopback)])
+def toggle_profiler(enabled: bool, interval_ms: float = Query(profiler1.INTERVAL * 1000, ge=1, le=1000)):
+    """Con enabled=true azzera i campioni e inizia a raccoglierli ogni interval_ms"""
+    if enabled:
+        profiler.start(interval_ms / 1000)
+    else:
+        profiler.stop()
+    return {"running": profiler.running, "samples": profiler.samples}
+
+# ENDPOINT: Stack campionati dal profiler
+@app.get("/profiler/", dependencies=[Depends(require_loopback)])
+def get_profile():
+    """Stack nel formato "collapsed" (una riga per stack con il numero di campioni), per flamegraph.pl o speedscope"""
+    return PlainTextResponse(profiler.collapsed())
+
+# ENDPOINT: Cambio della master password
+@app.post("/master-password/", dependencies=[Depends(require_key)])
+def change_master_password(data: MasterPasswordChange, db: Session = Depends(get_db)):
+    """Cambia la master password riavvolgendo la chiave dei dati.
+
+    Tutte le sessioni vengono chiuse e ne viene aperta una nuova. Nei vault di
+    versioni precedenti il cambio ricrittografa tutte le credenziali con una
+    chiave nuova (vault1). Se la chiave della sessione non è più disponibile
+    risponde 401 senza cambiare nulla.
+    """
+    try:
+        with unlock_admission():
+            data_key = vault1.change_master_password(db, data.current_password, data.master_password)
+    except rotation1.RotationError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if data_key is None:
+        raise HTTPException(status_code=401, detail="Master password attuale errata")
+    
+    sessions.revoke_all()
+    token = open_session(data_key)
+    return {"session_token": token, "success": True}
+
+# Rotazione avviata da /rotate-key/ in esecuzione in background
+_rotation = {"thread": None, "error": None}
+
+def _rotation_worker(keys: tuple):
+    db = database1.SessionLocal()
+    try:
+        rotation1.run_rotation(db, keys)
+        _rotation["error"] = None
+    except Exception as e:
+        _rotation["error"] = str(e)
+    finally:
+        db.close()
+
+# ENDPOINT: Rotazione della chiave dei dati (ricrittografa tutto il vault in background)
+@app.post("/rotate-key/")
+def rotate_data_key(
+    data: MasterPasswordLogin,
+    session: sessions1.SessionInfo = Depends(require_session),
+    db: Session = Depends(get_db)
+):
+    """Avvia o riprende la rotazione della chiave dei dati e restituisce un nuovo token.
+
+    Le altre sessioni vengono chiuse perché con la sola chiave vecchia non
+    leggerebbero le righe già ricrittografate.
+    """
+    if _rotation["thread"] is not None and _rotation["thread"].is_alive():
+        raise HTTPException(status_code=409, detail="Rotazione della chiave già in corso")
+    try:
+        with unlock_admission():
+            keys = rotation1.start_rotation(db, data.master_password)
+    except rotation1.RotationError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    
+    sessions.revoke_all()
+    token = open_session(keys)
     
-    return {"apps": sorted(app_list)}
+    _rotation["thread"] = threading.Thread(target=_rotation_worker, args=(keys,), daemon=True)
+    _rotation["thread"].start()
+    return {"session_token": token, "status": rotation1.rotation_status(db)}
+
+# ENDPOINT: Avanzamento della rotazione della chiave dei dati
+@app.get("/rotate-key/")
+def rotation_status(
+    session: sessions1.SessionInfo = Depends(require_session),
+    db: Session = Depends(get_db)
+):
+    """Restituisce lo stato della rotazione in corso (status null se non ce n'è una)"""
+    return {
+        "running": _rotation["thread"] is not None and _rotation["thread"].is_alive(),
+        "status": rotation1.rotation_status(db),
+        "error": _rotation["error"]
+    }
+
+# NUOVO ENDPOINT: Ottieni lista app
+@app.get("/apps/")
+def get_app_list(
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    session: sessions1.SessionInfo = Depends(require_session),
+    db: Session = Depends(get_db)
+):
+    """Restituisce la lista di tutte le app per cui ci sono credenziali salvate.
+
+    Con l'header If-None-Match uguale all'ETag ricevuto in precedenza
+    risponde 304 senza corpo se la lista non è cambiata.
+    """
+    apps, counts, etag = app_index.snapshot(db)
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    response.headers["ETag"] = etag
+    return {"apps": apps, "counts": counts}
 
 # ENDPOINT: Crea una nuova credenziale
 @app.post("/credentials/")
 def create_credential(
     cred: CredentialBase, 
-    master_password: str = Header(...),
+    user_key: security1.VaultKey = Depends(require_write_key),
     db: Session = Depends(get_db)
 ):
     """Aggiunge una nuova credenziale al database"""
-    # Verifica la master password
-    master_pw = db.query(database1.MasterPassword).first()
-    if not master_pw:
-        raise HTTPException(status_code=404, detail="Sistema non inizializzato")
+    app_name = cred.app_name.capitalize()
+    app_key = database1.make_app_key(app_name)
     
-    if not security1.verify_master_password(master_password, master_pw.password_hash):
-        raise HTTPException(status_code=401, detail="Master password errata")
+    # Usa la password fornita o ne genera una nuova
+    pw_to_encrypt = cred.password if cred.password else security1.generate_strong_password()
     
-    # Controlla se esiste già una credenziale con stessi app_name e username
-    existing = db.query(database1.Credential).filter(
-        database1.Credential.app_name == cred.app_name.capitalize(),
-        database1.Credential.username == cred.username
-    ).first()
+    # Cripta la password
+    encrypted_pw = security1.encrypt_password(pw_to_encrypt, user_key)
     
-    if existing:
+    # Inserimento atomico: se esiste già la coppia app + username non inserisce nulla
+    # (salvata con prima lettera maiuscola)
+    insert_stmt = (
+        sqlite_insert(database1.Credential)
+        .values(
+            app_name=app_name,
+            app_key=app_key,
+            username=cred.username,
+            created_by=cred.created_by.capitalize(),
+            encrypted_password=encrypted_pw
+        )
+        .on_conflict_do_nothing(index_elements=["app_key", "username"])
+        .returning(database1.Credential.id)
+    )
+    new_id = db.execute(insert_stmt).scalar()
+    db.commit()
+    if new_id is not None:
+        app_index.add(app_name)
+    
+    if new_id is None:
+        existing = db.query(database1.Credential).filter(
+            database1.Credential.app_key == app_key,
+            database1.Credential.username == cred.username
+        ).first()
+        if existing is None:
+            # Eliminata da un'altra richiesta tra l'INSERT e la SELECT
+            raise HTTPException(status_code=409, detail="Credenziale modificata da un'altra richiesta, riprova")
         return {
             "message": "exists",
             "existing_id": existing.id,
@@ -162,33 +502,9 @@ def create_credential(
             "created_by": existing.created_by
         }
     
-    # Recupera il salt
-    db_config = db.query(database1.Config).filter(database1.Config.key == "encryption_salt").first()
-    salt = db_config.value
-    
-    # Deriva la chiave di crittografia
-    user_key = security1.derive_key(master_password, salt)
-    
-    # Usa la password fornita o ne genera una nuova
-    pw_to_encrypt = cred.password if cred.password else security1.generate_strong_password()
-    
-    # Cripta la password
-    encrypted_pw = security1.encrypt_password(pw_to_encrypt, user_key)
-    
-    # Salva nel database (con prima lettera maiuscola)
-    db_cred = database1.Credential(
-        app_name=cred.app_name.capitalize(),
-        username=cred.username,
-        created_by=cred.created_by.capitalize(),
-        encrypted_password=encrypted_pw
-    )
-    db.add(db_cred)
-    db.commit()
-    db.refresh(db_cred)
-    
     return {
         "message": "created",
-        "id": db_cred.id,
+        "id": new_id,
         "generated_password": pw_to_encrypt if not cred.password else None
     }
 
@@ -197,28 +513,15 @@ def create_credential(
 def update_credential(
     credential_id: int,
     cred_update: CredentialUpdate,
-    master_password: str = Header(...),
+    user_key: security1.VaultKey = Depends(require_write_key),
     db: Session = Depends(get_db)
 ):
     """Aggiorna la password di una credenziale esistente"""
-    # Verifica la master password
-    master_pw = db.query(database1.MasterPassword).first()
-    if not master_pw:
-        raise HTTPException(status_code=404, detail="Sistema non inizializzato")
-    
-    if not security1.verify_master_password(master_password, master_pw.password_hash):
-        raise HTTPException(status_code=401, detail="Master password errata")
-    
     # Trova la credenziale
     credential = db.query(database1.Credential).filter(database1.Credential.id == credential_id).first()
     if not credential:
         raise HTTPException(status_code=404, detail="Credenziale non trovata")
     
-    # Recupera il salt e deriva la chiave
-    db_config = db.query(database1.Config).filter(database1.Config.key == "encryption_salt").first()
-    salt = db_config.value
-    user_key = security1.derive_key(master_password, salt)
-    
     # Usa la password fornita o ne genera una nuova
     pw_to_encrypt = cred_update.password if cred_update.password else security1.generate_strong_password()
     
@@ -235,63 +538,310 @@ def update_credential(
         "generated_password": pw_to_encrypt if not cred_update.password else None
     }
 
+def _credential_metadata(item: database1.Credential) -> dict:
+    return {
+        "id": item.id,
+        "app_name": item.app_name,
+        "username": item.username,
+        "created_by": item.created_by
+    }
+
+def _credential_dict(item: database1.Credential, password: str) -> dict:
+    return {**_credential_metadata(item), "encrypted_password": password}
+
+def _upgrade_records(db: Session, tokens: list, passwords: list, user_key: security1.VaultKey):
+    """Ricifra nel formato attuale i record appena letti in un formato vecchio (migrazione graduale).
+
+    tokens sono coppie (id, record cifrato). Durante una rotazione non si tocca nulla:
+    ci pensa rotation1. L'UPDATE confronta il record letto, così una modifica
+    concorrente della stessa credenziale non viene sovrascritta.
+    """
+    stale = [(token, password) for token, password in zip(tokens, passwords) if security1.needs_upgrade(token[1])]
+    if not stale or db.get(database1.Config, rotation1.ROTATION_KEY):
+        return
+    upgraded = security1.encrypt_passwords([password for _, password in stale], user_key)
+    table = database1.Credential.__table__
+    # Stessa password: una lettura non deve cambiare la revisione del vault
+    with database1.reencryption(db):
+        db.execute(
+            update(table)
+            .where(table.c.id == bindparam("row_id"), table.c.encrypted_password == bindparam("old_token"))
+            .values(encrypted_password=bindparam("new_token")),
+            [
+                {"row_id": row_id, "old_token": old_token, "new_token": new_token}
+                for ((row_id, old_token), _), new_token in zip(stale, upgraded)
+            ]
+        )
+    db.commit()
+
+def _credentials_query(app_name: Optional[str], cursor: Optional[int]):
+    """SELECT ordinata per id: la paginazione riparte dall'ultimo id visto (keyset)"""
+    query = select(database1.Credential).order_by(database1.Credential.id)
+    if app_name:
+        query = query.where(database1.Credential.app_name == app_name)
+    if cursor is not None:
+        query = query.where(database1.Credential.id > cursor)
+    return query
+
+def _stream_credentials(query, user_key: security1.VaultKey, metadata_only: bool):
+    """Genera una riga NDJSON per credenziale, decriptando un blocco alla volta"""
+    # Sessione propria: quella della dependency viene chiusa prima dello streaming
+    db = database1.SessionLocal()
+    # Record in formato vecchio: si aggiornano a lettura finita, un commit
+    # a metà chiuderebbe il cursore di yield_per
+    stale_tokens = []
+    stale_passwords = []
+    try:
+        result = db.execute(query.execution_options(yield_per=STREAM_BATCH_SIZE)).scalars()
+        for batch in result.partitions():
+            if metadata_only:
+                with metrics1.serialize_timer():
+                    chunk = "".join(json.dumps(_credential_metadata(item)) + "\n" for item in batch)
+                yield chunk
+                continue
+            try:
+                passwords = security1.decrypt_passwords([item.encrypted_password for item in batch], user_key)
+            except InvalidToken:
+                yield json.dumps({"error": "Errore nella decrittazione"}) + "\n"
+                return
+            for item, password in zip(batch, passwords):
+                if security1.needs_upgrade(item.encrypted_password):
+                    stale_tokens.append((item.id, item.encrypted_password))
+                    stale_passwords.append(password)
+            with metrics1.serialize_timer():
+                chunk = "".join(
+                    json.dumps(_credential_dict(item, password)) + "\n"
+                    for item, password in zip(batch, passwords)
+                )
+            yield chunk
+        result.close()
+        _upgrade_records(db, stale_tokens, stale_passwords, user_key)
+    finally:
+        db.close()
+
 # ENDPOINT: Lista le credenziali
 @app.get("/credentials/")
 def list_credentials(
-    master_password: str = Header(...),
+    response: Response,
+    user_key: security1.VaultKey = Depends(require_key),
     app_name: Optional[str] = None, 
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[int] = None,
+    stream: bool = False,
+    metadata_only: bool = False,
     db: Session = Depends(get_db)
 ):
-    """Recupera tutte le credenziali (o filtra per app_name)"""
-    # Verifica la master password
-    master_pw = db.query(database1.MasterPassword).first()
-    if not master_pw:
-        raise HTTPException(status_code=404, detail="Sistema non inizializzato")
-    
-    if not security1.verify_master_password(master_password, master_pw.password_hash):
-        raise HTTPException(status_code=401, detail="Master password errata")
-    
-    # Recupera il salt e deriva la chiave
-    db_config = db.query(database1.Config).filter(database1.Config.key == "encryption_salt").first()
-    salt = db_config.value
-    user_key = security1.derive_key(master_password, salt)
-    
-    # Query al database
-    query = db.query(database1.Credential)
-    if app_name:
-        query = query.filter(database1.Credential.app_name == app_name)
+    """Recupera le credenziali (o filtra per app_name).
+
+    Con limit restituisce una pagina e l'header X-Next-Cursor con l'id da
+    passare come cursor per la pagina successiva. Con stream=true la risposta
+    è NDJSON e le righe vengono decriptate ed inviate man mano che sono lette.
+    Con metadata_only=true non viene decriptato nulla: la password di una
+    singola credenziale si ottiene con /credentials/{id}/secret.
+    """
+    query = _credentials_query(app_name, cursor)
+    if stream:
+        if limit:
+            query = query.limit(limit)
+        return StreamingResponse(
+            _stream_credentials(query, user_key, metadata_only),
+            media_type="application/x-ndjson"
+        )
+    
+    # Chiediamo una riga in più per sapere se esiste una pagina successiva
+    if limit:
+        query = query.limit(limit + 1)
+    results = db.execute(query).scalars().all()
+    if limit and len(results) > limit:
+        results = results[:limit]
+        response.headers["X-Next-Cursor"] = str(results[-1].id)
+    
+    if metadata_only:
+        return [_credential_metadata(item) for item in results]
+    
+    # Decripta le password in blocco (un solo cifrario, thread pool per molti record)
+    tokens = [(item.id, item.encrypted_password) for item in results]
+    try:
+        passwords = security1.decrypt_passwords([token for _, token in tokens], user_key)
+    except InvalidToken:
+        raise HTTPException(status_code=401, detail="Errore nella decrittazione")
     
-    results = query.all()
+    credentials = [_credential_dict(item, password) for item, password in zip(results, passwords)]
+    _upgrade_records(db, tokens, passwords, user_key)
+    return credentials
+
+# ENDPOINT: Modifiche successive a una revisione del vault (sincronizzazione incrementale)
+@app.get("/changes/")
+def get_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(CHANGES_LIMIT, ge=0, le=5000),
+    metadata_only: bool = False,
+    user_key: security1.VaultKey = Depends(require_key),
+    db: Session = Depends(get_db)
+):
+    """Credenziali aggiunte o modificate e id di quelle eliminate dopo la revisione since.
+
+    Il client conserva "revision" e la ripassa come since alla chiamata successiva;
+    con "more": true ci sono altre modifiche da leggere subito. Con since=0, o
+    più avanti della revisione del database (vault ricreato), la risposta è
+    completa ("full": true) e la copia locale va sostituita. Con limit=0 restituisce
+    solo la revisione attuale e, in "more", se ci sono modifiche dopo since.
+    """
+    # La revisione si legge per prima: le scritture successive finiscono nella prossima chiamata
+    revision = db.get(database1.VaultRevision, 1).revision
+    full = since == 0 or since > revision
+    if full:
+        since = 0
+    credential = database1.Credential
+    if limit == 0:
+        # Solo la revisione: nessuna riga letta né decriptata
+        more = db.execute(select(
+            select(credential.id).where(credential.revision > since, credential.revision <= revision).exists()
+        )).scalar()
+        if not more and not full:
+            more = db.execute(select(
+                select(database1.Tombstone.credential_id)
+                .where(database1.Tombstone.revision > since, database1.Tombstone.revision <= revision)
+                .exists()
+            )).scalar()
+        return {"revision": revision, "full": full, "more": more, "upserted": [], "deleted": []}
+    items = db.execute(
+        select(credential)
+        .where(credential.revision > since, credential.revision <= revision)
+        .order_by(credential.revision)
+        .limit(limit + 1)
+    ).scalars().all()
+    tombstones = [] if full else db.execute(
+        select(database1.Tombstone)
+        .where(database1.Tombstone.revision > since, database1.Tombstone.revision <= revision)
+        .order_by(database1.Tombstone.revision)
+        .limit(limit + 1)
+    ).scalars().all()
+
+    # Le due liste in ordine di revisione: si restituiscono le prime limit modifiche
+    changes = sorted(items + tombstones, key=lambda change: change.revision)
+    more = len(changes) > limit
+    if more:
+        changes = changes[:limit]
+        revision = changes[-1].revision
+    items = [change for change in changes if isinstance(change, database1.Credential)]
+    deleted = [change.credential_id for change in changes if isinstance(change, database1.Tombstone)]
+
+    if metadata_only:
+        upserted = [_credential_metadata(item) for item in items]
+    else:
+        try:
+            passwords = security1.decrypt_passwords([item.encrypted_password for item in items], user_key)
+        except InvalidToken:
+            raise HTTPException(status_code=401, detail="Errore nella decrittazione")
+        upserted = [_credential_dict(item, password) for item, password in zip(items, passwords)]
+    return {"revision": revision, "full": full, "more": more, "upserted": upserted, "deleted": deleted}
+
+# ENDPOINT: Ricerca full-text e fuzzy sui metadati
+@app.get("/search/")
+def search_credentials(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=200),
+    session: sessions1.SessionInfo = Depends(require_session),
+    db: Session = Depends(get_db)
+):
+    """Cerca per prefisso, sottostringa o con errori di battitura su app, username e autore"""
+    return search1.search_credentials(db, q, limit)
+
+# ENDPOINT: Decripta la password di una sola credenziale
+@app.get("/credentials/{credential_id}/secret")
+def get_credential_secret(
+    credential_id: int,
+    user_key: security1.VaultKey = Depends(require_key),
+    db: Session = Depends(get_db)
+):
+    """Restituisce in chiaro la password di una singola credenziale"""
+    credential = db.get(database1.Credential, credential_id)
+    if not credential:
+        raise HTTPException(status_code=404, detail="Credenziale non trovata")
     
-    # Decripta le password
+    token = (credential.id, credential.encrypted_password)
     try:
-        for item in results:
-            item.encrypted_password = security1.decrypt_password(item.encrypted_password, user_key)
+        password = security1.decrypt_password(token[1], user_key)
     except InvalidToken:
         raise HTTPException(status_code=401, detail="Errore nella decrittazione")
     
-    return results
+    _upgrade_records(db, [token], [password], user_key)
+    return {"id": credential_id, "password": password}
+
+def _run_import(upload, fmt: str, policy: str, created_by: str, user_key: security1.VaultKey,
+                passphrase: Optional[str]) -> "importer1.ImportReport":
+    import importer1
+    db = database1.SessionLocal()
+    try:
+        if fmt == "pmbackup":
+            rows = importer1.parse_backup(upload, passphrase)
+        else:
+            stream = io.TextIOWrapper(upload, encoding="utf-8-sig", newline="")
+            rows = importer1.parse_export(stream, fmt)
+        return importer1.import_credentials(db, rows, user_key, created_by=created_by, policy=policy)
+    finally:
+        db.close()
+
+# ENDPOINT: Importazione in blocco da export CSV/JSON
+@app.post("/import/")
+async def import_credentials(
+    request: Request,
+    format: str = Query("csv", pattern="^(csv|json|jsonl|pmbackup)$"),
+    policy: str = Query("skip", pattern="^(skip|overwrite|error)$"),
+    created_by: str = "Import",
+    backup_passphrase: Optional[str] = Header(None),
+    user_key: security1.VaultKey = Depends(require_write_key)
+):
+    """Importa il file inviato come corpo della richiesta e restituisce il resoconto per riga.
+
+    Per i backup creati da /export/ (format=pmbackup) serve l'header backup-passphrase.
+    """
+    if format == "pmbackup" and not backup_passphrase:
+        raise HTTPException(status_code=400, detail="Passphrase del backup mancante")
+    # Il corpo viene copiato su file temporaneo (in memoria fino a 8 MB) senza leggerlo tutto
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as upload:
+        async for chunk in request.stream():
+            upload.write(chunk)
+        upload.seek(0)
+        try:
+            report = await run_in_threadpool(
+                _run_import, upload, format, policy, created_by, user_key, backup_passphrase
+            )
+        except (ValueError, UnicodeDecodeError) as e:
+            raise HTTPException(status_code=400, detail=f"File non valido: {e}")
+        finally:
+            app_index.invalidate()
+    return report.as_dict()
+
+# ENDPOINT: Backup cifrato in streaming
+@app.post("/export/")
+def export_credentials(data: BackupRequest, user_key: security1.VaultKey = Depends(require_key)):
+    """Scarica tutto il vault cifrato con la passphrase indicata (reimportabile con /import/)"""
+    import backup1
+    return StreamingResponse(
+        backup1.iter_export(user_key, data.passphrase),
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": 'attachment; filename="vault.pmbackup"'}
+    )
 
 @app.delete("/credentials/{credential_id}")
 def delete_credential(
     credential_id: int,
-    master_password: str = Header(...),
+    session: sessions1.SessionInfo = Depends(require_session),
     db: Session = Depends(get_db)
 ):
-    # 1. Verifica la Master Password
-    master_pw = db.query(database1.MasterPassword).first()
-    if not security1.verify_master_password(master_password, master_pw.password_hash):
-        raise HTTPException(status_code=401, detail="Master password errata")
-    
-    # 2. Trova la credenziale
+    # 1. Trova la credenziale
     credential = db.query(database1.Credential).filter(database1.Credential.id == credential_id).first()
     if not credential:
         raise HTTPException(status_code=404, detail="Credenziale non trovata")
     
-    # 3. ELIMINA E CONFERMA
+    # 2. ELIMINA E CONFERMA
     try:
+        app_name = credential.app_name
         db.delete(credential)
         db.commit()  # <--- FONDAMENTALE
+        app_index.remove(app_name)
         return {"message": "Credenziale eliminata con successo"}
     except Exception as e:
         db.rollback() # In caso di errore, annulla
@@ -0,0 +1,382 @@
+"""Variante asincrona dell'API (stessi endpoint e stesse risposte di main1)
+
+Gli endpoint usati dalla UI sono async e leggono il database con SQLAlchemy
+asincrono (aiosqlite). Le derivazioni della master password e la crittografia
+in blocco girano su esecutori dedicati e limitati (executor1): mentre è in corso
+uno sblocco, /status/, /apps/ e le letture dei metadati non aspettano nessuno.
+Gli endpoint rari (import, export, cambio password, rotazione) sono quelli di
+main1, eseguiti nel thread pool di Starlette; sessioni e chiavi sono condivise.
+
+Avvio:
+    uvicorn main_async1:app --host 127.0.0.1 --port 8000
+"""
+import os
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, HTTPException, Header, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from fastapi.routing import APIRoute
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from cryptography.fernet import InvalidToken
+from typing import Optional
+import database1
+import executor1
+import main1
+import metrics1
+import rotation1
+import search1
+import security1
+import sessions1
+import vault1
+
+# Derivazioni concorrenti della master password (ognuna occupa un core per ~0,25 s);
+# con il pool di processi di main1 servono almeno tanti thread quanti processi
+KDF_WORKERS = int(os.environ.get(
+    "PASSWORD_MANAGER_KDF_WORKERS",
+    main1.kdf_pool.workers if main1.kdf_pool.use_processes else min(4, os.cpu_count() or 1)
+))
+# Crittografia in blocco (che a sua volta usa il thread pool di security1)
+CRYPTO_WORKERS = 2
+
+kdf_executor = executor1.CryptoExecutor("kdf", KDF_WORKERS)
+crypto_executor = executor1.CryptoExecutor("crypto", CRYPTO_WORKERS)
+
+async_engine = database1.create_async_db_engine()
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    main1.startup()
+    yield
+    main1.sweeper.stop()
+    main1.profiler.stop()
+    kdf_executor.shutdown()
+    crypto_executor.shutdown()
+    main1.kdf_pool.shutdown()
+    await async_engine.dispose()
+
+app = FastAPI(lifespan=lifespan, default_response_class=main1.TimedJSONResponse)
+app.add_middleware(metrics1.MetricsMiddleware)
+
+# Stato condiviso con gli endpoint di main1
+sessions = main1.sessions
+keyvault = main1.keyvault
+app_index = main1.app_index
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def _session_call(func, *args):
+    """Le sessioni condivise tra worker leggono e scrivono su SQLite: le chiamate
+    girano nel thread pool per non bloccare l'event loop. Quelle in memoria
+    costano meno del passaggio di thread e restano sul loop"""
+    if isinstance(sessions, sessions1.SharedSessionStore):
+        return await run_in_threadpool(func, *args)
+    return func(*args)
+
+async def require_session(session_token: str = Header(...)) -> sessions1.SessionInfo:
+    return await _session_call(main1.require_session, session_token)
+
+async def require_key(session: sessions1.SessionInfo = Depends(require_session)) -> security1.VaultKey:
+    return await _session_call(main1.require_key, session)
+
+async def require_write_key(
+    user_key: security1.VaultKey = Depends(require_key),
+    db: AsyncSession = Depends(get_db)
+) -> security1.VaultKey:
+    if not isinstance(user_key, tuple) and await db.get(database1.Config, rotation1.ROTATION_KEY):
+        raise HTTPException(status_code=401, detail="Rotazione della chiave in corso, effettua di nuovo l'accesso")
+    return user_key
+
+async def _is_initialized(db: AsyncSession) -> bool:
+    return await db.scalar(select(database1.MasterPassword.id).limit(1)) is not None
+
+def _with_sync_session(fn, *args):
+    """Esegue fn(db, *args) con una sessione sincrona propria (sui thread degli esecutori)"""
+    db = database1.SessionLocal()
+    try:
+        return fn(db, *args)
+    finally:
+        db.close()
+
+def _initialize(db, master_password: str) -> bool:
+    if db.query(database1.MasterPassword).first():
+        return False
+    db.add(database1.MasterPassword(
+        password_hash=security1.hash_master_password(master_password, vault1.kdf_policy(db)),
+        is_initialized=True
+    ))
+    vault1.create_data_key(db, master_password)
+    db.commit()
+    return True
+
+async def _decrypt_many(tokens: list, user_key: security1.VaultKey) -> list:
+    # Pochi record si decriptano subito: il passaggio sull'esecutore costerebbe di più
+    if len(tokens) < security1.PARALLEL_THRESHOLD:
+        return security1.decrypt_passwords(tokens, user_key)
+    return await crypto_executor.run(security1.decrypt_passwords, tokens, user_key)
+
+@app.get("/status/")
+async def check_initialization(db: AsyncSession = Depends(get_db)):
+    """Controlla se la master password è già stata impostata"""
+    initialized = await _is_initialized(db)
+    return {
+        "is_initialized": initialized,
+        "message": "Sistema già inizializzato" if initialized else "Nessuna master password configurata"
+    }
+
+@app.post("/initialize/")
+async def initialize_master_password(data: main1.MasterPasswordCreate):
+    """Crea la master password al primo accesso"""
+    # Hash e chiave dei dati richiedono due derivazioni: tutto sull'esecutore KDF
+    if not await kdf_executor.run(_with_sync_session, _initialize, data.master_password):
+        raise HTTPException(status_code=400, detail="Master password già configurata")
+    return {
+        "message": "Master password creata con successo",
+        "success": True
+    }
+
+@app.post("/verify/")
+async def verify_master_password(data: main1.MasterPasswordCreate, db: AsyncSession = Depends(get_db)):
+    """Verifica se la master password inserita è corretta"""
+    master_pw = await db.scalar(select(database1.MasterPassword).limit(1))
+    if not master_pw:
+        raise HTTPException(status_code=404, detail="Master password non configurata")
+
+    with main1.unlock_admission():
+        is_valid = await kdf_executor.run(security1.verify_master_password, data.master_password, master_pw.password_hash)
+    if not is_valid:
+        raise HTTPException(status_code=401, detail="Master password errata")
+
+    return {
+        "message": "Master password corretta",
+        "success": True
+    }
+
+@app.post("/login/")
+async def login(data: main1.MasterPasswordLogin, db: AsyncSession = Depends(get_db)):
+    """Verifica la master password e restituisce un token di sessione"""
+    if not await _is_initialized(db):
+        raise HTTPException(status_code=404, detail="Master password non configurata")
+
+    # vault1.unlock è dominato dalla KDF e può riscrivere la chiave avvolta:
+    # gira per intero sull'esecutore con una sessione sincrona
+    with main1.unlock_admission():
+        user_key = await kdf_executor.run(_with_sync_session, vault1.unlock, data.master_password)
+    if user_key is None:
+        raise HTTPException(status_code=401, detail="Master password errata")
+
+    token = await _session_call(main1.open_session, user_key)
+
+    return {
+        "session_token": token,
+        "idle_timeout": sessions.idle_timeout,
+        "expires_in": sessions.ttl
+    }
+
+@app.post("/logout/")
+async def logout(session_token: str = Header(...)):
+    """Invalida il token di sessione"""
+    return await _session_call(main1.logout, session_token)
+
+@app.get("/stats/")
+async def get_stats(session: sessions1.SessionInfo = Depends(require_session)):
+    """Contatori del key vault, sessioni attive e code degli esecutori crittografici"""
+    return {
+        "sessions": await _session_call(len, sessions),
+        "key_vault": keyvault.stats(),
+        "kdf_pool": main1.kdf_pool.stats(),
+        "executors": {
+            "kdf": kdf_executor.stats(),
+            "crypto": crypto_executor.stats()
+        }
+    }
+
+@app.get("/apps/")
+async def get_app_list(
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    session: sessions1.SessionInfo = Depends(require_session),
+    db: AsyncSession = Depends(get_db)
+):
+    """Restituisce la lista delle app (304 se l'ETag in If-None-Match è ancora valido)"""
+    apps, counts, etag = await db.run_sync(app_index.snapshot)
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    response.headers["ETag"] = etag
+    return {"apps": apps, "counts": counts}
+
+@app.post("/credentials/")
+async def create_credential(
+    cred: main1.CredentialBase,
+    user_key: security1.VaultKey = Depends(require_write_key),
+    db: AsyncSession = Depends(get_db)
+):
+    """Aggiunge una nuova credenziale al database"""
+    app_name = cred.app_name.capitalize()
+    app_key = database1.make_app_key(app_name)
+    pw_to_encrypt = cred.password if cred.password else security1.generate_strong_password()
+    encrypted_pw = security1.encrypt_password(pw_to_encrypt, user_key)
+
+    insert_stmt = (
+        sqlite_insert(database1.Credential)
+        .values(
+            app_name=app_name,
+            app_key=app_key,
+            username=cred.username,
+            created_by=cred.created_by.capitalize(),
+            encrypted_password=encrypted_pw
+        )
+        .on_conflict_do_nothing(index_elements=["app_key", "username"])
+        .returning(database1.Credential.id)
+    )
+    new_id = (await db.execute(insert_stmt)).scalar()
+    await db.commit()
+
+    if new_id is None:
+        existing = await db.scalar(select(database1.Credential).where(
+            database1.Credential.app_key == app_key,
+            database1.Credential.username == cred.username
+        ))
+        if existing is None:
+            # Eliminata da un'altra richiesta tra l'INSERT e la SELECT
+            raise HTTPException(status_code=409, detail="Credenziale modificata da un'altra richiesta, riprova")
+        return {
+            "message": "exists",
+            "existing_id": existing.id,
+            "app_name": existing.app_name,
+            "username": existing.username,
+            "created_by": existing.created_by
+        }
+
+    app_index.add(app_name)
+    return {
+        "message": "created",
+        "id": new_id,
+        "generated_password": pw_to_encrypt if not cred.password else None
+    }
+
+@app.put("/credentials/{credential_id}")
+async def update_credential(
+    credential_id: int,
+    cred_update: main1.CredentialUpdate,
+    user_key: security1.VaultKey = Depends(require_write_key),
+    db: AsyncSession = Depends(get_db)
+):
+    """Aggiorna la password di una credenziale esistente"""
+    credential = await db.get(database1.Credential, credential_id)
+    if not credential:
+        raise HTTPException(status_code=404, detail="Credenziale non trovata")
+
+    pw_to_encrypt = cred_update.password if cred_update.password else security1.generate_strong_password()
+    credential.encrypted_password = security1.encrypt_password(pw_to_encrypt, user_key)
+    await db.commit()
+
+    return {
+        "message": "updated",
+        "id": credential.id,
+        "generated_password": pw_to_encrypt if not cred_update.password else None
+    }
+
+@app.get("/credentials/")
+async def list_credentials(
+    response: Response,
+    user_key: security1.VaultKey = Depends(require_key),
+    app_name: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[int] = None,
+    stream: bool = False,
+    metadata_only: bool = False,
+    db: AsyncSession = Depends(get_db)
+):
+    """Recupera le credenziali, con gli stessi parametri di main1 (paginazione, stream, metadata_only)"""
+    query = main1._credentials_query(app_name, cursor)
+    if stream:
+        # Il generatore sincrono di main1 viene eseguito da Starlette nel suo thread pool
+        if limit:
+            query = query.limit(limit)
+        return StreamingResponse(
+            main1._stream_credentials(query, user_key, metadata_only),
+            media_type="application/x-ndjson"
+        )
+
+    if limit:
+        query = query.limit(limit + 1)
+    results = (await db.execute(query)).scalars().all()
+    if limit and len(results) > limit:
+        results = results[:limit]
+        response.headers["X-Next-Cursor"] = str(results[-1].id)
+
+    if metadata_only:
+        return [main1._credential_metadata(item) for item in results]
+
+    tokens = [(item.id, item.encrypted_password) for item in results]
+    try:
+        passwords = await _decrypt_many([token for _, token in tokens], user_key)
+    except InvalidToken:
+        raise HTTPException(status_code=401, detail="Errore nella decrittazione")
+
+    credentials = [main1._credential_dict(item, password) for item, password in zip(results, passwords)]
+    await db.run_sync(main1._upgrade_records, tokens, passwords, user_key)
+    return credentials
+
+@app.get("/search/")
+async def search_credentials(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=200),
+    session: sessions1.SessionInfo = Depends(require_session),
+    db: AsyncSession = Depends(get_db)
+):
+    """Cerca per prefisso, sottostringa o con errori di battitura su app, username e autore"""
+    return await db.run_sync(search1.search_credentials, q, limit)
+
+@app.get("/credentials/{credential_id}/secret")
+async def get_credential_secret(
+    credential_id: int,
+    user_key: security1.VaultKey = Depends(require_key),
+    db: AsyncSession = Depends(get_db)
+):
+    """Restituisce in chiaro la password di una singola credenziale"""
+    credential = await db.get(database1.Credential, credential_id)
+    if not credential:
+        raise HTTPException(status_code=404, detail="Credenziale non trovata")
+
+    token = (credential.id, credential.encrypted_password)
+    try:
+        password = security1.decrypt_password(token[1], user_key)
+    except InvalidToken:
+        raise HTTPException(status_code=401, detail="Errore nella decrittazione")
+
+    await db.run_sync(main1._upgrade_records, [token], [password], user_key)
+    return {"id": credential_id, "password": password}
+
+@app.delete("/credentials/{credential_id}")
+async def delete_credential(
+    credential_id: int,
+    session: sessions1.SessionInfo = Depends(require_session),
+    db: AsyncSession = Depends(get_db)
+):
+    credential = await db.get(database1.Credential, credential_id)
+    if not credential:
+        raise HTTPException(status_code=404, detail="Credenziale non trovata")
+
+    try:
+        app_name = credential.app_name
+        await db.delete(credential)
+        await db.commit()
+        app_index.remove(app_name)
+        return {"message": "Credenziale eliminata con successo"}
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Errore database: {str(e)}")
+
+# Tutti gli altri endpoint sono quelli sincroni di main1
+_async_routes = {(route.path, frozenset(route.methods)) for route in app.routes if isinstance(route, APIRoute)}
+for route in main1.app.routes:
+    if isinstance(route, APIRoute) and (route.path, frozenset(route.methods)) not in _async_routes:
+        app.router.routes.append(route)
+
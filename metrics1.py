@@ -0,0 +1,179 @@
+"""Metriche del backend in formato testo Prometheus (servite da /metrics)
+
+Nessuna dipendenza esterna: contatori e istogrammi sono tenuti in memoria dal
+processo (con più worker ognuno ha i propri). Fasi misurate:
+
+* pm_kdf_seconds: ogni derivazione della master password (kdf1.derive);
+* pm_db_query_seconds: ogni statement SQL, per tipo (SELECT, INSERT, ...);
+* pm_decrypt_row_seconds: decrittazione per riga (nei blocchi, tempo medio per riga);
+* pm_serialize_seconds: codifica JSON delle risposte, per rotta;
+* pm_request_seconds: latenza delle richieste per metodo, rotta e stato.
+
+Le cache (key vault, coalescenza delle KDF, ETag di /apps/) sono esposte come
+contatori dai collector registrati con register_collector().
+"""
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterable
+
+# Limiti superiori dei bucket in secondi (da 50 µs a 10 s)
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+_collectors: list[Callable[[], Iterable[tuple]]] = []
+
+# Scope ASGI della richiesta in corso: serve a etichettare pm_serialize_seconds con la rotta
+current_scope = contextvars.ContextVar("current_scope", default=None)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(names: tuple, values: tuple, extra: tuple = ()) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names + extra[:1], values + extra[1:])]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        self._values: dict[tuple, float] = {}
+        _registry.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # Per ogni combinazione di etichette: conteggi per bucket (+Inf in fondo), somma
+        self._series: dict[tuple, list] = {}
+        _registry.append(self)
+
+    def observe(self, value: float, count: int = 1, **labels):
+        """Registra value (in secondi); count > 1 registra la stessa misura più volte"""
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += count
+            series[1] += value * count
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', le))} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+def register_collector(collector: Callable[[], Iterable[tuple]]):
+    """collector() restituisce tuple (nome, tipo, descrizione, {etichette: valore}) lette al momento"""
+    _collectors.append(collector)
+
+def render() -> str:
+    """Tutte le metriche nel formato di esposizione testuale di Prometheus"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        for name, kind, documentation, samples in collector():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples.items():
+                lines.append(f"{name}{_format_labels(tuple(k for k, _ in labels), tuple(v for _, v in labels))} {value}")
+    return "\n".join(lines) + "\n"
+
+KDF_SECONDS = Histogram("pm_kdf_seconds", "Durata di una derivazione della master password", ("algorithm",))
+DB_QUERY_SECONDS = Histogram("pm_db_query_seconds", "Durata di uno statement SQL", ("statement",))
+DECRYPT_ROW_SECONDS = Histogram("pm_decrypt_row_seconds", "Decrittazione di una password, per riga")
+SERIALIZE_SECONDS = Histogram("pm_serialize_seconds", "Codifica JSON di una risposta", ("route",))
+REQUEST_SECONDS = Histogram("pm_request_seconds", "Latenza delle richieste HTTP", ("method", "route", "status"))
+NOT_MODIFIED = Counter("pm_not_modified_total", "Risposte 304 (ETag ancora valido), per rotta", ("route",))
+
+def instrument_engine(db_engine):
+    """Misura ogni statement eseguito dall'engine SQLAlchemy (sincrono)"""
+    from sqlalchemy import event
+
+    @event.listens_for(db_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+    @event.listens_for(db_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["metrics_started"].pop()
+        verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "?"
+        DB_QUERY_SECONDS.observe(time.perf_counter() - started, statement=verb)
+
+class MetricsMiddleware:
+    """Middleware ASGI: latenza per rotta fino all'ultimo byte (anche per le risposte in streaming)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_timed(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        token = current_scope.set(scope)
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            current_scope.reset(token)
+            route = _route(scope)
+            if status["code"] == 304:
+                NOT_MODIFIED.inc(route=route)
+            REQUEST_SECONDS.observe(
+                time.perf_counter() - started, method=scope["method"], route=route, status=status["code"]
+            )
+
+def serialize_timer():
+    """Timer per la codifica della risposta, etichettato con la rotta della richiesta in corso"""
+    return SERIALIZE_SECONDS.time(route=_route(current_scope.get() or {}))
+
+def _route(scope) -> str:
+    # Il modello della rotta (/credentials/{credential_id}) e non il percorso, per non moltiplicare le serie
+    route = scope.get("route")
+    return getattr(route, "path", None) or "(non trovata)"
@@ -0,0 +1,82 @@
+"""Profiler a campionamento per il backend, senza dipendenze esterne
+
+Un thread legge a intervalli regolari lo stack di tutti gli altri thread
+(sys._current_frames) e conta quante volte compare ogni stack. Il costo è
+proporzionale alla frequenza di campionamento e non al codice eseguito, per
+questo può restare acceso su un'API in uso.
+
+Si accende con POST /profiler/?enabled=true (o PASSWORD_MANAGER_PROFILER=1
+all'avvio) e gli stack si leggono da GET /profiler/ nel formato "collapsed",
+lo stesso di flamegraph.pl e speedscope:
+
+    curl -X POST "http://127.0.0.1:8000/profiler/?enabled=true"
+    curl http://127.0.0.1:8000/profiler/ > api.collapsed
+"""
+import os
+import sys
+import threading
+from collections import Counter
+
+ENABLED = os.environ.get("PASSWORD_MANAGER_PROFILER") == "1"
+# Intervallo di campionamento predefinito, in secondi
+INTERVAL = float(os.environ.get("PASSWORD_MANAGER_PROFILER_INTERVAL_MS", "10")) / 1000
+# Stack distinti conservati al massimo: oltre, i nuovi finiscono in una voce unica
+MAX_STACKS = 20000
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+class SamplingProfiler:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stacks: Counter = Counter()
+        self._stopping = threading.Event()
+        self._thread = None
+        self.samples = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: float = INTERVAL):
+        """Azzera i campioni e avvia il thread di campionamento (riavviandolo se già attivo)"""
+        self.stop()
+        with self._lock:
+            self._stacks.clear()
+            self.samples = 0
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stopping.set()
+            self._thread.join()
+            self._thread = None
+
+    def collapsed(self) -> str:
+        """Una riga per stack: "thread;file:funzione;... campioni", dalla radice alla foglia"""
+        with self._lock:
+            return "".join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+
+    def _run(self, interval: float):
+        own = threading.get_ident()
+        while not self._stopping.wait(interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            sampled = []
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                labels.append(names.get(ident, str(ident)))
+                sampled.append(";".join(reversed(labels)))
+            with self._lock:
+                self.samples += 1
+                for stack in sampled:
+                    if stack not in self._stacks and len(self._stacks) >= MAX_STACKS:
+                        stack = "(altri stack)"
+                    self._stacks[stack] += 1
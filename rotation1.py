@@ -0,0 +1,195 @@
+"""Rotazione della chiave dei dati con ricrittografia a blocchi, ripristinabile dopo un crash
+
+Genera una nuova chiave dei dati casuale e ricrittografa tutte le credenziali.
+Serve dopo una possibile compromissione della chiave o per i vault creati da
+versioni precedenti, la cui chiave deriva ancora dalla master password (in quel
+caso vault1.change_master_password la esegue da sé). Negli altri casi il cambio
+di master password non tocca le righe.
+
+Lo stato della rotazione è salvato in Config ("rotation_state") e aggiornato nella
+stessa transazione di ogni blocco: dopo un'interruzione si riparte dall'ultimo id
+completato. vault1.unlock restituisce entrambe le chiavi (nuova, vecchia) così le
+righe si leggono qualunque chiave le cifri. La nuova chiave avvolta diventa
+effettiva solo alla fine.
+
+Uso da terminale:
+    python rotation1.py
+"""
+import base64
+import getpass
+import json
+import sys
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+from cryptography.fernet import Fernet
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.orm import Session
+import database1
+import kdf1
+import security1
+
+ROTATION_KEY = "rotation_state"
+# Righe ricrittografate per transazione: i lettori non restano bloccati più di un blocco
+BATCH_SIZE = 500
+
+class RotationError(Exception):
+    pass
+
+@dataclass
+class RotationProgress:
+    rows_done: int
+    total: int
+    last_id: int
+    elapsed: float
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows_done / self.elapsed if self.elapsed > 0 else 0.0
+
+def _load_state(db: Session) -> Optional[dict]:
+    row = db.get(database1.Config, ROTATION_KEY)
+    return json.loads(row.value) if row else None
+
+def _save_state(db: Session, state: dict):
+    row = db.get(database1.Config, ROTATION_KEY)
+    value = json.dumps(state).encode()
+    if row:
+        row.value = value
+    else:
+        db.add(database1.Config(key=ROTATION_KEY, value=value))
+
+def rotation_status(db: Session) -> Optional[dict]:
+    """Stato della rotazione in corso (None se non ce n'è una)"""
+    state = _load_state(db)
+    if state is None:
+        return None
+    return {
+        "last_id": state["last_id"],
+        "rows_done": state["rows_done"],
+        "total": state["total"],
+        "started_at": state["started_at"]
+    }
+
+def pending_keys(db: Session, old_key: bytes) -> Optional[tuple]:
+    """Se c'è una rotazione in corso restituisce (chiave nuova, chiave vecchia)"""
+    state = _load_state(db)
+    if state is None:
+        return None
+    new_key = Fernet(old_key).decrypt(base64.b64decode(state["next_key"]))
+    return (new_key, old_key)
+
+def start_rotation(db: Session, master_password: str) -> tuple:
+    """Avvia (o riprende) la rotazione e restituisce le chiavi (nuova, vecchia)"""
+    import vault1
+
+    keys = vault1.unlock(db, master_password)
+    if keys is None:
+        raise RotationError("Master password errata")
+    if isinstance(keys, tuple):
+        # Ripresa dopo un'interruzione
+        return keys
+
+    old_key = keys
+    new_key = Fernet.generate_key()
+    kdf = vault1.kdf_policy(db)
+    kek_salt, wrapped_key = vault1.wrap_data_key(master_password, new_key, kdf)
+    _save_state(db, {
+        "kek_salt": base64.b64encode(kek_salt).decode(),
+        "kek_kdf": kdf.spec(),
+        "wrapped_key": base64.b64encode(wrapped_key).decode(),
+        # La chiave nuova è salvata cifrata con la vecchia: chi sblocca durante
+        # la rotazione (anche dopo un crash) la recupera senza altre derivazioni
+        "next_key": base64.b64encode(Fernet(old_key).encrypt(new_key)).decode(),
+        "last_id": 0,
+        "rows_done": 0,
+        "total": db.query(database1.Credential).count(),
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S")
+    })
+    db.commit()
+    return (new_key, old_key)
+
+def run_rotation(
+    db: Session,
+    keys: tuple,
+    batch_size: int = BATCH_SIZE,
+    progress: Optional[Callable[[RotationProgress], None]] = None
+) -> RotationProgress:
+    """Ricrittografa tutte le righe con la chiave nuova, un blocco per transazione"""
+    cipher = security1.make_cipher(keys)
+    table = database1.Credential.__table__
+    started = time.perf_counter()
+    rows_done_here = 0
+
+    while True:
+        state = _load_state(db)
+        if state is None:
+            raise RotationError("Nessuna rotazione in corso")
+        batch = db.execute(
+            select(table.c.id, table.c.encrypted_password)
+            .where(table.c.id > state["last_id"])
+            .order_by(table.c.id)
+            .limit(batch_size)
+        ).all()
+        if not batch:
+            break
+
+        # rotate() decripta con qualsiasi chiave e ricripta con la nuova (revisione invariata)
+        with database1.reencryption(db):
+            db.execute(
+                update(table)
+                .where(table.c.id == bindparam("row_id"))
+                .values(encrypted_password=bindparam("token")),
+                [{"row_id": row.id, "token": cipher.rotate(row.encrypted_password)} for row in batch]
+            )
+        state["last_id"] = batch[-1].id
+        state["rows_done"] += len(batch)
+        _save_state(db, state)
+        db.commit()
+
+        rows_done_here += len(batch)
+        if progress:
+            progress(RotationProgress(state["rows_done"], state["total"], state["last_id"],
+                                      time.perf_counter() - started))
+
+    _finish(db, state)
+    return RotationProgress(rows_done_here, state["total"], state["last_id"], time.perf_counter() - started)
+
+def _finish(db: Session, state: dict):
+    """Rende effettiva la nuova chiave avvolta in un'unica transazione"""
+    import vault1
+
+    vault1.store_data_key(
+        db, base64.b64decode(state["kek_salt"]), base64.b64decode(state["wrapped_key"]),
+        kdf1.parse(state["kek_kdf"])
+    )
+    # La chiave nuova è casuale: non deriva più dalla master password
+    legacy = db.get(database1.Config, vault1.LEGACY_DATA_KEY_KEY)
+    if legacy:
+        db.delete(legacy)
+    db.delete(db.get(database1.Config, ROTATION_KEY))
+    db.commit()
+
+def main() -> int:
+    master_password = getpass.getpass("🔑 Master Password: ")
+
+    def show(p: RotationProgress):
+        print(f"\r⏳ {p.rows_done}/{p.total} righe ({p.rows_per_second:,.0f} righe/s)", end="", flush=True)
+
+    database1.init_db()
+    db = database1.SessionLocal()
+    try:
+        keys = start_rotation(db, master_password)
+        result = run_rotation(db, keys, progress=show)
+    except RotationError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+    finally:
+        db.close()
+    print()
+    print(f"✅ Chiave dei dati ruotata: {result.rows_done} righe in {result.elapsed:.1f}s "
+          f"({result.rows_per_second:,.0f} righe/s)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+from sqlalchemy import text, or_
+from sqlalchemy.orm import Session
+import database1
+
+# Risultati candidati valutati dalla ricerca fuzzy
+FUZZY_CANDIDATES = 100
+# Un trigramma presente in più righe di così non distingue nulla (es. "com" nelle email)
+# e viene escluso dalla ricerca fuzzy
+COMMON_TRIGRAM_ROWS = 1000
+# Somiglianza minima (0-1) perché un risultato fuzzy venga mostrato
+FUZZY_MIN_SIMILARITY = 0.5
+
+SEARCH_COLUMNS = ("app_name", "username", "created_by")
+
+def _quote(term: str) -> str:
+    """Racchiude un termine tra virgolette per la sintassi MATCH di FTS5"""
+    return '"' + term.replace('"', '""') + '"'
+
+def _trigrams(term: str) -> set[str]:
+    return {term[i:i + 3] for i in range(len(term) - 2)}
+
+def _similarity(query_trigrams: set[str], row) -> float:
+    """Quota dei trigrammi della query presenti nel campo più simile della riga"""
+    best = 0
+    for value in (row.app_name, row.username, row.created_by):
+        best = max(best, len(query_trigrams & _trigrams((value or "").casefold())))
+    return best / len(query_trigrams)
+
+def _row_dict(row, score: float, match: str) -> dict:
+    return {
+        "id": row.id,
+        "app_name": row.app_name,
+        "username": row.username,
+        "created_by": row.created_by,
+        "score": round(score, 3),
+        "match": match
+    }
+
+def _fts_query(db: Session, match: str, limit: int):
+    return db.execute(text(
+        "SELECT c.id, c.app_name, c.username, c.created_by, bm25(credentials_fts) AS rank "
+        "FROM credentials_fts JOIN credentials c ON c.id = credentials_fts.rowid "
+        "WHERE credentials_fts MATCH :match ORDER BY rank LIMIT :limit"
+    ), {"match": match, "limit": limit}).all()
+
+def _is_selective(db: Session, trigram: str) -> bool:
+    """True se il trigramma compare in poche righe (conteggio interrotto alla soglia)"""
+    count = db.execute(text(
+        "SELECT count(*) FROM (SELECT rowid FROM credentials_fts "
+        "WHERE credentials_fts MATCH :match LIMIT :cap)"
+    ), {"match": _quote(trigram), "cap": COMMON_TRIGRAM_ROWS}).scalar()
+    return 0 < count < COMMON_TRIGRAM_ROWS
+
+def _like_query(db: Session, query: str, limit: int):
+    """Ricerca per sottostringa senza indice (query corte o SQLite senza FTS5)"""
+    pattern = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    columns = [getattr(database1.Credential, name) for name in SEARCH_COLUMNS]
+    return (
+        db.query(database1.Credential)
+        .filter(or_(*[column.ilike(pattern, escape="\\") for column in columns]))
+        .order_by(database1.Credential.app_name, database1.Credential.id)
+        .limit(limit)
+        .all()
+    )
+
+def search_credentials(db: Session, query: str, limit: int = 20) -> list[dict]:
+    """Cerca nei metadati delle credenziali (app, username, autore).
+
+    Prima cerca la query come sottostringa (copre anche i prefissi), ordinando
+    per rilevanza bm25; se i risultati non bastano completa con una ricerca
+    fuzzy sui trigrammi, che tollera errori di battitura.
+    """
+    query = query.strip().casefold()
+    if not query:
+        return []
+
+    # Il tokenizer trigram non può indicizzare termini di meno di 3 caratteri
+    if not database1.FTS_AVAILABLE or len(query) < 3:
+        return [_row_dict(row, 1.0, "exact") for row in _like_query(db, query, limit)]
+
+    results = [_row_dict(row, 1.0, "exact") for row in _fts_query(db, _quote(query), limit)]
+    if len(results) >= limit or len(query) < 4:
+        return results
+
+    # Ricerca fuzzy: basta condividere qualche trigramma selettivo,
+    # poi i candidati migliori per bm25 vengono riordinati per somiglianza
+    query_trigrams = _trigrams(query)
+    trigrams = sorted(trigram for trigram in query_trigrams if _is_selective(db, trigram))
+    if not trigrams:
+        return results
+    seen = {item["id"] for item in results}
+    match = " OR ".join(_quote(trigram) for trigram in trigrams)
+    fuzzy = []
+    for row in _fts_query(db, match, FUZZY_CANDIDATES):
+        if row.id in seen:
+            continue
+        score = _similarity(query_trigrams, row)
+        if score >= FUZZY_MIN_SIMILARITY:
+            fuzzy.append(_row_dict(row, score, "fuzzy"))
+    fuzzy.sort(key=lambda item: item["score"], reverse=True)
+    return results + fuzzy[:limit - len(results)]
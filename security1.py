@@ -1,45 +1,172 @@
 import os
 import base64
+import hmac
 import secrets
 import string
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Union
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
 from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.fernet import Fernet
-
-def derive_key(password: str, salt: bytes) -> bytes:
-    """Deriva una chiave di crittografia dalla password e dal salt"""
-    kdf = PBKDF2HMAC(hashes.SHA256(), 32, salt, 480000)
-    return base64.urlsafe_b64encode(kdf.derive(password.encode()))
-
-def hash_master_password(password: str) -> bytes:
-    """Crea un hash sicuro della master password per la verifica"""
-    salt = os.urandom(32)
-    kdf = PBKDF2HMAC(hashes.SHA256(), 64, salt, 480000)
-    hash_bytes = kdf.derive(password.encode())
-    # Salviamo salt + hash insieme
-    return salt + hash_bytes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+import kdf1
+import metrics1
+
+# Una chiave Fernet, oppure più chiavi durante una rotazione (la prima è quella nuova)
+VaultKey = Union[bytes, tuple]
+
+# Formato dei record cifrati: versione (1 byte) | nonce (12 byte) | testo cifrato + tag (16 byte).
+# I token Fernet delle versioni precedenti iniziano sempre con "g" (0x80 in base64)
+# e vengono ancora letti; la versione fa da dato associato, quindi non si può alterare.
+RECORD_AES_GCM = 1
+RECORD_CHACHA20 = 2
+RECORD_FORMATS = {"aes-256-gcm": RECORD_AES_GCM, "chacha20-poly1305": RECORD_CHACHA20}
+# ChaCha20-Poly1305 è più veloce su CPU senza istruzioni AES (vecchi ARM)
+RECORD_FORMAT = RECORD_FORMATS[os.environ.get("PASSWORD_MANAGER_CIPHER", "aes-256-gcm")]
+_AEADS = {
+    RECORD_AES_GCM: (AESGCM, b"password-manager record aes-256-gcm"),
+    RECORD_CHACHA20: (ChaCha20Poly1305, b"password-manager record chacha20-poly1305")
+}
+
+def derive_key(password: str, salt: bytes, kdf: Optional[kdf1.Kdf] = None) -> bytes:
+    """Deriva una chiave di crittografia dalla password e dal salt (PBKDF2 storico se kdf è None)"""
+    kdf = kdf or kdf1.LEGACY
+    return base64.urlsafe_b64encode(kdf1.derive(kdf, password.encode(), salt, 32))
+
+def hash_master_password(password: str, kdf: Optional[kdf1.Kdf] = None) -> bytes:
+    """Crea un hash sicuro della master password per la verifica (stringa PHC con i parametri)"""
+    kdf = kdf or kdf1.DEFAULT
+    salt = os.urandom(16)
+    return kdf.encode(salt, kdf1.derive(kdf, password.encode(), salt, 32)).encode()
 
 def verify_master_password(password: str, stored_hash: bytes) -> bool:
     """Verifica se la password corrisponde all'hash salvato"""
-    salt = stored_hash[:32]  # Primi 32 bytes sono il salt
-    stored_key = stored_hash[32:]  # Resto è l'hash
-    
-    kdf = PBKDF2HMAC(hashes.SHA256(), 64, salt, 480000)
     try:
-        computed_key = kdf.derive(password.encode())
-        return computed_key == stored_key
-    except:
+        if stored_hash.startswith(b"$"):
+            kdf, salt, stored_key = kdf1.decode(stored_hash.decode())
+        else:
+            # Formato storico: salt (32 byte) + PBKDF2 da 64 byte
+            kdf, salt, stored_key = kdf1.LEGACY, stored_hash[:32], stored_hash[32:]
+        computed_key = kdf1.derive(kdf, password.encode(), salt, len(stored_key))
+        return hmac.compare_digest(computed_key, stored_key)
+    except Exception:
         return False
 
-def encrypt_password(password: str, key: bytes) -> bytes:
+def needs_rehash(stored_hash: bytes, kdf: kdf1.Kdf) -> bool:
+    """True se l'hash è nel formato storico o usa parametri diversi da kdf"""
+    if not stored_hash.startswith(b"$"):
+        return True
+    return kdf1.parse(stored_hash.decode()) != kdf
+
+def _record_key(key: bytes, info: bytes) -> bytes:
+    """Sottochiave a 256 bit per un algoritmo, derivata dalla chiave dei dati con HKDF"""
+    return HKDF(hashes.SHA256(), 32, None, info).derive(base64.urlsafe_b64decode(key))
+
+class RecordCipher:
+    """Cripta nel formato RECORD_FORMAT e decripta ogni formato riconosciuto.
+
+    Con più chiavi (rotazione) cripta con la prima e decripta con tutte.
+    Gli errori di decrittazione sono sempre InvalidToken, come con Fernet.
+    """
+
+    def __init__(self, keys: tuple, version: int = RECORD_FORMAT):
+        self.version = version
+        self._fernet = MultiFernet([Fernet(k) for k in keys])
+        self._aeads = {v: [cls(_record_key(k, info)) for k in keys] for v, (cls, info) in _AEADS.items()}
+
+    def encrypt(self, data: bytes) -> bytes:
+        header = bytes([self.version])
+        nonce = os.urandom(12)
+        return header + nonce + self._aeads[self.version][0].encrypt(nonce, data, header)
+
+    def decrypt(self, token: Union[bytes, str]) -> bytes:
+        if isinstance(token, str):
+            token = token.encode()
+        aeads = self._aeads.get(token[0]) if token else None
+        if aeads is None:
+            return self._fernet.decrypt(token)
+        for aead in aeads:
+            try:
+                return aead.decrypt(token[1:13], token[13:], token[:1])
+            except InvalidTag:
+                continue
+        raise InvalidToken
+
+    def rotate(self, token: bytes) -> bytes:
+        """Decripta con qualsiasi chiave e ricripta con la prima nel formato attuale"""
+        return self.encrypt(self.decrypt(token))
+
+def make_cipher(key: VaultKey) -> RecordCipher:
+    """Costruisce il cifrario per una chiave o per le chiavi di una rotazione"""
+    return RecordCipher(key if isinstance(key, tuple) else (key,))
+
+def needs_upgrade(token: Union[bytes, str]) -> bool:
+    """True se il record è in un formato diverso da RECORD_FORMAT (es. Fernet)"""
+    return not isinstance(token, bytes) or token[:1] != bytes([RECORD_FORMAT])
+
+def encrypt_password(password: str, key: VaultKey) -> bytes:
     """Cripta una password usando la chiave derivata"""
-    fernet = Fernet(key)
-    return fernet.encrypt(password.encode())
+    return make_cipher(key).encrypt(password.encode())
 
-def decrypt_password(encrypted_password: bytes, key: bytes) -> str:
+def decrypt_password(encrypted_password: bytes, key: VaultKey) -> str:
     """Decripta una password usando la chiave derivata"""
-    fernet = Fernet(key)
-    return fernet.decrypt(encrypted_password).decode()
+    with metrics1.DECRYPT_ROW_SECONDS.time():
+        return make_cipher(key).decrypt(encrypted_password).decode()
+
+# Sotto questa soglia le operazioni in blocco avvengono in serie:
+# per pochi record il costo del thread pool supera il guadagno
+PARALLEL_THRESHOLD = 256
+# Numero di thread usati per crittografia e decrittazione in blocco
+CRYPTO_WORKERS = min(8, os.cpu_count() or 1)
+
+_executor = None
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=CRYPTO_WORKERS, thread_name_prefix="crypto")
+    return _executor
+
+def _map_chunks(worker, cipher, items: list) -> list:
+    """Applica worker(cipher, blocco) in serie o sul thread pool, mantenendo l'ordine"""
+    if len(items) < PARALLEL_THRESHOLD or CRYPTO_WORKERS < 2:
+        return worker(cipher, items)
+
+    # Più blocchi che thread, così i thread restano bilanciati
+    chunk_size = max(1, -(-len(items) // (CRYPTO_WORKERS * 4)))
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+    results = []
+    for processed in _get_executor().map(worker, [cipher] * len(chunks), chunks):
+        results.extend(processed)
+    return results
+
+def _decrypt_chunk(cipher, chunk: list) -> list:
+    return [cipher.decrypt(token).decode() for token in chunk]
+
+def _encrypt_chunk(cipher, chunk: list) -> list:
+    return [cipher.encrypt(password.encode()) for password in chunk]
+
+def decrypt_passwords(encrypted_passwords: list, key: VaultKey) -> list[str]:
+    """Decripta un elenco di password costruendo il cifrario una sola volta.
+
+    Sopra PARALLEL_THRESHOLD record il lavoro viene diviso in blocchi ed
+    eseguito su un thread pool (le primitive di cryptography rilasciano il GIL).
+    Solleva InvalidToken se anche un solo record non è decifrabile.
+    """
+    encrypted_passwords = list(encrypted_passwords)
+    started = time.perf_counter()
+    passwords = _map_chunks(_decrypt_chunk, make_cipher(key), encrypted_passwords)
+    if passwords:
+        # Un'osservazione per riga con il tempo medio del blocco
+        elapsed = time.perf_counter() - started
+        metrics1.DECRYPT_ROW_SECONDS.observe(elapsed / len(passwords), count=len(passwords))
+    return passwords
+
+def encrypt_passwords(passwords: list, key: VaultKey) -> list[bytes]:
+    """Cripta un elenco di password con un solo cifrario (in parallelo se sono molte)"""
+    return _map_chunks(_encrypt_chunk, make_cipher(key), list(passwords))
 
 def generate_strong_password(length: int = 16) -> str:
     """Genera una password casuale forte"""
@@ -0,0 +1,277 @@
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from sqlalchemy import delete, func, select, update
+import database1
+
+# Durata massima di una sessione (anche se usata continuamente)
+SESSION_TTL = 8 * 60 * 60
+# Dopo quanti secondi di inattività la sessione scade
+SESSION_IDLE_TIMEOUT = 15 * 60
+# Sessioni condivise: ogni quanti secondi al massimo si aggiorna last_seen nel database
+TOUCH_INTERVAL = 30
+# Ogni quanti secondi Sweeper chiude le sessioni scadute
+SWEEP_INTERVAL = 60
+
+@dataclass
+class SessionInfo:
+    session_id: str
+    token_digest: bytes
+    created_at: float = field(default_factory=time.monotonic)
+    last_seen: float = field(default_factory=time.monotonic)
+
+def _digest(token: str) -> bytes:
+    """Impronta SHA-256 del token: in memoria non teniamo mai il token in chiaro"""
+    return hashlib.sha256(token.encode()).digest()
+
+class SessionStore:
+    """Archivio in memoria dei token di sessione emessi dopo il login"""
+
+    def __init__(
+        self,
+        ttl: float = SESSION_TTL,
+        idle_timeout: float = SESSION_IDLE_TIMEOUT,
+        on_close: Optional[Callable[[str], None]] = None
+    ):
+        self.ttl = ttl
+        self.idle_timeout = idle_timeout
+        # Richiamata con il session_id quando una sessione termina (logout o scadenza)
+        self.on_close = on_close
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def create(self) -> tuple[str, SessionInfo]:
+        """Crea una nuova sessione e restituisce il token da consegnare al client"""
+        token = secrets.token_urlsafe(32)
+        digest = _digest(token)
+        session = SessionInfo(session_id=secrets.token_hex(8), token_digest=digest)
+        with self._lock:
+            closed = self._purge_expired(time.monotonic())
+            self._sessions[digest] = session
+        self._notify(closed)
+        return token, session
+
+    def get(self, token: str) -> Optional[SessionInfo]:
+        """Restituisce la sessione se il token è valido (e ne rinnova l'inattività)"""
+        digest = _digest(token)
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(digest)
+            # Confronto a tempo costante sull'impronta salvata
+            if session is None or not hmac.compare_digest(session.token_digest, digest):
+                return None
+            expired = self._is_expired(session, now)
+            if expired:
+                del self._sessions[digest]
+            else:
+                session.last_seen = now
+        if expired:
+            self._notify([session])
+            return None
+        return session
+
+    def revoke(self, token: str) -> bool:
+        """Invalida un token (logout)"""
+        with self._lock:
+            session = self._sessions.pop(_digest(token), None)
+        if session is None:
+            return False
+        self._notify([session])
+        return True
+
+    def revoke_all(self):
+        """Invalida tutte le sessioni attive"""
+        with self._lock:
+            closed = list(self._sessions.values())
+            self._sessions.clear()
+        self._notify(closed)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def sweep(self) -> int:
+        """Chiude le sessioni scadute anche se nessuno ne presenta più il token"""
+        with self._lock:
+            closed = self._purge_expired(time.monotonic())
+        self._notify(closed)
+        return len(closed)
+
+    def store_key(self, session_id: str, key):
+        """In memoria la chiave della sessione vive solo nel KeyVault"""
+
+    def load_key(self, session_id: str):
+        return None
+
+    def _is_expired(self, session: SessionInfo, now: float) -> bool:
+        return (now - session.created_at > self.ttl
+                or now - session.last_seen > self.idle_timeout)
+
+    def _purge_expired(self, now: float) -> list[SessionInfo]:
+        expired = [d for d, s in self._sessions.items() if self._is_expired(s, now)]
+        return [self._sessions.pop(digest) for digest in expired]
+
+    def _notify(self, closed: list[SessionInfo]):
+        if self.on_close is None:
+            return
+        for session in closed:
+            self.on_close(session.session_id)
+
+class SharedSessionStore:
+    """Sessioni salvate nel database, valide su tutti i worker di uvicorn.
+
+    Stessa interfaccia di SessionStore. La chiave dei dati della sessione è salvata
+    cifrata (AES-256-GCM) con un segreto che il launcher genera a ogni avvio e passa
+    ai worker solo in memoria: ogni worker la recupera con load_key() e la tiene
+    nel proprio KeyVault. I tempi sono in secondi epoch, comuni a tutti i processi.
+    """
+
+    def __init__(
+        self,
+        secret: bytes,
+        ttl: float = SESSION_TTL,
+        idle_timeout: float = SESSION_IDLE_TIMEOUT,
+        on_close: Optional[Callable[[str], None]] = None
+    ):
+        self.ttl = ttl
+        self.idle_timeout = idle_timeout
+        self.on_close = on_close
+        self._aead = AESGCM(secret)
+        self._secret_id = hashlib.sha256(secret).hexdigest()[:16]
+        self._table = database1.ApiSession.__table__
+
+    def create(self) -> tuple[str, SessionInfo]:
+        token = secrets.token_urlsafe(32)
+        now = time.time()
+        session = SessionInfo(
+            session_id=secrets.token_hex(8), token_digest=_digest(token), created_at=now, last_seen=now
+        )
+        table = self._table
+        with database1.engine.begin() as conn:
+            # Pulizia: sessioni scadute o di un avvio precedente (segreto diverso)
+            conn.execute(delete(table).where(
+                (table.c.secret_id != self._secret_id)
+                | (table.c.created_at < now - self.ttl)
+                | (table.c.last_seen < now - self.idle_timeout)
+            ))
+            conn.execute(table.insert().values(
+                session_id=session.session_id, token_digest=session.token_digest,
+                secret_id=self._secret_id, created_at=now, last_seen=now
+            ))
+        return token, session
+
+    def get(self, token: str) -> Optional[SessionInfo]:
+        digest = _digest(token)
+        now = time.time()
+        table = self._table
+        with database1.engine.connect() as conn:
+            row = conn.execute(
+                select(table.c.session_id, table.c.token_digest, table.c.created_at, table.c.last_seen)
+                .where(table.c.token_digest == digest, table.c.secret_id == self._secret_id)
+            ).first()
+        if row is None or not hmac.compare_digest(row.token_digest, digest):
+            return None
+        session = SessionInfo(row.session_id, row.token_digest, row.created_at, row.last_seen)
+        if now - session.created_at > self.ttl or now - session.last_seen > self.idle_timeout:
+            self._delete(table.c.session_id == session.session_id)
+            return None
+        if now - session.last_seen > TOUCH_INTERVAL:
+            with database1.engine.begin() as conn:
+                conn.execute(update(table).where(table.c.session_id == session.session_id).values(last_seen=now))
+            session.last_seen = now
+        return session
+
+    def revoke(self, token: str) -> bool:
+        return self._delete(self._table.c.token_digest == _digest(token)) > 0
+
+    def revoke_all(self):
+        self._delete(self._table.c.session_id.isnot(None))
+
+    def sweep(self) -> int:
+        now = time.time()
+        table = self._table
+        return self._delete((table.c.created_at < now - self.ttl) | (table.c.last_seen < now - self.idle_timeout))
+
+    def __len__(self):
+        now = time.time()
+        table = self._table
+        with database1.engine.connect() as conn:
+            return conn.execute(select(func.count()).select_from(table).where(
+                table.c.secret_id == self._secret_id,
+                table.c.created_at >= now - self.ttl,
+                table.c.last_seen >= now - self.idle_timeout
+            )).scalar()
+
+    def store_key(self, session_id: str, key):
+        """Salva la chiave (o le chiavi, durante una rotazione) cifrata con il segreto dei worker"""
+        keys = key if isinstance(key, tuple) else (key,)
+        nonce = os.urandom(12)
+        wrapped = nonce + self._aead.encrypt(nonce, b"\n".join(keys), session_id.encode())
+        with database1.engine.begin() as conn:
+            conn.execute(update(self._table).where(self._table.c.session_id == session_id).values(wrapped_key=wrapped))
+
+    def load_key(self, session_id: str):
+        """Chiave di una sessione aperta da un altro worker (None se assente)"""
+        with database1.engine.connect() as conn:
+            wrapped = conn.execute(
+                select(self._table.c.wrapped_key).where(self._table.c.session_id == session_id)
+            ).scalar()
+        if not wrapped:
+            return None
+        keys = tuple(self._aead.decrypt(wrapped[:12], wrapped[12:], session_id.encode()).split(b"\n"))
+        return keys if len(keys) > 1 else keys[0]
+
+    def _delete(self, condition) -> int:
+        with database1.engine.begin() as conn:
+            closed = conn.execute(select(self._table.c.session_id).where(condition)).scalars().all()
+            conn.execute(delete(self._table).where(condition))
+        if self.on_close is not None:
+            # Azzera la chiave nel KeyVault di questo worker; gli altri la perdono alla scadenza,
+            # ma senza la riga nel database la sessione non è più accettata da nessuno
+            for session_id in closed:
+                self.on_close(session_id)
+        return len(closed)
+
+class Sweeper:
+    """Thread che chiama a intervalli regolari le funzioni di pulizia (sessioni e chiavi scadute).
+
+    Senza, una sessione abbandonata verrebbe chiusa, e la sua chiave azzerata,
+    solo alla richiesta successiva con lo stesso token.
+    """
+
+    def __init__(self, *tasks: Callable[[], object], interval: float = SWEEP_INTERVAL):
+        self.tasks = tasks
+        self.interval = interval
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Avvia il thread (riavviandolo se già attivo)"""
+        self.stop()
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="session-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stopping.set()
+            self._thread.join()
+            self._thread = None
+
+    def run_once(self):
+        for task in self.tasks:
+            task()
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception:
+                # Es. database occupato: si riprova al giro successivo
+                pass
@@ -0,0 +1,118 @@
+"""Profilo dell'avvio: durata di ogni fase e confronto con una baseline
+
+Le fasi vengono registrate con phase() dal launcher e dal lifespan dell'API
+(main1.startup). Con PASSWORD_MANAGER_STARTUP_PROFILE=1 il launcher stampa il
+resoconto quando l'interfaccia sta per partire.
+
+Da terminale misura un avvio a freddo, in un processo nuovo per ogni ripetizione:
+
+    python startup1.py --runs 5 --save startup_baseline.json
+    python startup1.py --runs 5 --baseline startup_baseline.json
+"""
+import argparse
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+PROFILE = os.environ.get("PASSWORD_MANAGER_STARTUP_PROFILE") == "1"
+
+_lock = threading.Lock()
+_phases: list[tuple[str, float]] = []
+
+@contextmanager
+def phase(name: str):
+    """Misura il blocco e lo registra come fase dell'avvio"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        with _lock:
+            _phases.append((name, (time.perf_counter() - started) * 1000))
+
+def phases() -> dict[str, float]:
+    """Durata (ms) di ogni fase registrata finora, nell'ordine di esecuzione"""
+    with _lock:
+        result = {}
+        for name, elapsed_ms in _phases:
+            result[name] = result.get(name, 0.0) + elapsed_ms
+        return result
+
+def report(measured: dict[str, float], baseline: Optional[dict[str, float]] = None) -> str:
+    """Tabella delle fasi, con lo scarto rispetto alla baseline se presente"""
+    baseline = baseline or {}
+    lines = [f"{'fase':<28} | {'ms':>9} | {'baseline':>9} | {'scarto':>8}", "-" * 63]
+    for name, elapsed_ms in measured.items():
+        if name in baseline and baseline[name] > 0:
+            reference = f"{baseline[name]:>9.1f}"
+            delta = f"{(elapsed_ms - baseline[name]) / baseline[name] * 100:>+7.1f}%"
+        else:
+            reference, delta = f"{'-':>9}", f"{'-':>8}"
+        lines.append(f"{name:<28} | {elapsed_ms:>9.1f} | {reference} | {delta}")
+    return "\n".join(lines)
+
+def _child():
+    # Le stesse fasi dell'avvio reale, in un interprete appena avviato
+    # import_module: i moduli servono solo per misurare il tempo di import
+    with phase("import client1"):
+        importlib.import_module("client1")
+    with phase("import uvicorn"):
+        import uvicorn
+    with phase("import main1"):
+        import main1
+    with phase("api in ascolto"):
+        # Il lifespan registra le sue fasi (schema del database, salt)
+        server = uvicorn.Server(uvicorn.Config(main1.app, host="127.0.0.1", port=0, log_level="error"))
+        thread = threading.Thread(target=server.run, daemon=True)
+        thread.start()
+        while not server.started and thread.is_alive():
+            time.sleep(0.005)
+    server.should_exit = True
+    thread.join()
+    if importlib.util.find_spec("streamlit") is not None:
+        with phase("import streamlit"):
+            importlib.import_module("streamlit.web.cli")
+    print(json.dumps(phases()))
+
+def measure(runs: int) -> dict[str, float]:
+    """Mediana di ogni fase su più avvii a freddo (più il tempo totale del processo)"""
+    samples: dict[str, list[float]] = {}
+    for _ in range(runs):
+        started = time.perf_counter()
+        # "-c" e non il file come script: main1 deve registrare le fasi in questo modulo, non in __main__
+        output = subprocess.run(
+            [sys.executable, "-c", "import startup1; startup1._child()"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True
+        ).stdout
+        total_ms = (time.perf_counter() - started) * 1000
+        for name, elapsed_ms in {**json.loads(output.splitlines()[-1]), "processo (totale)": total_ms}.items():
+            samples.setdefault(name, []).append(elapsed_ms)
+    return {name: statistics.median(values) for name, values in samples.items()}
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Profilo dell'avvio a freddo, fase per fase")
+    parser.add_argument("--runs", type=int, default=3, help="avvii da misurare (si usa la mediana)")
+    parser.add_argument("--baseline", help="file JSON con cui confrontare le fasi")
+    parser.add_argument("--save", help="salva le misure come nuova baseline")
+    args = parser.parse_args(argv)
+
+    measured = measure(args.runs)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print(report(measured, baseline))
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(measured, f, indent=2)
+        print(f"💾 Baseline salvata in {args.save}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
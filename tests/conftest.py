@@ -0,0 +1,55 @@
+"""Fixture comuni: backend main1 su un database temporaneo, con una KDF economica"""
+import os
+import sys
+import tempfile
+
+# Vault temporaneo e sessioni in memoria: vanno impostati prima di importare database1
+_TMP = tempfile.mkdtemp(prefix="pm-tests-")
+os.environ["PASSWORD_MANAGER_DB"] = os.path.join(_TMP, "test.db")
+os.environ.pop("PASSWORD_MANAGER_SESSION_SECRET", None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from fastapi.testclient import TestClient
+import database1
+import kdf1
+import main1
+
+MASTER_PASSWORD = "Prova!2024"
+# Poche iterazioni: nei test conta il comportamento, non il costo della derivazione
+TEST_KDF = kdf1.Pbkdf2(1000)
+
+_TABLES = ("credentials", "credential_tombstones", "config", "master_password", "api_sessions")
+
+@pytest.fixture
+def client():
+    """TestClient su un vault vuoto, con la KDF di prova salvata come politica del vault"""
+    database1.init_db()
+    with database1.engine.begin() as conn:
+        for table in _TABLES:
+            conn.exec_driver_sql(f"DELETE FROM {table}")
+        conn.exec_driver_sql("UPDATE vault_revision SET revision = 0")
+    # Il salt cancellato con config viene ricreato da startup()
+    main1.SALT = None
+    main1.startup()
+    db = database1.SessionLocal()
+    try:
+        db.add(database1.Config(key=kdf1.POLICY_KEY, value=TEST_KDF.spec().encode()))
+        db.commit()
+    finally:
+        db.close()
+    main1.sessions.revoke_all()
+    main1.keyvault.wipe_all()
+    main1.app_index.invalidate()
+    # Indirizzo di loopback come il launcher
+    with TestClient(main1.app, client=("127.0.0.1", 50000)) as test_client:
+        yield test_client
+    main1.sessions.revoke_all()
+
+@pytest.fixture
+def token(client) -> str:
+    """Vault inizializzato con MASTER_PASSWORD e token di una sessione aperta"""
+    assert client.post("/initialize/", json={"master_password": MASTER_PASSWORD}).status_code == 200
+    response = client.post("/login/", json={"master_password": MASTER_PASSWORD})
+    assert response.status_code == 200
+    return response.json()["session_token"]
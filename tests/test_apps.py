@@ -0,0 +1,44 @@
+"""/apps/: indice in memoria, ETag e scritture fatte da altri processi"""
+import sqlite3
+import pytest
+import database1
+
+@pytest.fixture
+def headers(token) -> dict:
+    return {"session-token": token}
+
+def _create(client, headers, app_name: str, username: str) -> int:
+    response = client.post("/credentials/", headers=headers, json={
+        "app_name": app_name, "username": username, "created_by": "Test", "password": "Segreta!2024"
+    })
+    return response.json()["id"]
+
+def test_unchanged_list_answers_304(client, headers):
+    _create(client, headers, "posta", "user@example.com")
+    etag = client.get("/apps/", headers=headers).headers["ETag"]
+    response = client.get("/apps/", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+
+def test_local_writes_update_list_and_etag(client, headers):
+    first = _create(client, headers, "posta", "user@example.com")
+    etag = client.get("/apps/", headers=headers).headers["ETag"]
+    _create(client, headers, "banca", "user@example.com")
+    response = client.get("/apps/", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json() == {"apps": ["Banca", "Posta"], "counts": {"Banca": 1, "Posta": 1}}
+    client.delete(f"/credentials/{first}", headers=headers)
+    assert client.get("/apps/", headers=headers).json()["apps"] == ["Banca"]
+
+def test_write_from_another_process_refreshes_list(client, headers):
+    _create(client, headers, "posta", "user@example.com")
+    etag = client.get("/apps/", headers=headers).headers["ETag"]
+    # Stessa scrittura che farebbe un altro worker: connessione separata, i trigger incrementano la revisione
+    with sqlite3.connect(database1.db_path) as conn:
+        conn.execute(
+            "INSERT INTO credentials (app_name, app_key, username, created_by, encrypted_password, revision) "
+            "VALUES ('Banca', 'banca', 'user@example.com', 'Test', x'00', 0)"
+        )
+    response = client.get("/apps/", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["counts"] == {"Banca": 1, "Posta": 1}
+    assert response.headers["ETag"] != etag
@@ -0,0 +1,72 @@
+"""Backup cifrato: ripristino completo e rifiuto dei file troncati o alterati"""
+import io
+import pytest
+import backup1
+import database1
+import importer1
+import vault1
+from conftest import MASTER_PASSWORD
+
+PASSPHRASE = "Backup!2024"
+
+@pytest.fixture
+def headers(token) -> dict:
+    return {"session-token": token}
+
+def _restore(client, headers, content: bytes):
+    return client.post(
+        "/import/", params={"format": "pmbackup"}, content=content,
+        headers={**headers, "backup-passphrase": PASSPHRASE}
+    )
+
+def _multi_frame_archive(rows: int) -> bytes:
+    # Una riga per blocco: un danno all'ultimo lascia validi i blocchi precedenti
+    writer = backup1.ArchiveWriter(PASSPHRASE)
+    records = [
+        {"app_name": "Github", "username": f"user{i}@example.com", "created_by": "Test", "password": f"Segreta!{i}"}
+        for i in range(rows)
+    ]
+    frames = [writer.frame([record], last=i == rows - 1) for i, record in enumerate(records)]
+    return writer.header + b"".join(frames)
+
+def test_export_restore_round_trip(client, headers):
+    for i in range(3):
+        client.post("/credentials/", headers=headers, json={
+            "app_name": "Github", "username": f"user{i}@example.com", "created_by": "Test",
+            "password": f"Segreta!{i}"
+        })
+    archive = client.post("/export/", headers=headers, json={"passphrase": PASSPHRASE})
+    assert archive.status_code == 200
+    for item in client.get("/credentials/", params={"metadata_only": True}, headers=headers).json():
+        client.delete(f"/credentials/{item['id']}", headers=headers)
+
+    response = _restore(client, headers, archive.content)
+    assert response.status_code == 200
+    assert response.json()["imported"] == 3
+    passwords = {item["username"]: item["encrypted_password"]
+                 for item in client.get("/credentials/", headers=headers).json()}
+    assert passwords["user1@example.com"] == "Segreta!1"
+
+DAMAGES = {
+    "troncato": lambda content: content[:-5],
+    "alterato": lambda content: content[:-1] + bytes([content[-1] ^ 1]),
+}
+
+@pytest.mark.parametrize("damage", DAMAGES.values(), ids=DAMAGES.keys())
+def test_damaged_archive_rejected(client, headers, damage):
+    response = _restore(client, headers, damage(_multi_frame_archive(3)))
+    assert response.status_code == 400
+    assert client.get("/credentials/", headers=headers).json() == []
+
+@pytest.mark.parametrize("damage", DAMAGES.values(), ids=DAMAGES.keys())
+def test_damaged_archive_commits_no_chunk(client, token, damage):
+    db = database1.SessionLocal()
+    try:
+        key = vault1.unlock(db, MASTER_PASSWORD)
+        rows = importer1.parse_backup(io.BytesIO(damage(_multi_frame_archive(3))), PASSPHRASE)
+        # Un commit per riga: senza la verifica iniziale le prime due resterebbero salvate
+        with pytest.raises(ValueError):
+            importer1.import_credentials(db, rows, key, chunk_size=1)
+        assert db.query(database1.Credential).count() == 0
+    finally:
+        db.close()
@@ -0,0 +1,116 @@
+"""/changes/: paginazione per revisione, eliminazioni e limit=0"""
+import pytest
+from cryptography.fernet import Fernet
+import database1
+import security1
+import vault1
+from conftest import MASTER_PASSWORD
+
+@pytest.fixture
+def headers(token) -> dict:
+    return {"session-token": token}
+
+def _create(client, headers, count: int) -> list[int]:
+    ids = []
+    for i in range(count):
+        response = client.post("/credentials/", headers=headers, json={
+            "app_name": f"app{i % 2}", "username": f"user{i}@example.com", "created_by": "Test",
+            "password": f"Segreta!{i}"
+        })
+        ids.append(response.json()["id"])
+    return ids
+
+def test_full_sync_then_incremental(client, headers):
+    ids = _create(client, headers, 3)
+    full = client.get("/changes/", headers=headers).json()
+    assert full["full"] is True and full["more"] is False
+    assert [item["id"] for item in full["upserted"]] == ids
+    assert full["upserted"][0]["encrypted_password"] == "Segreta!0"
+
+    client.put(f"/credentials/{ids[0]}", headers=headers, json={"password": "Nuova!2024"})
+    client.delete(f"/credentials/{ids[1]}", headers=headers)
+    delta = client.get("/changes/", params={"since": full["revision"]}, headers=headers).json()
+    assert delta["full"] is False
+    assert [item["id"] for item in delta["upserted"]] == [ids[0]]
+    assert delta["upserted"][0]["encrypted_password"] == "Nuova!2024"
+    assert delta["deleted"] == [ids[1]]
+
+    unchanged = client.get("/changes/", params={"since": delta["revision"]}, headers=headers).json()
+    assert unchanged["revision"] == delta["revision"]
+    assert unchanged["upserted"] == [] and unchanged["deleted"] == []
+
+def test_paging_follows_revision(client, headers):
+    ids = _create(client, headers, 5)
+    seen, since, pages = [], 0, 0
+    while True:
+        page = client.get("/changes/", params={"since": since, "limit": 2}, headers=headers).json()
+        assert len(page["upserted"]) <= 2
+        seen += [item["id"] for item in page["upserted"]]
+        since = page["revision"]
+        pages += 1
+        if not page["more"]:
+            break
+    assert seen == ids
+    assert pages == 3
+
+def test_limit_zero_returns_only_revision(client, headers):
+    _create(client, headers, 3)
+    current = client.get("/changes/", params={"limit": 0}, headers=headers).json()
+    assert current["upserted"] == [] and current["deleted"] == []
+    assert current["more"] is True
+    assert current["revision"] == 3
+
+    after = client.get("/changes/", params={"since": 3, "limit": 0}, headers=headers).json()
+    assert after == {"revision": 3, "full": False, "more": False, "upserted": [], "deleted": []}
+
+def test_limit_zero_reports_pending_deletions(client, headers):
+    ids = _create(client, headers, 2)
+    client.delete(f"/credentials/{ids[0]}", headers=headers)
+    pending = client.get("/changes/", params={"since": 2, "limit": 0}, headers=headers).json()
+    assert pending["more"] is True and pending["deleted"] == []
+
+def test_changes_requires_session(client, token):
+    assert client.get("/changes/").status_code == 422
+    assert client.get("/changes/", headers={"session-token": "inventato"}).status_code == 401
+
+def test_format_upgrade_on_read_keeps_revision(client, headers):
+    credential_id = _create(client, headers, 1)[0]
+    db = database1.SessionLocal()
+    try:
+        key = vault1.unlock(db, MASTER_PASSWORD)
+        # Record nel formato Fernet delle versioni precedenti: la modifica conta
+        db.get(database1.Credential, credential_id).encrypted_password = Fernet(key).encrypt(b"Vecchia!2020")
+        db.commit()
+    finally:
+        db.close()
+    before = client.get("/changes/", params={"limit": 0}, headers=headers).json()["revision"]
+    assert before == 2
+
+    # La lettura lo riscrive nel formato attuale senza cambiare la revisione
+    secret = client.get(f"/credentials/{credential_id}/secret", headers=headers).json()
+    assert secret["password"] == "Vecchia!2020"
+    db = database1.SessionLocal()
+    try:
+        assert not security1.needs_upgrade(db.get(database1.Credential, credential_id).encrypted_password)
+    finally:
+        db.close()
+    after = client.get("/changes/", params={"since": before}, headers=headers).json()
+    assert after["revision"] == before and after["upserted"] == []
+
+def test_create_conflicting_row_deleted_concurrently(client, headers):
+    from sqlalchemy import event
+    _create(client, headers, 1)
+
+    # Simula una DELETE di un'altra richiesta tra l'INSERT andato in conflitto e la SELECT
+    def delete_before_lookup(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("SELECT") and "credentials.app_key = ?" in statement:
+            conn.connection.dbapi_connection.execute("DELETE FROM credentials")
+
+    event.listen(database1.engine, "before_cursor_execute", delete_before_lookup)
+    try:
+        response = client.post("/credentials/", headers=headers, json={
+            "app_name": "app0", "username": "user0@example.com", "created_by": "Test"
+        })
+    finally:
+        event.remove(database1.engine, "before_cursor_execute", delete_before_lookup)
+    assert response.status_code == 409
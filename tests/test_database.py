@@ -0,0 +1,63 @@
+"""Migrazione dello schema dei database creati dalle versioni precedenti"""
+import logging
+import pytest
+import database1
+
+def _unique_index_exists() -> bool:
+    with database1.engine.connect() as conn:
+        return conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE name = 'ux_credentials_app_key_username'"
+        ).first() is not None
+
+def test_duplicates_renamed_so_unique_index_is_created(client, token, caplog):
+    with database1.engine.begin() as conn:
+        conn.exec_driver_sql("DROP INDEX ux_credentials_app_key_username")
+        conn.exec_driver_sql(
+            "INSERT INTO credentials (app_name, app_key, username, created_by, encrypted_password, revision) "
+            "VALUES ('Github', 'github', 'user', 'Test', x'00', 0), ('GitHub', 'github', 'user', 'Test', x'00', 0)"
+        )
+    with caplog.at_level(logging.WARNING, logger="database1"):
+        database1.migrate_schema()
+    assert "rinominate" in caplog.text
+    assert _unique_index_exists()
+    with database1.engine.connect() as conn:
+        usernames = conn.exec_driver_sql("SELECT id, username FROM credentials ORDER BY id").all()
+    first, second = usernames
+    assert first.username == "user"
+    assert second.username == f"user (duplicato {second.id})"
+
+    # Con l'indice gli inserimenti (ON CONFLICT) funzionano di nuovo
+    headers = {"session-token": token}
+    created = client.post("/credentials/", headers=headers, json={
+        "app_name": "Gitlab", "username": "user", "created_by": "Test", "password": "Segreta!1"
+    })
+    assert created.status_code == 200 and created.json()["message"] == "created"
+    duplicate = client.post("/credentials/", headers=headers, json={
+        "app_name": "github", "username": "user", "created_by": "Test", "password": "Segreta!1"
+    })
+    assert duplicate.json() == {
+        "message": "exists", "existing_id": first.id, "app_name": "Github", "username": "user", "created_by": "Test"
+    }
+
+def _pragmas(db_engine) -> tuple:
+    with db_engine.connect() as conn:
+        return tuple(conn.exec_driver_sql(f"PRAGMA {name}").scalar() for name in ("cache_size", "synchronous"))
+
+def test_storage_profile_saved_in_config(client):
+    default = database1.create_db_engine(database1.DATABASE_URL, None)
+    assert _pragmas(default) == (-16000, 1)
+    default.dispose()
+
+    database1.save_storage_profile("performance")
+    # Il profilo salvato vale per gli engine creati dopo (prossimo avvio)
+    saved = database1.create_db_engine(database1.DATABASE_URL, None)
+    assert _pragmas(saved) == (-64000, 1)
+    # Un profilo esplicito (PASSWORD_MANAGER_DB_PROFILE) ha la precedenza
+    explicit = database1.create_db_engine(database1.DATABASE_URL, "safe")
+    assert _pragmas(explicit) == (-16000, 2)
+    saved.dispose()
+    explicit.dispose()
+
+def test_unknown_storage_profile_rejected(client):
+    with pytest.raises(ValueError):
+        database1.save_storage_profile("turbo")
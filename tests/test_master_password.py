@@ -0,0 +1,104 @@
+"""Cambio della master password: la chiave dei dati viene solo riavvolta"""
+import pytest
+from cryptography.fernet import Fernet, InvalidToken
+import database1
+import main1
+import security1
+import vault1
+from conftest import MASTER_PASSWORD, TEST_KDF
+
+NEW_PASSWORD = "Nuova!2025"
+
+def _snapshot() -> tuple:
+    db = database1.SessionLocal()
+    try:
+        rows = {item.id: item.encrypted_password for item in db.query(database1.Credential)}
+        return rows, db.get(database1.Config, vault1.DATA_KEY_KEY).value
+    finally:
+        db.close()
+
+def _change(client, token: str, current: str = MASTER_PASSWORD):
+    return client.post("/master-password/", headers={"session-token": token},
+                       json={"current_password": current, "master_password": NEW_PASSWORD})
+
+def test_change_rewraps_data_key(client, token):
+    headers = {"session-token": token}
+    client.post("/credentials/", headers=headers, json={
+        "app_name": "Github", "username": "user@example.com", "created_by": "Test", "password": "Segreta!1"
+    })
+    rows_before, wrapped_before = _snapshot()
+
+    response = _change(client, token)
+    assert response.status_code == 200
+    rows_after, wrapped_after = _snapshot()
+    # Le righe restano identiche, cambia solo la chiave avvolta
+    assert rows_after == rows_before
+    assert wrapped_after != wrapped_before
+
+    # Le sessioni precedenti sono chiuse, quella nuova legge le credenziali
+    assert client.get("/apps/", headers=headers).status_code == 401
+    fresh = {"session-token": response.json()["session_token"]}
+    assert client.get("/credentials/", headers=fresh).json()[0]["encrypted_password"] == "Segreta!1"
+
+    assert client.post("/login/", json={"master_password": MASTER_PASSWORD}).status_code == 401
+    login = client.post("/login/", json={"master_password": NEW_PASSWORD})
+    assert login.status_code == 200
+    relogged = {"session-token": login.json()["session_token"]}
+    assert client.get("/credentials/", headers=relogged).json()[0]["encrypted_password"] == "Segreta!1"
+
+def test_wrong_current_password_changes_nothing(client, token):
+    _, wrapped_before = _snapshot()
+    assert _change(client, token, current="Sbagliata!2024").status_code == 401
+    assert _snapshot()[1] == wrapped_before
+    assert client.get("/apps/", headers={"session-token": token}).status_code == 200
+
+def test_evicted_key_requires_new_login(client, token):
+    _, wrapped_before = _snapshot()
+    # Chiave espulsa dal key vault (LRU o inattività) con la sessione ancora valida
+    main1.keyvault.wipe_all()
+    assert _change(client, token).status_code == 401
+    assert _snapshot()[1] == wrapped_before
+    assert client.post("/login/", json={"master_password": MASTER_PASSWORD}).status_code == 200
+
+def _legacy_vault() -> int:
+    """Vault di una versione precedente: chiave dei dati derivata da password ed encryption_salt"""
+    db = database1.SessionLocal()
+    try:
+        db.add(database1.MasterPassword(
+            password_hash=security1.hash_master_password(MASTER_PASSWORD, TEST_KDF), is_initialized=True
+        ))
+        legacy_key = security1.derive_key(MASTER_PASSWORD, vault1.get_salt(db))
+        credential = database1.Credential(
+            app_name="Github", app_key=database1.make_app_key("Github"), username="user@example.com",
+            created_by="Test", encrypted_password=Fernet(legacy_key).encrypt(b"Segreta!1")
+        )
+        db.add(credential)
+        db.commit()
+        return credential.id
+    finally:
+        db.close()
+
+def test_change_on_legacy_vault_retires_password_derived_key(client):
+    _legacy_vault()
+    token = client.post("/login/", json={"master_password": MASTER_PASSWORD}).json()["session_token"]
+    response = _change(client, token)
+    assert response.status_code == 200
+
+    # Con la vecchia password e il file del database non si decripta più nulla
+    db = database1.SessionLocal()
+    try:
+        old_key = security1.derive_key(MASTER_PASSWORD, vault1.get_salt(db))
+        tokens = [item.encrypted_password for item in db.query(database1.Credential)]
+        assert db.get(database1.Config, vault1.LEGACY_DATA_KEY_KEY) is None
+    finally:
+        db.close()
+    assert tokens
+    for stored in tokens:
+        with pytest.raises(InvalidToken):
+            security1.decrypt_password(stored, old_key)
+
+    fresh = {"session-token": response.json()["session_token"]}
+    assert client.get("/credentials/", headers=fresh).json()[0]["encrypted_password"] == "Segreta!1"
+    login = client.post("/login/", json={"master_password": NEW_PASSWORD})
+    relogged = {"session-token": login.json()["session_token"]}
+    assert client.get("/credentials/", headers=relogged).json()[0]["encrypted_password"] == "Segreta!1"
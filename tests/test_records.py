@@ -0,0 +1,61 @@
+"""Formato dei record: AEAD versionato e lettura dei record Fernet delle versioni precedenti"""
+import pytest
+from cryptography.fernet import Fernet, InvalidToken
+import database1
+import security1
+import vault1
+from conftest import MASTER_PASSWORD
+
+@pytest.fixture
+def key() -> bytes:
+    return Fernet.generate_key()
+
+@pytest.mark.parametrize("version", [security1.RECORD_AES_GCM, security1.RECORD_CHACHA20])
+def test_aead_round_trip(key, version):
+    cipher = security1.RecordCipher((key,), version)
+    token = cipher.encrypt("Segreta!2024".encode())
+    assert token[0] == version
+    assert cipher.decrypt(token).decode() == "Segreta!2024"
+    # Ogni cifrario legge tutti i formati, qualunque sia quello in cui scrive
+    assert security1.make_cipher(key).decrypt(token).decode() == "Segreta!2024"
+
+def test_tampered_or_foreign_record_rejected(key):
+    token = security1.encrypt_password("Segreta!2024", key)
+    with pytest.raises(InvalidToken):
+        security1.decrypt_password(token[:-1] + bytes([token[-1] ^ 1]), key)
+    with pytest.raises(InvalidToken):
+        security1.decrypt_password(token, Fernet.generate_key())
+
+def test_fernet_fallback(key):
+    legacy = Fernet(key).encrypt(b"Vecchia!2020")
+    assert security1.needs_upgrade(legacy)
+    assert security1.decrypt_password(legacy, key) == "Vecchia!2020"
+    assert security1.decrypt_passwords([legacy, security1.encrypt_password("Nuova!2024", key)], key) == [
+        "Vecchia!2020", "Nuova!2024"
+    ]
+    assert not security1.needs_upgrade(security1.encrypt_password("Nuova!2024", key))
+
+def test_api_reads_and_upgrades_fernet_records(client, token):
+    headers = {"session-token": token}
+    credential_id = client.post("/credentials/", headers=headers, json={
+        "app_name": "Github", "username": "user@example.com", "created_by": "Test", "password": "Nuova!2024"
+    }).json()["id"]
+    db = database1.SessionLocal()
+    try:
+        stored = db.get(database1.Credential, credential_id).encrypted_password
+        assert stored[0] == security1.RECORD_FORMAT
+        data_key = vault1.unlock(db, MASTER_PASSWORD)
+        db.get(database1.Credential, credential_id).encrypted_password = Fernet(data_key).encrypt(b"Vecchia!2020")
+        db.commit()
+    finally:
+        db.close()
+
+    listed = client.get("/credentials/", headers=headers).json()
+    assert listed[0]["encrypted_password"] == "Vecchia!2020"
+    db = database1.SessionLocal()
+    try:
+        upgraded = db.get(database1.Credential, credential_id).encrypted_password
+    finally:
+        db.close()
+    assert not security1.needs_upgrade(upgraded)
+    assert security1.decrypt_password(upgraded, data_key) == "Vecchia!2020"
@@ -0,0 +1,95 @@
+"""Token di sessione: emissione al login, scadenza per inattività e revoca"""
+import time
+import main1
+from conftest import MASTER_PASSWORD
+
+def test_login_issues_token(client, token):
+    response = client.get("/apps/", headers={"session-token": token})
+    assert response.status_code == 200
+    assert len(main1.sessions) == 1
+    assert main1.keyvault.stats()["size"] == 1
+
+def test_wrong_password_rejected(client, token):
+    response = client.post("/login/", json={"master_password": "Sbagliata!2024"})
+    assert response.status_code == 401
+
+def test_unknown_token_rejected(client, token):
+    assert client.get("/apps/", headers={"session-token": "inventato"}).status_code == 401
+
+def test_logout_revokes_token_and_wipes_key(client, token):
+    assert client.post("/logout/", headers={"session-token": token}).status_code == 200
+    assert client.get("/apps/", headers={"session-token": token}).status_code == 401
+    assert client.post("/logout/", headers={"session-token": token}).status_code == 401
+    assert main1.keyvault.stats()["size"] == 0
+
+def test_idle_session_expires(client, token, monkeypatch):
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + main1.sessions.idle_timeout + 1)
+    assert client.get("/apps/", headers={"session-token": token}).status_code == 401
+    assert main1.keyvault.stats()["size"] == 0
+
+def test_activity_renews_idle_timeout(client, token, monkeypatch):
+    now = time.monotonic()
+    step = main1.sessions.idle_timeout * 0.75
+    for i in range(1, 4):
+        monkeypatch.setattr(time, "monotonic", lambda i=i: now + step * i)
+        assert client.get("/apps/", headers={"session-token": token}).status_code == 200
+
+def test_login_again_after_expiry(client, token, monkeypatch):
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + main1.sessions.ttl + 1)
+    assert client.get("/apps/", headers={"session-token": token}).status_code == 401
+    monkeypatch.undo()
+    fresh = client.post("/login/", json={"master_password": MASTER_PASSWORD}).json()["session_token"]
+    assert client.get("/apps/", headers={"session-token": fresh}).status_code == 200
+
+def test_sweep_closes_idle_session_without_requests(client, token, monkeypatch):
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + main1.sessions.idle_timeout + 1)
+    main1.sweeper.run_once()
+    assert len(main1.sessions) == 0
+    assert main1.keyvault.stats()["size"] == 0
+
+def test_unused_key_expires_with_idle_timeout(monkeypatch):
+    import keyvault1
+    vault = keyvault1.KeyVault(ttl=60)
+    vault.put("s1", b"k" * 32)
+    vault.put("s2", b"k" * 32)
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 45)
+    assert vault.get("s1") == b"k" * 32
+    # s1 è stata usata a 45 s: la sua scadenza si è spostata, quella di s2 no
+    monkeypatch.setattr(time, "monotonic", lambda: now + 90)
+    assert vault.purge_expired() == 1
+    assert vault.get("s1") == b"k" * 32
+    assert vault.get("s2") is None
+
+def test_login_costs_one_derivation(client, token):
+    before = main1.kdf_pool.stats()["derivations"]
+    assert client.post("/login/", json={"master_password": MASTER_PASSWORD}).status_code == 200
+    assert client.post("/login/", json={"master_password": "Sbagliata!2024"}).status_code == 401
+    assert main1.kdf_pool.stats()["derivations"] - before == 2
+
+def test_async_shared_sessions_run_off_event_loop(client, monkeypatch):
+    import asyncio
+    import threading
+    import main_async1
+    import sessions1
+    store = sessions1.SharedSessionStore(bytes(32), on_close=main1.keyvault.wipe)
+    monkeypatch.setattr(main1, "sessions", store)
+    monkeypatch.setattr(main_async1, "sessions", store)
+    threads = []
+    for name in ("create", "get", "load_key", "revoke"):
+        method = getattr(store, name)
+        monkeypatch.setattr(store, name, lambda *args, method=method: threads.append(threading.get_ident()) or method(*args))
+
+    async def scenario():
+        token = await main_async1._session_call(main1.open_session, b"k" * 32)
+        session = await main_async1.require_session(token)
+        main1.keyvault.wipe(session.session_id)
+        assert await main_async1.require_key(session) == b"k" * 32
+        await main_async1.logout(token)
+
+    asyncio.run(scenario())
+    assert len(threads) == 4
+    assert threading.get_ident() not in threads
@@ -0,0 +1,144 @@
+"""Sblocco del vault con crittografia a busta (envelope encryption)
+
+Le credenziali sono cifrate con una chiave dei dati casuale. In Config è salvata
+solo avvolta (cifrata) da una chiave derivata dalla master password con un salt
+dedicato ("kek_salt"). Lo sblocco costa quindi una derivazione più un unwrap.
+Cambiare la master password significa riavvolgere 32 byte, senza toccare le righe.
+
+Hash della master password e chiave avvolta registrano la KDF con cui sono stati
+creati (kdf1). Se la KDF scelta per il vault cambia (kdf1 --save), al primo login
+riuscito entrambi vengono rigenerati con i nuovi parametri.
+
+I vault creati da versioni precedenti usano come chiave dei dati quella derivata
+dalla master password con "encryption_salt". Al primo sblocco la chiave viene
+avvolta e da lì in poi vale lo stesso schema, ma resta ricavabile dalla vecchia
+password ("legacy_data_key" in Config): il cambio di master password esegue
+prima una rotazione (rotation1), che la sostituisce con una chiave casuale.
+"""
+import os
+from typing import Optional, Tuple
+from cryptography.fernet import Fernet, InvalidToken
+from sqlalchemy.orm import Session
+import database1
+import kdf1
+import rotation1
+import security1
+
+KEK_SALT_KEY = "kek_salt"
+KEK_KDF_KEY = "kek_kdf"
+DATA_KEY_KEY = "wrapped_data_key"
+# Presente finché la chiave dei dati è quella derivata dalla password (vault di versioni precedenti)
+LEGACY_DATA_KEY_KEY = "legacy_data_key"
+
+def _get_config(db: Session, key: str) -> Optional[bytes]:
+    row = db.get(database1.Config, key)
+    return row.value if row else None
+
+def _set_config(db: Session, key: str, value: bytes):
+    row = db.get(database1.Config, key)
+    if row:
+        row.value = value
+    else:
+        db.add(database1.Config(key=key, value=value))
+
+def get_salt(db: Session) -> bytes:
+    """Restituisce il salt di crittografia (creato al primo avvio da main1)"""
+    salt = _get_config(db, "encryption_salt")
+    if salt is None:
+        raise RuntimeError("Salt di crittografia non inizializzato")
+    return salt
+
+def kdf_policy(db: Session) -> kdf1.Kdf:
+    """KDF da usare per i nuovi hash e le nuove chiavi avvolte di questo vault"""
+    spec = _get_config(db, kdf1.POLICY_KEY)
+    return kdf1.parse(spec.decode()) if spec else kdf1.DEFAULT
+
+def wrap_data_key(master_password: str, data_key: bytes, kdf: kdf1.Kdf) -> Tuple[bytes, bytes]:
+    """Avvolge la chiave dei dati con una chiave derivata dalla password (nuovo salt)"""
+    kek_salt = os.urandom(16)
+    kek = security1.derive_key(master_password, kek_salt, kdf)
+    return kek_salt, Fernet(kek).encrypt(data_key)
+
+def store_data_key(db: Session, kek_salt: bytes, wrapped_key: bytes, kdf: kdf1.Kdf):
+    """Salva la chiave avvolta (il commit è a carico del chiamante)"""
+    _set_config(db, KEK_SALT_KEY, kek_salt)
+    _set_config(db, KEK_KDF_KEY, kdf.spec().encode())
+    _set_config(db, DATA_KEY_KEY, wrapped_key)
+
+def _rewrap(db: Session, master_password: str, data_key: bytes, kdf: kdf1.Kdf):
+    kek_salt, wrapped_key = wrap_data_key(master_password, data_key, kdf)
+    store_data_key(db, kek_salt, wrapped_key, kdf)
+
+def create_data_key(db: Session, master_password: str) -> bytes:
+    """Genera la chiave dei dati di un vault nuovo e la salva avvolta"""
+    data_key = Fernet.generate_key()
+    _rewrap(db, master_password, data_key, kdf_policy(db))
+    return data_key
+
+def _kek_kdf(db: Session) -> kdf1.Kdf:
+    spec = _get_config(db, KEK_KDF_KEY)
+    return kdf1.parse(spec.decode()) if spec else kdf1.LEGACY
+
+def _unwrap_data_key(db: Session, master_password: str) -> Optional[bytes]:
+    """Chiave dei dati in chiaro; InvalidToken se la password è errata"""
+    kek = security1.derive_key(master_password, _get_config(db, KEK_SALT_KEY), _kek_kdf(db))
+    return Fernet(kek).decrypt(_get_config(db, DATA_KEY_KEY))
+
+def unlock(db: Session, master_password: str) -> Optional[security1.VaultKey]:
+    """Verifica la master password e restituisce la chiave dei dati (None se errata).
+
+    Una sola derivazione: la chiave avvolta è autenticata (Fernet), quindi riuscire
+    ad aprirla verifica anche la password. L'hash in master_password serve solo
+    a /verify/ e ai vault di versioni precedenti, non ancora avvolti.
+    Durante una rotazione restituisce (chiave nuova, chiave vecchia).
+    """
+    master_pw = db.query(database1.MasterPassword).first()
+    if not master_pw:
+        raise RuntimeError("Master password non configurata")
+
+    policy = kdf_policy(db)
+    if _get_config(db, DATA_KEY_KEY) is not None:
+        try:
+            data_key = _unwrap_data_key(db, master_password)
+        except InvalidToken:
+            return None
+        if _kek_kdf(db) != policy:
+            _rewrap(db, master_password, data_key, policy)
+    else:
+        # Vault di una versione precedente: la chiave dei dati deriva dalla password
+        if not security1.verify_master_password(master_password, master_pw.password_hash):
+            return None
+        data_key = security1.derive_key(master_password, get_salt(db))
+        _rewrap(db, master_password, data_key, policy)
+        _set_config(db, LEGACY_DATA_KEY_KEY, b"1")
+    # Solo quando cambia la KDF del vault: costa una derivazione in più, una volta
+    if security1.needs_rehash(master_pw.password_hash, policy):
+        master_pw.password_hash = security1.hash_master_password(master_password, policy)
+    if db.dirty or db.new:
+        db.commit()
+    return rotation1.pending_keys(db, data_key) or data_key
+
+def change_master_password(db: Session, current_password: str, new_password: str) -> Optional[bytes]:
+    """Cambia la master password riavvolgendo la chiave dei dati e la restituisce (None se
+    quella attuale è errata).
+
+    Di norma nessuna credenziale viene ricrittografata. Nei vault di versioni precedenti
+    la chiave dei dati deriva dalla password attuale ed "encryption_salt": la vecchia
+    password la ricaverebbe ancora, quindi prima si esegue una rotazione completa e la
+    chiave restituita è quella nuova.
+    """
+    if rotation1.rotation_status(db) is not None:
+        raise rotation1.RotationError("Rotazione della chiave in corso, riprova al termine")
+    data_key = unlock(db, current_password)
+    if data_key is None:
+        return None
+    if _get_config(db, LEGACY_DATA_KEY_KEY):
+        keys = rotation1.start_rotation(db, current_password)
+        rotation1.run_rotation(db, keys)
+        data_key = keys[0]
+    master_pw = db.query(database1.MasterPassword).first()
+    policy = kdf_policy(db)
+    master_pw.password_hash = security1.hash_master_password(new_password, policy)
+    _rewrap(db, new_password, data_key, policy)
+    db.commit()
+    return data_key